@@ -0,0 +1,126 @@
+"""
+Cold start, resident memory and throughput of the embedding backends.
+
+Each backend runs in a fresh interpreter so import time and peak RSS are not
+shared between them. Backends whose packages are missing are reported and
+skipped.
+
+Usage:
+    uv run python benchmarks/bench_embedding_backends.py --texts 2000
+    uv run python benchmarks/bench_embedding_backends.py --backends onnx onnx-int8
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BACKENDS: dict[str, dict[str, str]] = {
+    "huggingface": {"MAO_EMBEDDING_BACKEND": "huggingface"},
+    "onnx": {"MAO_EMBEDDING_BACKEND": "onnx", "MAO_EMBEDDING_QUANTIZED": "false"},
+    "onnx-int8": {"MAO_EMBEDDING_BACKEND": "onnx", "MAO_EMBEDDING_QUANTIZED": "true"},
+}
+
+
+def _sample_texts(count: int) -> list[str]:
+    words = (
+        "agent",
+        "memory",
+        "vector",
+        "query",
+        "retrieval",
+        "tool",
+        "plan",
+        "answer",
+        "context",
+        "graph",
+    )
+    return [
+        " ".join(words[(i * 7 + j) % len(words)] for j in range(12 + i % 20))
+        for i in range(count)
+    ]
+
+
+def worker(model: str, texts: int, batch: int) -> None:
+    """Runs inside the child process; prints one JSON line of measurements."""
+    start = time.perf_counter()
+    from mao.embeddings import load_embeddings
+
+    embed = load_embeddings(model)
+    embed.embed_documents(["warm up"])
+    cold_start = time.perf_counter() - start
+
+    sample = _sample_texts(texts)
+    start = time.perf_counter()
+    for i in range(0, len(sample), batch):
+        embed.embed_documents(sample[i : i + batch])
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    print(
+        json.dumps(
+            {
+                "cold_start_s": cold_start,
+                "peak_rss_mb": rss_mb,
+                "embeddings_per_s": len(sample) / elapsed if elapsed else 0.0,
+            }
+        )
+    )
+
+
+def run(backends: list[str], model: str, texts: int, batch: int) -> None:
+    print(f"model {model}, {texts} texts in batches of {batch}")
+    for name in backends:
+        env = {**os.environ, **BACKENDS[name]}
+        proc = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--worker",
+                "--model",
+                model,
+                "--texts",
+                str(texts),
+                "--batch",
+                str(batch),
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if proc.returncode != 0:
+            reason = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+            print(f"{name:12s} skipped: {reason}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"{name:12s} cold start {result['cold_start_s']:6.2f}s  "
+            f"peak RSS {result['peak_rss_mb']:7.0f} MB  "
+            f"{result['embeddings_per_s']:8.0f} embeddings/s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backends", nargs="+", choices=sorted(BACKENDS), default=list(BACKENDS)
+    )
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.model, args.texts, args.batch)
+    else:
+        run(args.backends, args.model, args.texts, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Recall/latency benchmark: HNSW index vs. exact scan in VectorStoreBase.
+
+Usage:
+    uv run python benchmarks/bench_hnsw_search.py --rows 100000 --dim 384
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from mao.storage import VectorStoreBase
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns pre-generated vectors keyed by text so no model is needed."""
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.vectors[text]
+
+
+def _random_vector(rng: random.Random, dim: int) -> list[float]:
+    return [rng.gauss(0.0, 1.0) for _ in range(dim)]
+
+
+async def run(rows: int, dim: int, queries: int, k: int, seed: int) -> None:
+    rng = random.Random(seed)
+    vectors = {f"doc-{i}": _random_vector(rng, dim) for i in range(rows)}
+    query_vectors = [_random_vector(rng, dim) for _ in range(queries)]
+    embed = LookupEmbeddings(vectors)
+
+    async def provider() -> tuple[Embeddings, int]:
+        return embed, dim
+
+    store = await VectorStoreBase.create(
+        db_path=":memory:",
+        collection_name="bench_hnsw",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=provider,
+    )
+    await store.clear_all_points_async()
+    # Measure the DuckDB paths, not the in-memory matrix.
+    store.memory_index = False
+
+    start = time.perf_counter()
+    await store.add_entries_batch_async(list(vectors))
+    print(f"ingest: {rows} rows in {time.perf_counter() - start:.2f}s")
+
+    store.use_hnsw = True
+    store.hnsw_min_rows = 0
+    start = time.perf_counter()
+    with store._db.write() as conn:
+        store._maybe_build_hnsw_index(conn)
+    if not store._hnsw_ready:
+        print("vss extension unavailable; only the exact path can be measured")
+        return
+    print(f"index build: {time.perf_counter() - start:.2f}s")
+
+    exact_times: list[float] = []
+    hnsw_times: list[float] = []
+    recalls: list[float] = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        exact = store._search_rows(vector, k, use_index=False)
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        approx = store._search_rows(vector, k, use_index=True)
+        hnsw_times.append(time.perf_counter() - start)
+
+        expected = {row[0] for row in exact}
+        recalls.append(
+            len(expected & {row[0] for row in approx}) / max(1, len(expected))
+        )
+
+    def _ms(values: list[float]) -> str:
+        ordered = sorted(values)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return f"p50 {statistics.median(values) * 1000:.2f}ms p95 {p95 * 1000:.2f}ms"
+
+    print(f"exact: {_ms(exact_times)}")
+    print(f"hnsw:  {_ms(hnsw_times)}")
+    print(f"recall@{k}: {statistics.mean(recalls):.3f}")
+
+    store.conn.execute(f"DROP TABLE {store.collection_name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.dim, args.queries, args.k, args.seed))
+
+
+if __name__ == "__main__":
+    main()
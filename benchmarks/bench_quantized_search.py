@@ -0,0 +1,102 @@
+"""
+Recall/latency benchmark: binary-quantized first pass with exact re-rank vs. exact scan.
+
+Queries are noisy copies of stored vectors, so near neighbours exist as they
+would for real embeddings.
+
+Usage:
+    uv run python benchmarks/bench_quantized_search.py --rows 100000 --dim 384
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from bench_hnsw_search import LookupEmbeddings, _random_vector
+from langchain_core.embeddings import Embeddings
+
+from mao.storage import VectorStoreBase
+
+
+async def run(
+    rows: int, dim: int, queries: int, k: int, rerank_factor: int, seed: int
+) -> None:
+    rng = random.Random(seed)
+    vectors = {f"doc-{i}": _random_vector(rng, dim) for i in range(rows)}
+    query_vectors = [
+        [v + rng.gauss(0.0, 0.5) for v in vectors[f"doc-{rng.randrange(rows)}"]]
+        for _ in range(queries)
+    ]
+    embed = LookupEmbeddings(vectors)
+
+    async def provider() -> tuple[Embeddings, int]:
+        return embed, dim
+
+    store = await VectorStoreBase.create(
+        db_path=":memory:",
+        collection_name="bench_quantized",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=provider,
+    )
+    await store.clear_all_points_async()
+    # Measure the DuckDB paths, not the in-memory matrix.
+    store.memory_index = False
+    await store.add_entries_batch_async(list(vectors))
+
+    store.quantization = "binary"
+    store.rerank_factor = rerank_factor
+    start = time.perf_counter()
+    with store._db.write() as conn:
+        store._ensure_sign_bits(conn)
+    print(f"quantize: {rows} rows in {time.perf_counter() - start:.2f}s")
+
+    exact_times: list[float] = []
+    quantized_times: list[float] = []
+    recalls: list[float] = []
+    for vector in query_vectors:
+        store.quantization = ""
+        start = time.perf_counter()
+        exact = store._search_rows(vector, k)
+        exact_times.append(time.perf_counter() - start)
+
+        store.quantization = "binary"
+        start = time.perf_counter()
+        approx = store._search_rows(vector, k)
+        quantized_times.append(time.perf_counter() - start)
+
+        expected = {row[0] for row in exact}
+        recalls.append(
+            len(expected & {row[0] for row in approx}) / max(1, len(expected))
+        )
+
+    def _ms(values: list[float]) -> str:
+        ordered = sorted(values)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return f"p50 {statistics.median(values) * 1000:.2f}ms p95 {p95 * 1000:.2f}ms"
+
+    print(f"exact:  {_ms(exact_times)}")
+    print(f"binary: {_ms(quantized_times)} (rerank x{rerank_factor})")
+    print(f"recall@{k}: {statistics.mean(recalls):.3f}")
+    print(f"vector bytes/row: float {4 * dim}, binary {(dim + 7) // 8}")
+
+    store.conn.execute(f"DROP TABLE {store.collection_name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(
+        run(args.rows, args.dim, args.queries, args.k, args.rerank_factor, args.seed)
+    )
+
+
+if __name__ == "__main__":
+    main()
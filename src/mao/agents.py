@@ -1,5 +1,6 @@
 """Agent classes with Agent, Supervisor, and create_agent factory."""
 
+import asyncio
 import logging
 import os
 import json
@@ -31,7 +32,7 @@ from tenacity import (
 
 from mao.mcp import MCPClient
 from mao.checkpoint import get_checkpointer
-from mao.storage import ExperienceTree, KnowledgeTree
+from mao.storage import ExperienceTree, KnowledgeTree, search_collections_async
 
 load_dotenv()
 
@@ -193,6 +194,18 @@ def _ensure_str(val: Any) -> str:
     return str(val)
 
 
+def _format_hits(hits: list[Any]) -> str:
+    """One line per hit, with its related entries indented below it."""
+    lines: list[str] = []
+    for hit in hits:
+        lines.append(hit["page_content"])
+        lines.extend(
+            f"  ({neighbor['type']}) {neighbor['page_content']}"
+            for neighbor in hit.get("neighbors", [])
+        )
+    return "\n".join(lines)
+
+
 def _dict_to_tool(d: dict[str, Any]) -> BaseTool:
     from pydantic import Field, create_model
 
@@ -251,14 +264,23 @@ class Agent:
         tools: MCPClient | list[dict[str, Any]] | None = None,
         system_prompt: str | None = None,
         stream: bool = False,
+        use_knowledge: bool = True,
+        use_experience: bool = True,
+        mmr_retrieval: bool | None = None,
     ):
         self.llm = llm_instance
         self.name = agent_name
         self.configured_tools = tools
         self.loaded_tools: list[Any] = []
         self.system_prompt = system_prompt or "You are a helpful assistant."
+        self.use_knowledge = use_knowledge
+        self.use_experience = use_experience
+        # Diverse (MMR) retrieval for this agent's trees; None keeps VECTOR_MMR.
+        self.mmr_retrieval = mmr_retrieval
+        # Created on first retrieve or learn; see _get_knowledge_tree.
         self.knowledge_tree: KnowledgeTree | None = None
         self.experience_tree: ExperienceTree | None = None
+        self._trees_lock = asyncio.Lock()
         self.memory = get_checkpointer()
         self.stream = stream
         self.agent_runnable = None
@@ -266,22 +288,57 @@ class Agent:
     async def _load_mcp_tools(self) -> list[dict[str, Any]]:
         return await load_mcp_tools(self.configured_tools)
 
+    @property
+    def _collection_suffix(self) -> str:
+        return self.name.replace("-", "_").replace(" ", "_")
+
+    async def _get_knowledge_tree(self) -> KnowledgeTree | None:
+        """Return the knowledge tree, creating it on first use; None if opted out."""
+        if not self.use_knowledge:
+            return None
+        if self.knowledge_tree is None:
+            async with self._trees_lock:
+                if self.knowledge_tree is None:
+                    tree = await KnowledgeTree.create(
+                        collection_name=f"knowledge_{self._collection_suffix}"
+                    )
+                    self.knowledge_tree = self._configure_tree(tree)
+        return self.knowledge_tree
+
+    async def _get_experience_tree(self) -> ExperienceTree | None:
+        """Return the experience tree, creating it on first use; None if opted out."""
+        if not self.use_experience:
+            return None
+        if self.experience_tree is None:
+            async with self._trees_lock:
+                if self.experience_tree is None:
+                    tree = await ExperienceTree.create(
+                        collection_name=f"experience_{self._collection_suffix}"
+                    )
+                    self.experience_tree = self._configure_tree(tree)
+        return self.experience_tree
+
+    def _configure_tree(self, tree: Any) -> Any:
+        if self.mmr_retrieval is not None:
+            tree.mmr = self.mmr_retrieval
+        return tree
+
     async def _retrieve_context(self, query: str, k: int = 3) -> str:
-        context_parts = []
-        if self.knowledge_tree:
-            knowledge_hits = await self.knowledge_tree.search_async(query, k=k)
-            if knowledge_hits:
-                context_parts.append(
-                    "\nRelevant Knowledge:\n"
-                    + "\n".join([h["page_content"] for h in knowledge_hits])
-                )
+        sections = [
+            ("Relevant Knowledge", await self._get_knowledge_tree()),
+            ("Relevant Experience", await self._get_experience_tree()),
+        ]
+        stores = [tree for _, tree in sections if tree]
+        hits = await search_collections_async(stores, query, k=k)
 
-        if self.experience_tree:
-            experience_hits = await self.experience_tree.search_async(query, k=k)
-            if experience_hits:
+        context_parts = []
+        for title, tree in sections:
+            if not tree:
+                continue
+            tree_hits = [h for h in hits if h["collection"] == tree.collection_name]
+            if tree_hits:
                 context_parts.append(
-                    "\nRelevant Experience:\n"
-                    + "\n".join([h["page_content"] for h in experience_hits])
+                    f"\n{title}:\n" + "\n".join([h["page_content"] for h in tree_hits])
                 )
 
         return "".join(context_parts).strip()
@@ -289,27 +346,30 @@ class Agent:
     async def _learn_experience(
         self, user_input: str, model_output: Any, tags: list[str] | None = None
     ) -> None:
-        if not self.experience_tree:
+        experience_tree = await self._get_experience_tree()
+        if not experience_tree:
             return
 
         model_output_str = _ensure_str(model_output)
 
         knowledge_id = None
-        if self.knowledge_tree and user_input:
-            knowledge_hits = await self.knowledge_tree.search_async(user_input, k=1)
+        knowledge_tree = await self._get_knowledge_tree()
+        if knowledge_tree and user_input:
+            knowledge_hits = await knowledge_tree.search_async(user_input, k=1)
             if knowledge_hits:
                 knowledge_id = knowledge_hits[0].get("id")
 
         exp_text = f"User: {user_input}\nAgent: {model_output_str}"
 
-        await self.experience_tree.learn_from_experience_async(
+        await experience_tree.learn_from_experience_async(
             exp_text, related_knowledge_id=knowledge_id, tags=tags
         )
 
     def _build_rag_tools(self) -> list[BaseTool]:
         tools: list[BaseTool] = []
-        if self.knowledge_tree:
-            kt = self.knowledge_tree
+        get_kt = self._get_knowledge_tree
+        get_et = self._get_experience_tree
+        if self.use_knowledge:
 
             @tool
             async def retrieve_knowledge(query: str) -> str:
@@ -318,16 +378,15 @@ class Agent:
                 Args:
                     query: Search query to find relevant knowledge
                 """
-                hits = await kt.search_async(query, k=3)
+                kt = await get_kt()
+                hits = await kt.search_with_neighbors_async(query, k=3) if kt else []
                 if not hits:
                     return "No relevant knowledge found."
-                return "\n".join(h["page_content"] for h in hits)
+                return _format_hits(hits)
 
             tools.append(retrieve_knowledge)
 
-        if self.experience_tree:
-            et = self.experience_tree
-            kt = self.knowledge_tree
+        if self.use_experience:
 
             @tool
             async def retrieve_experience(query: str) -> str:
@@ -336,10 +395,11 @@ class Agent:
                 Args:
                     query: Search query to find relevant past experiences
                 """
-                hits = await et.search_async(query, k=3)
+                et = await get_et()
+                hits = await et.search_with_neighbors_async(query, k=3) if et else []
                 if not hits:
                     return "No relevant experience found."
-                return "\n".join(h["page_content"] for h in hits)
+                return _format_hits(hits)
 
             tools.append(retrieve_experience)
 
@@ -350,7 +410,11 @@ class Agent:
                 Args:
                     summary: Brief summary of the interaction outcome or lesson learned
                 """
+                et = await get_et()
+                if not et:
+                    return "Experience memory is disabled."
                 knowledge_id = None
+                kt = await get_kt()
                 if kt:
                     hits = await kt.search_async(summary, k=1)
                     if hits:
@@ -366,14 +430,6 @@ class Agent:
 
     async def init_agent(self):
         try:
-            safe_name = self.name.replace("-", "_").replace(" ", "_")
-            self.knowledge_tree = await KnowledgeTree.create(
-                collection_name=f"knowledge_{safe_name}"
-            )
-            self.experience_tree = await ExperienceTree.create(
-                collection_name=f"experience_{safe_name}"
-            )
-
             self.loaded_tools = await self._load_mcp_tools()
             rag_tools = self._build_rag_tools()
             self.loaded_tools.extend(rag_tools)
@@ -399,6 +455,11 @@ class Agent:
             logger.error("Failed to initialize agent '%s': %s", self.name, e, exc_info=True)
             raise
 
+    def close(self) -> None:
+        for tree in (self.knowledge_tree, self.experience_tree):
+            if tree is not None:
+                tree.close()
+
     def get_compiled_app(self):
         if not self.agent_runnable:
             raise RuntimeError("Agent not initialized. Call init_agent() first.")
@@ -568,7 +629,7 @@ class Supervisor:
         return await self.app.ainvoke({"messages": messages}, config=config_dict)
 
 
-async def create_agent(
+async def create_agent_instance(
     provider: str,
     model_name: str,
     agent_name: str | None = None,
@@ -576,7 +637,11 @@ async def create_agent(
     tools: MCPClient | list[dict[str, Any]] | None = None,
     temperature: float = 0.0,
     stream: bool = False,
-) -> Any:
+    use_knowledge: bool = True,
+    use_experience: bool = True,
+    mmr_retrieval: bool | None = None,
+) -> Agent:
+    """Build and initialize an ``Agent``; call ``close()`` when it is stopped."""
     if not agent_name:
         sanitized_model_name = model_name.replace(".", "_").replace("/", "_")
         agent_name = f"{provider}_{sanitized_model_name}_agent"
@@ -594,7 +659,37 @@ async def create_agent(
         tools=tools,
         system_prompt=system_prompt,
         stream=stream,
+        use_knowledge=use_knowledge,
+        use_experience=use_experience,
+        mmr_retrieval=mmr_retrieval,
     )
 
-    compiled_app = await agent_instance.init_agent()
-    return compiled_app
+    await agent_instance.init_agent()
+    return agent_instance
+
+
+async def create_agent(
+    provider: str,
+    model_name: str,
+    agent_name: str | None = None,
+    system_prompt: str | None = None,
+    tools: MCPClient | list[dict[str, Any]] | None = None,
+    temperature: float = 0.0,
+    stream: bool = False,
+    use_knowledge: bool = True,
+    use_experience: bool = True,
+    mmr_retrieval: bool | None = None,
+) -> Any:
+    agent_instance = await create_agent_instance(
+        provider=provider,
+        model_name=model_name,
+        agent_name=agent_name,
+        system_prompt=system_prompt,
+        tools=tools,
+        temperature=temperature,
+        stream=stream,
+        use_knowledge=use_knowledge,
+        use_experience=use_experience,
+        mmr_retrieval=mmr_retrieval,
+    )
+    return agent_instance.get_compiled_app()
@@ -10,7 +10,7 @@ from langgraph.types import Command
 
 from .api import active_agents, get_config_db
 from .db import ConfigDB
-from .helpers import create_and_start_agent, extract_response_text
+from .helpers import create_and_start_agent, extract_response_text, stop_active_agent
 from .models import (
     AgentCreate,
     AgentMessage,
@@ -111,8 +111,7 @@ async def delete_agent_by_id(
         raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
 
     # Stop running agent if active
-    if agent_id in active_agents:
-        active_agents.pop(agent_id, None)
+    stop_active_agent(active_agents, agent_id)
 
     await db.delete_agent(agent_id)
     return None
@@ -149,7 +148,7 @@ async def stop_agent(agent_id: str = Path(..., description="Agent ID")):
             status_code=404, detail=f"No running agent with ID {agent_id}"
         )
 
-    active_agents.pop(agent_id, None)
+    stop_active_agent(active_agents, agent_id)
     return {"status": "stopped", "agent_id": agent_id}
 
 
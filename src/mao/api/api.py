@@ -3,9 +3,11 @@ MCP Agents API Application.
 Provides a REST API for managing and interacting with MCP agents.
 """
 
+import asyncio
 import logging
 import os
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
 from fastapi import FastAPI, Request
@@ -13,7 +15,10 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from ..duckdb_pool import get_duckdb_pool
+from ..embeddings import get_embedding_registry, shutdown_embedding_pool
 from .db import ConfigDB
+from .helpers import stop_active_agent
 
 # Global state for active agents
 active_agents: dict[str, dict[str, Any]] = {}
@@ -65,6 +70,7 @@ class MCPAgentsAPI(FastAPI):
             db_path: Path to the DuckDB database file
             *args, **kwargs: Additional arguments for FastAPI
         """
+        kwargs.setdefault("lifespan", self._lifespan)
         super().__init__(
             title=title, description=description, version=version, *args, **kwargs
         )
@@ -83,6 +89,30 @@ class MCPAgentsAPI(FastAPI):
         # Add base endpoints
         self._add_base_endpoints()
 
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI) -> AsyncIterator[None]:
+        """Warm the shared embedding model in the background and clean up on exit"""
+        warm_task = None
+        if os.environ.get("MAO_WARM_EMBEDDINGS", "true").lower() in (
+            "1",
+            "true",
+            "yes",
+        ):
+            warm_task = asyncio.create_task(get_embedding_registry().acquire())
+        try:
+            yield
+        finally:
+            if warm_task is not None:
+                if not warm_task.done():
+                    warm_task.cancel()
+                elif warm_task.exception() is None:
+                    get_embedding_registry().release()
+                else:
+                    logging.warning(
+                        f"Embedding model warm-up failed: {warm_task.exception()}"
+                    )
+            await self.shutdown()
+
     def _setup_middleware(self):
         """Setup middleware for the API"""
         # CORS middleware
@@ -163,12 +193,14 @@ class MCPAgentsAPI(FastAPI):
         from .mcp import router as mcp_router
         from .storage import config_router, export_router
         from .teams import router as teams_router
+        from .vectors import router as vectors_router
 
         self.include_router(agents_router)
         self.include_router(mcp_router)
         self.include_router(teams_router)
         self.include_router(config_router)
         self.include_router(export_router)
+        self.include_router(vectors_router)
 
     def _add_base_endpoints(self):
         """Add basic information and health check endpoints"""
@@ -190,6 +222,7 @@ class MCPAgentsAPI(FastAPI):
                     "supervisors": "/teams/supervisors - Supervisor management",
                     "mcp": "/mcp - MCP server and tool management",
                     "config": "/config - Global configuration",
+                    "vectors": "/vectors - Vector storage maintenance and stats",
                     "import/export": "/export, /import - Configuration import/export",
                 },
                 "documentation": "/docs - Swagger UI documentation",
@@ -198,8 +231,13 @@ class MCPAgentsAPI(FastAPI):
 
     async def shutdown(self):
         """Shutdown the API and clean up resources"""
+        # Release the vector stores and embedding models of running agents
+        for agent_id in list(active_agents):
+            stop_active_agent(active_agents, agent_id)
         # Close all database connections
         await ConfigDB.cleanup()
+        shutdown_embedding_pool()
+        get_duckdb_pool().close_all()
 
 
 # Global instance for compatibility with old code
@@ -5,7 +5,7 @@ Helper functions for API endpoints to reduce code duplication.
 import logging
 from typing import Any
 
-from ..agents import create_agent
+from ..agents import create_agent_instance
 from ..mcp import MCPClient
 from .db import ConfigDB
 
@@ -84,13 +84,29 @@ async def create_and_start_agent(
     agent_tools = await db.get_agent_tools(agent_id, enabled_only=True)
     mcp_client = await _build_mcp_client_from_db(db, agent_tools) if agent_tools else None
 
-    agent_app = await create_agent(
+    agent = await create_agent_instance(
         provider=agent_config["provider"],
         model_name=agent_config["model_name"],
         agent_name=agent_config["name"],
         system_prompt=agent_config.get("system_prompt"),
         tools=mcp_client,
     )
+    agent_app = agent.get_compiled_app()
 
-    active_agents[agent_id] = {"agent": agent_app, "config": agent_config}
+    active_agents[agent_id] = {
+        "agent": agent_app,
+        "instance": agent,
+        "config": agent_config,
+    }
     return agent_app
+
+
+def stop_active_agent(active_agents: dict[str, dict[str, Any]], agent_id: str) -> bool:
+    """Remove a running agent and release its vector stores and embedding model."""
+    info = active_agents.pop(agent_id, None)
+    if info is None:
+        return False
+    instance = info.get("instance")
+    if instance is not None:
+        instance.close()
+    return True
@@ -318,3 +318,39 @@ class TeamResponseMessage(BaseModel):
             }
         }
     )
+
+
+class CompactionRequest(BaseModel):
+    similarity_threshold: float | None = Field(
+        None, ge=0.0, le=1.0, description="Cosine similarity at which rows are merged"
+    )
+    batch_size: int | None = Field(
+        None, ge=1, description="Rows compacted per transaction"
+    )
+    max_batches: int | None = Field(
+        None, ge=1, description="Stop after this many batches (None: until done)"
+    )
+    background: bool = Field(
+        False, description="Run after the response is sent instead of waiting"
+    )
+
+
+class SnapshotRequest(BaseModel):
+    path: str | None = Field(
+        None,
+        description=(
+            "Parquet file relative to VECTOR_SNAPSHOT_DIR "
+            "(default: <collection>.parquet)"
+        ),
+    )
+
+
+class ReembedRequest(BaseModel):
+    model: str = Field(..., description="Embedding model the collection moves to")
+    batch_size: int | None = Field(None, ge=1, description="Rows embedded per batch")
+    max_batches: int | None = Field(
+        None, ge=1, description="Pause after this many batches (None: until swapped)"
+    )
+    background: bool = Field(
+        True, description="Run after the response is sent instead of waiting"
+    )
@@ -11,7 +11,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.types import Command
 
-from ..agents import Supervisor, _build_invoke_config, create_agent
+from ..agents import Supervisor, _build_invoke_config, create_agent_instance
 from .api import active_agents, get_config_db
 from .db import ConfigDB
 from .helpers import create_and_start_agent, extract_response_text
@@ -82,14 +82,15 @@ async def _start_team_runtime(
                             detail=f"Supervisor agent {supervisor_agent_id} not found",
                         )
 
-                    supervisor_agent_app = await create_agent(
+                    supervisor_agent = await create_agent_instance(
                         provider=supervisor_agent_config["provider"],
                         model_name=supervisor_agent_config["model_name"],
                         agent_name=supervisor_agent_config["name"],
                         system_prompt=supervisor_agent_config.get("system_prompt"),
                     )
                     active_agents[supervisor_agent_id] = {
-                        "agent": supervisor_agent_app,
+                        "agent": supervisor_agent.get_compiled_app(),
+                        "instance": supervisor_agent,
                         "config": supervisor_agent_config,
                     }
 
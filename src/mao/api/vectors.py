@@ -0,0 +1,177 @@
+"""
+Vector storage API endpoints.
+"""
+
+import os
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+
+from ..embeddings import get_embedding_cache, get_embedding_registry
+from ..storage import (
+    EmbeddingMismatchError,
+    ExperienceTree,
+    VectorStoreBase,
+    VectorStoreError,
+    get_reembed_progress,
+)
+from .models import CompactionRequest, ReembedRequest, SnapshotRequest
+
+# Create router
+router = APIRouter(prefix="/vectors", tags=["vectors"])
+
+
+def _snapshot_path(collection: str, request: SnapshotRequest | None) -> str:
+    """Resolve a snapshot file inside VECTOR_SNAPSHOT_DIR; nothing outside it."""
+    root = os.path.abspath(os.environ.get("VECTOR_SNAPSHOT_DIR", "snapshots"))
+    name = (request.path if request else None) or f"{collection}.parquet"
+    path = os.path.abspath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(
+            status_code=400, detail="Snapshot path must stay inside VECTOR_SNAPSHOT_DIR"
+        )
+    return path
+
+
+def _open_experience_tree(collection: str) -> ExperienceTree:
+    try:
+        tree = ExperienceTree(collection_name=collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not tree.collection_exists():
+        tree.close()
+        raise HTTPException(
+            status_code=404, detail=f"Collection {collection} not found"
+        )
+    return tree
+
+
+async def _compact_and_close(tree: ExperienceTree, **options):
+    try:
+        return await tree.compact_async(**options)
+    finally:
+        tree.close()
+
+
+def _model_provider(model: str):
+    async def provider():
+        return await get_embedding_registry().acquire(model)
+
+    return provider
+
+
+async def _reembed_and_close(store: VectorStoreBase, model: str, **options):
+    try:
+        return await store.reembed_async(_model_provider(model), **options)
+    finally:
+        store.close()
+
+
+@router.get("/embedding-cache")
+async def get_embedding_cache_stats():
+    """Returns hit/miss counters of the shared query-embedding cache"""
+    return get_embedding_cache().stats()
+
+
+@router.post("/{collection}/compact")
+async def compact_collection(
+    collection: str,
+    background_tasks: BackgroundTasks,
+    request: CompactionRequest | None = None,
+):
+    """Merges near-duplicate experiences of a collection"""
+    request = request or CompactionRequest.model_validate({})
+    tree = _open_experience_tree(collection)
+    options = request.model_dump(exclude={"background"}, exclude_none=True)
+    if request.background:
+        background_tasks.add_task(_compact_and_close, tree, **options)
+        return {"collection": collection, "status": "scheduled"}
+    try:
+        result = await _compact_and_close(tree, **options)
+    except VectorStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"collection": collection, "status": "completed", **result}
+
+
+@router.post("/{collection}/export")
+async def export_collection(collection: str, request: SnapshotRequest | None = None):
+    """Writes a collection with its embeddings and relations to a Parquet snapshot"""
+    path = _snapshot_path(collection, request)
+    try:
+        store = VectorStoreBase(collection_name=collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        if not store.collection_exists():
+            raise HTTPException(
+                status_code=404, detail=f"Collection {collection} not found"
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        result = await store.export_collection_async(path)
+    except VectorStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        store.close()
+    return {"collection": collection, **result}
+
+
+@router.post("/{collection}/import")
+async def import_collection(collection: str, request: SnapshotRequest | None = None):
+    """Atomically replaces a collection with a Parquet snapshot"""
+    path = _snapshot_path(collection, request)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Snapshot {path} not found")
+    try:
+        store = VectorStoreBase(collection_name=collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = await store.import_collection_async(path)
+    except EmbeddingMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except VectorStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        store.close()
+    return {"collection": collection, **result}
+
+
+@router.post("/{collection}/reembed")
+async def reembed_collection(
+    collection: str, request: ReembedRequest, background_tasks: BackgroundTasks
+):
+    """Re-embeds a collection with another model and swaps it in when done"""
+    try:
+        store = VectorStoreBase(collection_name=collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not store.collection_exists():
+        store.close()
+        raise HTTPException(
+            status_code=404, detail=f"Collection {collection} not found"
+        )
+    progress = get_reembed_progress(collection)
+    if progress is not None and progress["status"] == "running":
+        store.close()
+        raise HTTPException(
+            status_code=409, detail=f"Collection {collection} is being re-embedded"
+        )
+    options = request.model_dump(exclude={"model", "background"}, exclude_none=True)
+    if request.background:
+        background_tasks.add_task(_reembed_and_close, store, request.model, **options)
+        return {"collection": collection, "status": "scheduled"}
+    try:
+        result = await _reembed_and_close(store, request.model, **options)
+    except VectorStoreError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"collection": collection, **result}
+
+
+@router.get("/{collection}/reembed")
+async def get_reembed_status(collection: str):
+    """Returns progress and throughput of the collection's last re-embedding job"""
+    progress = get_reembed_progress(collection)
+    if progress is None:
+        raise HTTPException(
+            status_code=404, detail=f"No re-embedding job for {collection}"
+        )
+    return {"collection": collection, **progress}
@@ -0,0 +1,180 @@
+"""
+Process-wide pool of DuckDB databases used by the vector stores.
+
+Each database file is opened once. Readers get a cursor per thread so that
+searches running on worker threads execute in parallel, while all writes go
+through a single writer cursor guarded by a lock. Databases nobody holds are
+closed least-recently-used first once more than ``VECTOR_DB_POOL_SIZE`` are
+open.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
+import duckdb
+
+from mao.vector_index import VectorIndexCache
+
+VECTOR_DB_POOL_SIZE: int = int(os.environ.get("VECTOR_DB_POOL_SIZE", "32"))
+
+
+class PooledDatabase:
+    """One open DuckDB database with per-thread read cursors and one writer."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.root = duckdb.connect(path)
+        self._writer = self.root.cursor()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._cursors: list[duckdb.DuckDBPyConnection] = [self._writer]
+        self._cursors_lock = threading.Lock()
+        # Extensions are loaded per database instance, so a reopened file starts over.
+        self.extensions: dict[str, bool] = {}
+        # In-memory top-k indexes by collection; None marks a collection too large.
+        self.vector_indexes = VectorIndexCache()
+        self.refcount = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Return the calling thread's read cursor."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self.root.cursor()
+            self._local.cursor = cursor
+            with self._cursors_lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    @contextmanager
+    def write(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Hold the writer from a worker thread.
+
+        Never call this on an event loop thread while a coroutine may hold the
+        writer across an ``await``; use ``write_async``.
+        """
+        with self._write_lock:
+            yield self._writer
+
+    @contextmanager
+    def try_write(self) -> Iterator[duckdb.DuckDBPyConnection | None]:
+        """Hold the writer if it is free, otherwise yield ``None`` at once."""
+        if not self._write_lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            yield self._writer
+        finally:
+            self._write_lock.release()
+
+    @asynccontextmanager
+    async def write_async(self) -> AsyncIterator[duckdb.DuckDBPyConnection]:
+        """Hold the writer from a coroutine without blocking the event loop."""
+        if not self._write_lock.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(
+                asyncio.to_thread(self._write_lock.acquire)
+            )
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The worker thread still takes the lock; hand it straight back.
+                acquiring.add_done_callback(self._release_acquired)
+                raise
+        try:
+            yield self._writer
+        finally:
+            self._write_lock.release()
+
+    def _release_acquired(self, acquiring: "asyncio.Future[bool]") -> None:
+        if not acquiring.cancelled():
+            self._write_lock.release()
+
+    def close(self) -> None:
+        with self._write_lock:
+            with self._cursors_lock:
+                cursors, self._cursors = self._cursors, []
+            for cursor in cursors:
+                try:
+                    cursor.close()
+                except duckdb.Error:
+                    pass
+            self.root.close()
+            self.vector_indexes.clear()
+            self.closed = True
+
+
+class DuckDBPool:
+    """Opens each database file once and closes idle ones beyond ``max_databases``.
+
+    In-memory databases are never evicted since closing them drops their data.
+    """
+
+    def __init__(self, max_databases: int = VECTOR_DB_POOL_SIZE):
+        self.max_databases = max_databases
+        self._databases: dict[str, PooledDatabase] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_path(db_path: str) -> str:
+        return ":memory:" if db_path == ":memory:" else os.path.abspath(db_path)
+
+    def acquire(self, db_path: str) -> PooledDatabase:
+        path = self.normalize_path(db_path)
+        with self._lock:
+            database = self._databases.get(path)
+            if database is None:
+                database = self._databases[path] = PooledDatabase(path)
+            database.refcount += 1
+            database.last_used = time.monotonic()
+            self._evict_idle()
+        return database
+
+    def release(self, database: PooledDatabase) -> None:
+        with self._lock:
+            database.refcount = max(0, database.refcount - 1)
+            database.last_used = time.monotonic()
+            self._evict_idle()
+
+    def _evict_idle(self) -> None:
+        excess = len(self._databases) - self.max_databases
+        if excess <= 0:
+            return
+        idle = sorted(
+            (
+                db
+                for db in self._databases.values()
+                if db.refcount == 0 and db.path != ":memory:"
+            ),
+            key=lambda db: db.last_used,
+        )
+        for database in idle[:excess]:
+            del self._databases[database.path]
+            database.close()
+            logging.info(f"Closed idle vector database {database.path}")
+
+    def get(self, db_path: str) -> PooledDatabase | None:
+        with self._lock:
+            return self._databases.get(self.normalize_path(db_path))
+
+    def close_all(self) -> None:
+        with self._lock:
+            databases, self._databases = list(self._databases.values()), {}
+        for database in databases:
+            database.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._databases)
+
+
+_DUCKDB_POOL = DuckDBPool()
+
+
+def get_duckdb_pool() -> DuckDBPool:
+    return _DUCKDB_POOL
@@ -0,0 +1,486 @@
+"""
+Embedding helpers: pluggable model backends, a process-wide model registry,
+off-loop encoding with micro-batching of queries and a query-embedding cache.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_EMBEDDING_MODEL: str = os.environ.get(
+    "MAO_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5"
+)
+# "huggingface" (sentence-transformers on torch) or "onnx" (fastembed on ONNX Runtime)
+EMBEDDING_BACKEND: str = os.environ.get("MAO_EMBEDDING_BACKEND", "huggingface").lower()
+EMBEDDING_QUANTIZED: bool = os.environ.get("MAO_EMBEDDING_QUANTIZED", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+EMBEDDING_THREADS: int | None = (
+    int(os.environ["MAO_EMBEDDING_THREADS"])
+    if os.environ.get("MAO_EMBEDDING_THREADS")
+    else None
+)
+EMBED_BATCH_WINDOW_MS: float = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH: int = int(os.environ.get("EMBED_MAX_BATCH", "64"))
+EMBED_WORKERS: int = int(os.environ.get("EMBED_WORKERS", "1"))
+EMBED_CACHE_SIZE: int = int(os.environ.get("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL_SECONDS: float = float(os.environ.get("EMBED_CACHE_TTL_SECONDS", "600"))
+
+_EMBED_POOL: ThreadPoolExecutor | None = None
+_EMBED_POOL_LOCK = threading.Lock()
+_EXECUTORS: "weakref.WeakValueDictionary[int, EmbeddingExecutor]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def load_huggingface_embeddings(model_name: str) -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model=model_name,
+        model_kwargs={"device": "cpu"},
+    )
+
+
+# int8 ONNX exports (source repo, dim) for models whose fastembed default is fp32.
+# BGE uses CLS pooling with normalized output.
+_QUANTIZED_ONNX_SOURCES: dict[str, tuple[str, int]] = {
+    "BAAI/bge-small-en-v1.5": ("Xenova/bge-small-en-v1.5", 384),
+    "BAAI/bge-base-en-v1.5": ("Xenova/bge-base-en-v1.5", 768),
+    "BAAI/bge-large-en-v1.5": ("Xenova/bge-large-en-v1.5", 1024),
+}
+_REGISTERED_ONNX_MODELS: set[str] = set()
+_REGISTER_ONNX_LOCK = threading.Lock()
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings on ONNX Runtime (CPU) through fastembed.
+
+    Avoids importing torch and sentence-transformers, which dominate cold
+    start and resident memory of the HuggingFace backend. With
+    ``quantized`` the int8 export of a known BGE model is loaded instead of
+    the fp32 weights; ``model_name`` then carries an ``-int8`` suffix so
+    caches keep the two apart.
+    """
+
+    # embed_query is embed_documents of one text, so queries batch as documents.
+    symmetric_queries = True
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        quantized: bool = False,
+        threads: int | None = None,
+        batch_size: int = EMBED_MAX_BATCH,
+    ):
+        from fastembed import TextEmbedding
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        if quantized:
+            source = _QUANTIZED_ONNX_SOURCES.get(model_name)
+            if source is None:
+                logging.warning(
+                    f"No int8 ONNX export known for {model_name}; using fp32 weights"
+                )
+            else:
+                self.model_name = f"{model_name}-int8"
+                _register_quantized_model(self.model_name, *source)
+        self._model = TextEmbedding(model_name=self.model_name, threads=threads)
+        self.embedding_size = len(self.embed_query("test"))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [
+            vector.tolist()
+            for vector in self._model.embed(list(texts), batch_size=self.batch_size)
+        ]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def _register_quantized_model(name: str, repo: str, dim: int) -> None:
+    """Register an int8 export with fastembed once per process.
+
+    fastembed refuses a second ``add_custom_model`` for the same name, and
+    ``list_supported_models`` does not list custom models in every release,
+    so registrations are tracked here under a lock as well.
+    """
+    from fastembed import TextEmbedding
+    from fastembed.common.model_description import ModelSource, PoolingType
+
+    with _REGISTER_ONNX_LOCK:
+        if name in _REGISTERED_ONNX_MODELS or any(
+            m["model"] == name for m in TextEmbedding.list_supported_models()
+        ):
+            _REGISTERED_ONNX_MODELS.add(name)
+            return
+        TextEmbedding.add_custom_model(
+            model=name,
+            pooling=PoolingType.CLS,
+            normalization=True,
+            sources=ModelSource(hf=repo),
+            dim=dim,
+            model_file="onnx/model_quantized.onnx",
+        )
+        _REGISTERED_ONNX_MODELS.add(name)
+
+
+def queries_embed_as_documents(embed: Embeddings) -> bool:
+    """Whether ``embed_query(t)`` equals ``embed_documents([t])[0]`` for ``embed``.
+
+    Models declare it with a ``symmetric_queries`` attribute. HuggingFace
+    sentence-transformers models are symmetric unless they pass extra query
+    encode arguments such as an instruction prompt. Anything else is
+    assumed to embed queries differently.
+    """
+    declared = getattr(embed, "symmetric_queries", None)
+    if declared is not None:
+        return bool(declared)
+    query_kwargs = getattr(embed, "query_encode_kwargs", None)
+    return isinstance(query_kwargs, dict) and not query_kwargs
+
+
+def load_onnx_embeddings(model_name: str) -> Embeddings:
+    return OnnxEmbeddings(
+        model_name, quantized=EMBEDDING_QUANTIZED, threads=EMBEDDING_THREADS
+    )
+
+
+EMBEDDING_BACKENDS: dict[str, Callable[[str], Embeddings]] = {
+    "huggingface": load_huggingface_embeddings,
+    "onnx": load_onnx_embeddings,
+}
+
+
+def load_embeddings(model_name: str) -> Embeddings:
+    """Load ``model_name`` with the backend chosen by ``MAO_EMBEDDING_BACKEND``."""
+    loader = EMBEDDING_BACKENDS.get(EMBEDDING_BACKEND)
+    if loader is None:
+        raise ValueError(
+            f"Unknown embedding backend '{EMBEDDING_BACKEND}'; "
+            f"expected one of {sorted(EMBEDDING_BACKENDS)}"
+        )
+    return loader(model_name)
+
+
+def embedding_dimension(embed: Embeddings) -> int:
+    if hasattr(embed, "embedding_size") and embed.embedding_size:
+        return int(embed.embedding_size)
+    if hasattr(embed, "dim") and embed.dim:
+        return int(embed.dim)
+    return len(embed.embed_query("test"))
+
+
+class EmbeddingModelRegistry:
+    """Loads each embedding model once per process and shares it by reference count.
+
+    The first ``acquire`` loads the model on a worker thread; concurrent callers
+    wait for that single load. When the last reference is released the model is
+    dropped so its memory can be reclaimed.
+    """
+
+    def __init__(self, loader: Callable[[str], Embeddings] = load_embeddings):
+        self.loader = loader
+        self._models: dict[str, tuple[Embeddings, int]] = {}
+        self._refcounts: dict[str, int] = {}
+        self._load_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, model_name: str) -> tuple[Embeddings, int]:
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                loaded = self._models.get(model_name)
+            if loaded is not None:
+                return loaded
+            started = time.perf_counter()
+            embed = self.loader(model_name)
+            loaded = (embed, embedding_dimension(embed))
+            logging.info(
+                f"Loaded embedding model {model_name} with dim {loaded[1]} "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+            with self._lock:
+                self._models[model_name] = loaded
+            return loaded
+
+    async def acquire(
+        self, model_name: str = DEFAULT_EMBEDDING_MODEL
+    ) -> tuple[Embeddings, int]:
+        with self._lock:
+            loaded = self._models.get(model_name)
+        if loaded is None:
+            loaded = await asyncio.to_thread(self._load, model_name)
+        with self._lock:
+            self._refcounts[model_name] = self._refcounts.get(model_name, 0) + 1
+        return loaded
+
+    def release(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> None:
+        with self._lock:
+            count = self._refcounts.get(model_name, 0) - 1
+            if count > 0:
+                self._refcounts[model_name] = count
+                return
+            self._refcounts.pop(model_name, None)
+            if self._models.pop(model_name, None) is not None:
+                logging.info(f"Unloaded embedding model {model_name}")
+
+    def release_instance(self, embed: Embeddings) -> bool:
+        """Release the reference held on ``embed``; no-op for unmanaged instances."""
+        with self._lock:
+            model_name = next(
+                (name for name, (e, _) in self._models.items() if e is embed), None
+            )
+        if model_name is None:
+            return False
+        self.release(model_name)
+        return True
+
+    def refcount(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> int:
+        with self._lock:
+            return self._refcounts.get(model_name, 0)
+
+    def is_loaded(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> bool:
+        with self._lock:
+            return model_name in self._models
+
+
+_EMBEDDING_REGISTRY = EmbeddingModelRegistry()
+
+
+def get_embedding_registry() -> EmbeddingModelRegistry:
+    return _EMBEDDING_REGISTRY
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of ``text``; equals DuckDB's ``sha256(text)``."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embedding_model_id(embed: Embeddings) -> str:
+    for attr in ("model_name", "model"):
+        value = getattr(embed, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embed).__name__
+
+
+class EmbeddingCacheStats(TypedDict):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+    hit_rate: float
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache with TTL for embeddings keyed by model id and text hash."""
+
+    def __init__(
+        self,
+        max_size: int = EMBED_CACHE_SIZE,
+        ttl_seconds: float = EMBED_CACHE_TTL_SECONDS,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, list[float]]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model_id: str, text: str) -> tuple[str, str]:
+        return model_id, content_hash(text)
+
+    def get(self, model_id: str, text: str) -> list[float] | None:
+        key = self._key(model_id, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model_id: str, text: str, vector: list[float]) -> None:
+        if self.max_size <= 0:
+            return
+        key = self._key(model_id, text)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> EmbeddingCacheStats:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return EmbeddingCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+            )
+
+
+_EMBEDDING_CACHE = EmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _EMBEDDING_CACHE
+
+
+def get_embedding_pool() -> ThreadPoolExecutor:
+    global _EMBED_POOL
+    with _EMBED_POOL_LOCK:
+        if _EMBED_POOL is None:
+            _EMBED_POOL = ThreadPoolExecutor(
+                max_workers=EMBED_WORKERS, thread_name_prefix="mao-embed"
+            )
+        return _EMBED_POOL
+
+
+def shutdown_embedding_pool() -> None:
+    global _EMBED_POOL
+    with _EMBED_POOL_LOCK:
+        if _EMBED_POOL is not None:
+            _EMBED_POOL.shutdown(wait=False, cancel_futures=True)
+            _EMBED_POOL = None
+
+
+class _PendingBatch:
+    __slots__ = ("futures", "handle", "texts")
+
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+        self.futures: list[asyncio.Future[list[float]]] = []
+        self.handle: asyncio.TimerHandle | None = None
+
+
+class EmbeddingExecutor:
+    """Runs an ``Embeddings`` model on a worker thread instead of the event loop.
+
+    Concurrent ``aembed_query`` calls that arrive within ``window_ms`` of each
+    other are coalesced into one worker task. For models whose queries embed
+    like documents (see ``queries_embed_as_documents``) that task is a single
+    ``embed_documents`` call, so N simultaneous chats cost one forward pass
+    instead of N; other models keep their query embedding and run
+    ``embed_query`` per text.
+    """
+
+    def __init__(
+        self,
+        embed: Embeddings,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch: int = EMBED_MAX_BATCH,
+        pool: ThreadPoolExecutor | None = None,
+    ):
+        self.embed = embed
+        self.symmetric = queries_embed_as_documents(embed)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pool = pool
+        self._pending: dict[asyncio.AbstractEventLoop, _PendingBatch] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_embeddings(cls, embed: Embeddings) -> "EmbeddingExecutor":
+        """Return the executor shared by every store using ``embed``."""
+        executor = _EXECUTORS.get(id(embed))
+        if executor is None or executor.embed is not embed:
+            executor = cls(embed)
+            _EXECUTORS[id(embed)] = executor
+        return executor
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        return self._pool or get_embedding_pool()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, self._encode, list(texts))
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries in one pool task, without the batch window."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, self._encode_queries, list(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[list[float]] = loop.create_future()
+        with self._lock:
+            batch = self._pending.get(loop)
+            if batch is None:
+                batch = self._pending[loop] = _PendingBatch()
+                batch.handle = loop.call_later(self.window, self._flush, loop)
+            batch.texts.append(text)
+            batch.futures.append(future)
+            full = len(batch.texts) >= self.max_batch
+        if full:
+            self._flush(loop)
+        return await future
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        return [list(v) for v in self.embed.embed_documents(texts)]
+
+    def _encode_queries(self, texts: list[str]) -> list[list[float]]:
+        if self.symmetric:
+            return self._encode(texts)
+        return [list(self.embed.embed_query(text)) for text in texts]
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            batch = self._pending.pop(loop, None)
+        if batch is None:
+            return
+        if batch.handle is not None:
+            batch.handle.cancel()
+        work = loop.run_in_executor(self.pool, self._encode_queries, batch.texts)
+        work.add_done_callback(lambda done: self._resolve(batch, done))
+
+    @staticmethod
+    def _resolve(
+        batch: _PendingBatch, done: "asyncio.Future[list[list[float]]]"
+    ) -> None:
+        if done.cancelled():
+            for future in batch.futures:
+                future.cancel()
+            return
+        error = done.exception()
+        for i, future in enumerate(batch.futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result()[i])
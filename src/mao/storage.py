@@ -2,19 +2,35 @@
 KnowledgeTree and ExperienceTree: DuckDB-based vector stores for agent knowledge and experience.
 """
 
+import asyncio
 import json
 import logging
 import os
 import re
+import threading
+import time
 import uuid
-from collections.abc import Awaitable, Callable
+import weakref
+from collections.abc import AsyncIterable, Awaitable, Callable, Sequence
 from typing import Any, TypedDict
 
 from typing_extensions import NotRequired
 
 import duckdb
+import numpy as np
 from langchain_core.embeddings import Embeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+
+from mao.duckdb_pool import PooledDatabase, get_duckdb_pool
+from mao.embeddings import (
+    EMBEDDING_BACKEND,
+    EmbeddingCache,
+    EmbeddingExecutor,
+    content_hash,
+    embedding_model_id,
+    get_embedding_cache,
+    get_embedding_registry,
+)
+from mao.vector_index import MemoryVectorIndex, mmr_select
 
 _VALID_IDENTIFIER = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]{0,63}$")
 
@@ -27,45 +43,230 @@ def _validate_identifier(name: str) -> str:
     return name
 
 DEFAULT_VECTOR_DB_PATH = "mao_vectors.duckdb"
-BATCH_SIZE: int = int(os.environ.get("VECTOR_BATCH_SIZE", "32"))
-_DUCKDB_CONNECTIONS: dict[str, duckdb.DuckDBPyConnection] = {}
+BATCH_SIZE: int = int(os.environ.get("VECTOR_BATCH_SIZE", "256"))
+HNSW_ENABLED: bool = os.environ.get("VECTOR_HNSW", "").lower() in ("1", "true", "yes")
+HNSW_MIN_ROWS: int = int(os.environ.get("VECTOR_HNSW_MIN_ROWS", "10000"))
+VECTOR_QUANTIZATION: str = os.environ.get("VECTOR_QUANTIZATION", "").lower()
+VECTOR_RERANK_FACTOR: int = int(os.environ.get("VECTOR_RERANK_FACTOR", "4"))
+HYBRID_SEARCH_ENABLED: bool = os.environ.get("VECTOR_HYBRID", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+HYBRID_CANDIDATES: int = int(os.environ.get("VECTOR_HYBRID_CANDIDATES", "50"))
+HYBRID_RRF_K: int = int(os.environ.get("VECTOR_RRF_K", "60"))
+COMPACTION_SIMILARITY: float = float(
+    os.environ.get("EXPERIENCE_COMPACTION_SIMILARITY", "0.95")
+)
+COMPACTION_BATCH_SIZE: int = int(
+    os.environ.get("EXPERIENCE_COMPACTION_BATCH_SIZE", "500")
+)
+# Retention limits per collection; 0 disables a limit.
+VECTOR_MAX_ROWS: int = int(os.environ.get("VECTOR_MAX_ROWS", "0"))
+VECTOR_MAX_AGE_SECONDS: float = float(os.environ.get("VECTOR_MAX_AGE_SECONDS", "0"))
+VECTOR_MAX_BYTES: int = int(os.environ.get("VECTOR_MAX_BYTES", "0"))
+VECTOR_EVICTION_POLICY: str = os.environ.get("VECTOR_EVICTION_POLICY", "lru").lower()
+VECTOR_EVICTION_BATCH_SIZE: int = int(
+    os.environ.get("VECTOR_EVICTION_BATCH_SIZE", "1000")
+)
+VECTOR_HIT_FLUSH_SIZE: int = int(os.environ.get("VECTOR_HIT_FLUSH_SIZE", "256"))
+# Vectors by (model_id, sha256 of text), shared by every collection in the database.
+EMBEDDING_CACHE_TABLE = "embedding_cache"
+EMBEDDING_CACHE_TABLE_ENABLED: bool = os.environ.get(
+    "VECTOR_EMBEDDING_CACHE", "true"
+).lower() in ("1", "true", "yes")
+# Rows the cache table keeps, oldest cached dropped first; 0 disables the cap.
+EMBEDDING_CACHE_MAX_ROWS: int = int(
+    os.environ.get("VECTOR_EMBEDDING_CACHE_MAX_ROWS", "100000")
+)
+# Embedding model each collection was written with, by collection name.
+COLLECTION_MODELS_TABLE = "vector_collection_models"
+# Maximal marginal relevance: re-pick a diverse top-k from MMR_CANDIDATES hits.
+MMR_ENABLED: bool = os.environ.get("VECTOR_MMR", "").lower() in ("1", "true", "yes")
+MMR_CANDIDATES: int = int(os.environ.get("VECTOR_MMR_CANDIDATES", "20"))
+MMR_LAMBDA: float = float(os.environ.get("VECTOR_MMR_LAMBDA", "0.5"))
+MEMORY_INDEX_ENABLED: bool = os.environ.get("VECTOR_MEMORY_INDEX", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+MEMORY_INDEX_MAX_ROWS: int = int(
+    os.environ.get("VECTOR_MEMORY_INDEX_MAX_ROWS", "50000")
+)
+# "table" keeps one table per collection; "shared" keeps every collection in
+# SHARED_VECTOR_TABLE, keyed by (agent, kind).
+VECTOR_LAYOUT: str = os.environ.get("VECTOR_LAYOUT", "table").lower()
+SHARED_VECTOR_TABLE = "agent_vectors"
+_PARTITION_KINDS = ("knowledge", "experience")
+# Working tables next to a collection: snapshot imports and re-embedding shadows.
+_IMPORT_SUFFIX = "__import"
+_REEMBED_SUFFIX = "__reembed"
+# Keeps identifiers such as "E1234" or "sku-77" whole instead of dropping digits.
+_FTS_IGNORE_PATTERN = r"(\.|[^a-z0-9_-])+"
+_STALE_FTS_INDEXES: set[tuple[str, str]] = set()
+# Pending background rebuilds of stale full-text indexes, by (database, table).
+_FTS_REBUILDS: dict[tuple[str, str], threading.Timer] = {}
+_FTS_LOCK = threading.Lock()
+# Delay before a stale full-text index is rebuilt; writes in between share one rebuild.
+FTS_REBUILD_DELAY_SECONDS: float = float(
+    os.environ.get("VECTOR_FTS_REBUILD_DELAY_SECONDS", "5")
+)
+# Stores with a loaded model, so that a re-embedding can switch them over.
+_OPEN_STORES: "weakref.WeakSet[VectorStoreBase]" = weakref.WeakSet()
 
 
 def get_vector_db_path() -> str:
     return os.environ.get("VECTOR_DB_PATH", DEFAULT_VECTOR_DB_PATH)
 
 
+def _vector_param(vector: list[float]) -> str:
+    """Serialize a vector for binding as ``?::FLOAT[n]``.
+
+    DuckDB converts Python list parameters element by element, which costs
+    tens of milliseconds for a 384-dim embedding; casting a VARCHAR literal
+    is more than an order of magnitude cheaper.
+    """
+    return "[" + ",".join(str(float(v)) for v in vector) + "]"
+
+
+def _sql_literal(value: str) -> str:
+    """Escape ``value`` for a single-quoted SQL literal (COPY takes no parameters)."""
+    return value.replace("'", "''")
+
+
+def partition_key(collection_name: str) -> tuple[str, str]:
+    """Map a collection name to its ``(agent, kind)`` in the shared layout.
+
+    Agents name their collections ``knowledge_<agent>`` and
+    ``experience_<agent>``; any other collection is an agent of its own with
+    kind ``"collection"``.
+    """
+    kind, _, agent = collection_name.partition("_")
+    if kind in _PARTITION_KINDS and agent:
+        return agent, kind
+    return collection_name, "collection"
+
+
+def _one(result: duckdb.DuckDBPyConnection) -> tuple[Any, ...]:
+    """Return the row of an aggregate or ``RETURNING`` query, which always has one."""
+    row = result.fetchone()
+    if row is None:
+        raise VectorStoreError("Expected a result row")
+    return row
+
+
+def _sign_bits_param(vector: list[float]) -> str:
+    """Serialize the sign bits of a vector for binding as ``?::BIT``."""
+    return "".join("1" if v > 0 else "0" for v in vector)
+
+
+def _sign_bits_sql(expr: str) -> str:
+    """SQL computing the ``BIT`` sign quantization of a ``FLOAT[n]`` expression."""
+    return (
+        f"array_to_string(list_transform({expr}::FLOAT[], "
+        f"x -> CASE WHEN x > 0 THEN '1' ELSE '0' END), '')::BIT"
+    )
+
+
+class NeighborResult(TypedDict):
+    id: str
+    page_content: str
+    tags: list[str]
+    type: str
+    depth: int
+
+
 class SearchResult(TypedDict):
     id: str
     score: float
     page_content: str
     tags: list[str]
     relations: NotRequired[list[dict[str, Any]]]
+    neighbors: NotRequired[list[NeighborResult]]
+
+
+class CollectionSearchResult(SearchResult):
+    collection: str
+
+
+class CompactionResult(TypedDict):
+    scanned: int
+    merged: int
+    remaining: int
+    batches: int
+
+
+class RetentionResult(TypedDict):
+    evicted: int
+    remaining: int
+
+
+class SnapshotResult(TypedDict):
+    path: str
+    rows: int
+    relations: int
+
+
+class LayoutMigrationResult(TypedDict):
+    collections: int
+    rows: int
+    relations: int
+
+
+class IngestProgress(TypedDict):
+    documents: int
+    windows: int
+    elapsed_seconds: float
+    docs_per_second: float
+
+
+class ReembedProgress(TypedDict):
+    model_id: str
+    status: str
+    total: int
+    done: int
+    batches: int
+    elapsed_seconds: float
+    docs_per_second: float
+    error: NotRequired[str]
+
+
+# Latest progress of each re-embedding job by (database, collection).
+_REEMBED_JOBS: dict[tuple[str, str], ReembedProgress] = {}
+
+
+def get_reembed_progress(
+    collection_name: str, db_path: str | None = None
+) -> ReembedProgress | None:
+    """Progress of the last re-embedding job on a collection in this process."""
+    db_key = get_duckdb_pool().normalize_path(db_path or get_vector_db_path())
+    progress = _REEMBED_JOBS.get((db_key, collection_name))
+    return ReembedProgress(**progress) if progress is not None else None
 
 
 class EmbeddingProvider:
     @staticmethod
     async def create_embeddings() -> tuple[Embeddings, int]:
-        hf_embed: Embeddings = HuggingFaceEmbeddings(
-            model="BAAI/bge-small-en-v1.5",
-            model_kwargs={"device": "cpu"},
-        )
-        if hasattr(hf_embed, "embedding_size") and hf_embed.embedding_size:
-            embed_dim = int(hf_embed.embedding_size)
-        elif hasattr(hf_embed, "dim") and hf_embed.dim:
-            embed_dim = int(hf_embed.dim)
-        else:
-            embed_dim = len(hf_embed.embed_query("test"))
+        embed, embed_dim = await get_embedding_registry().acquire()
         logging.info(
-            f"Using SentenceTransformers embeddings: BAAI/bge-small-en-v1.5 with dim {embed_dim}"
+            f"Using {EMBEDDING_BACKEND} embeddings: {embedding_model_id(embed)} "
+            f"with dim {embed_dim}"
         )
-        return hf_embed, embed_dim
+        return embed, embed_dim
+
+    @staticmethod
+    def release_embeddings(embed: Embeddings) -> None:
+        get_embedding_registry().release_instance(embed)
 
 
 class VectorStoreError(Exception):
     pass
 
 
+class EmbeddingMismatchError(VectorStoreError):
+    """Vectors from another embedding model or dimension than the collection's."""
+
+
 class VectorStoreBase:
     def __init__(
         self,
@@ -79,30 +280,77 @@ class VectorStoreBase:
         self.collection_name = _validate_identifier(collection_name)
         self.db_path = db_path or get_vector_db_path()
         self.recreate_on_dim_mismatch = recreate_on_dim_mismatch
-        self.conn = self._get_connection(self.db_path)
+        self.layout = VECTOR_LAYOUT
+        self._db: PooledDatabase = get_duckdb_pool().acquire(self.db_path)
+        self._db_key = self._db.path
+        self._db_released = False
+        self.use_hnsw = HNSW_ENABLED
+        self.hnsw_min_rows = HNSW_MIN_ROWS
+        self._hnsw_ready = False
+        self.quantization = VECTOR_QUANTIZATION
+        self.rerank_factor = VECTOR_RERANK_FACTOR
+        self._has_sign_bits = False
+        self.hybrid_search = HYBRID_SEARCH_ENABLED
+        self.hybrid_candidates = HYBRID_CANDIDATES
+        self.rrf_k = HYBRID_RRF_K
+        self.max_rows = VECTOR_MAX_ROWS
+        self.max_age_seconds = VECTOR_MAX_AGE_SECONDS
+        self.max_bytes = VECTOR_MAX_BYTES
+        self.eviction_policy = VECTOR_EVICTION_POLICY
+        self.eviction_batch_size = VECTOR_EVICTION_BATCH_SIZE
+        self.memory_index = MEMORY_INDEX_ENABLED
+        self.mmr = MMR_ENABLED
+        self.mmr_candidates = MMR_CANDIDATES
+        self.mmr_lambda = MMR_LAMBDA
+        self.memory_index_max_rows = MEMORY_INDEX_MAX_ROWS
+        self._pending_hits: set[str] = set()
+        self._hits_lock = threading.Lock()
+        self._retention_task: asyncio.Task[RetentionResult] | None = None
 
         self.embed: Embeddings | None = None
         self.embed_dim: int | None = None
+        self._executor: EmbeddingExecutor | None = None
+        self.embedding_cache: EmbeddingCache | None = get_embedding_cache()
+        self.embedding_cache_table = EMBEDDING_CACHE_TABLE_ENABLED
+        self.embedding_cache_max_rows = EMBEDDING_CACHE_MAX_ROWS
+        self.model_id: str | None = None
         self._embedding_provider = (
             embedding_provider or EmbeddingProvider.create_embeddings
         )
 
-    @staticmethod
-    def _get_connection(db_path: str) -> duckdb.DuckDBPyConnection:
-        normalized_path = ":memory:" if db_path == ":memory:" else os.path.abspath(db_path)
-        if normalized_path not in _DUCKDB_CONNECTIONS:
-            _DUCKDB_CONNECTIONS[normalized_path] = duckdb.connect(normalized_path)
-        return _DUCKDB_CONNECTIONS[normalized_path]
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """The calling thread's read cursor on the pooled database.
+
+        Writes go through ``self._db.write()`` / ``write_async()`` instead so
+        they are serialized on the database's single writer.
+        """
+        return self._db.cursor()
 
     async def async_init(self) -> "VectorStoreBase":
         self.embed, self.embed_dim = await self._embedding_provider()
-        self._ensure_collection()
+        self._executor = EmbeddingExecutor.for_embeddings(self.embed)
+        self.model_id = embedding_model_id(self.embed)
+        await asyncio.to_thread(self._ensure_collection)
+        _OPEN_STORES.add(self)
         logging.info(
             f"{self.__class__.__name__}: dim {self.embed_dim} "
             f"for '{self.collection_name}' at {self.db_path}"
         )
         return self
 
+    def close(self) -> None:
+        """Drop this store's references on its embedding model and database."""
+        if not self._db_released:
+            self._flush_hits()
+            get_duckdb_pool().release(self._db)
+            self._db_released = True
+        _OPEN_STORES.discard(self)
+        if self.embed is not None:
+            EmbeddingProvider.release_embeddings(self.embed)
+        self.embed = None
+        self._executor = None
+
     @classmethod
     async def create(
         cls,
@@ -118,78 +366,1269 @@ class VectorStoreBase:
         )
         return await instance.async_init()
 
+    @property
+    def _shared(self) -> bool:
+        return self.layout == "shared"
+
+    @property
+    def _table(self) -> str:
+        """The physical table holding this collection's rows."""
+        return SHARED_VECTOR_TABLE if self._shared else self.collection_name
+
+    @property
+    def _scope(self) -> str:
+        """SQL predicate selecting this collection's rows in ``_table``."""
+        if not self._shared:
+            return "true"
+        agent, kind = partition_key(self.collection_name)
+        return f"agent = '{_sql_literal(agent)}' AND kind = '{_sql_literal(kind)}'"
+
+    @property
+    def _rows(self) -> str:
+        """SQL relation with this collection's rows, for reads.
+
+        In the shared layout this is a filter on ``(agent, kind)`` that DuckDB
+        pushes into the scan, so row groups of other agents are skipped by
+        their min/max zone maps as long as the table stays clustered (see
+        ``cluster_shared_layout_async``).
+        """
+        if not self._shared:
+            return self.collection_name
+        return (
+            f"(SELECT rowid, * EXCLUDE (agent, kind) "
+            f"FROM {SHARED_VECTOR_TABLE} WHERE {self._scope})"
+        )
+
+    def _partition_insert(self) -> tuple[str, str]:
+        """Extra ``INSERT`` columns and values placing rows in this collection."""
+        if not self._shared:
+            return "", ""
+        agent, kind = partition_key(self.collection_name)
+        return ", agent, kind", f", '{_sql_literal(agent)}', '{_sql_literal(kind)}'"
+
     def _ensure_collection(self) -> None:
         table = self.collection_name
         try:
-            existing = self.conn.execute(
-                "SELECT table_name FROM information_schema.tables "
-                "WHERE table_name = ?",
-                [table],
-            ).fetchone()
-
-            if existing and self.recreate_on_dim_mismatch and self.embed_dim:
-                col_info = self.conn.execute(
-                    "SELECT data_type FROM information_schema.columns "
-                    "WHERE table_name = ? AND column_name = 'embedding'",
-                    [table],
-                ).fetchone()
-                if col_info and f"[{self.embed_dim}]" not in str(col_info[0]):
-                    logging.warning(
-                        f"Dimension mismatch for '{table}'. Recreating."
-                    )
-                    self.conn.execute(f"DROP TABLE {table}")
-                    existing = None
-
-            if not existing:
-                self.conn.execute(f"""
-                    CREATE TABLE {table} (
-                        id VARCHAR PRIMARY KEY,
-                        text VARCHAR,
-                        tags JSON,
-                        relations JSON,
-                        embedding FLOAT[{self.embed_dim}]
-                    )
-                """)
+            with self._db.write() as conn:
+                self._create_collection(conn)
+        except EmbeddingMismatchError:
+            raise
         except Exception as e:
             raise VectorStoreError(
                 f"Failed to ensure collection '{table}': {e}"
             ) from e
 
+    def _create_collection(self, conn: duckdb.DuckDBPyConnection) -> None:
+        table = self._table
+        existing = conn.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_name = ?",
+            [table],
+        ).fetchone()
+
+        if existing and self.recreate_on_dim_mismatch and self.embed_dim:
+            col_info = conn.execute(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = ? AND column_name = 'embedding'",
+                [table],
+            ).fetchone()
+            if col_info and f"[{self.embed_dim}]" not in str(col_info[0]):
+                if self._shared:
+                    raise ValueError(
+                        f"'{table}' holds {col_info[0]} vectors of every agent "
+                        f"and is not recreated for dim {self.embed_dim}"
+                    )
+                logging.warning(f"Dimension mismatch for '{table}'. Recreating.")
+                conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"DROP TABLE IF EXISTS {self._edges_table}")
+                self._db.vector_indexes.pop(self.collection_name, None)
+                self._hnsw_ready = False
+                self._has_sign_bits = False
+                existing = None
+
+        stored_model = self._stored_model_id(conn) if existing else None
+        if stored_model and self.model_id and stored_model != self.model_id:
+            raise EmbeddingMismatchError(
+                f"'{self.collection_name}' was embedded with {stored_model}, "
+                f"not {self.model_id}; open it with that model or re-embed it"
+            )
+        if not existing:
+            self._create_table(conn, table, self.embed_dim, partitioned=self._shared)
+        conn.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "
+            f"created_at TIMESTAMP DEFAULT current_localtimestamp()"
+        )
+        conn.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS last_hit_at TIMESTAMP"
+        )
+        self._create_edges_table(conn, self._edges_table)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {EMBEDDING_CACHE_TABLE} (
+                model_id VARCHAR NOT NULL,
+                content_hash VARCHAR NOT NULL,
+                vector FLOAT[] NOT NULL,
+                PRIMARY KEY (model_id, content_hash)
+            )
+        """)
+        conn.execute(
+            f"ALTER TABLE {EMBEDDING_CACHE_TABLE} ADD COLUMN IF NOT EXISTS "
+            f"cached_at TIMESTAMP DEFAULT current_localtimestamp()"
+        )
+        self._migrate_tags_column(conn)
+        self._migrate_relations_column(conn)
+        if self.model_id:
+            self._record_model_id(conn, self.model_id, replace=not existing)
+        self._ensure_sign_bits(conn)
+        self._mark_text_changed()
+        self._maybe_build_hnsw_index(conn)
+
+    @staticmethod
+    def _create_table(
+        conn: duckdb.DuckDBPyConnection,
+        table: str,
+        dim: int | None,
+        partitioned: bool = False,
+    ) -> None:
+        partition = (
+            "agent VARCHAR NOT NULL, kind VARCHAR NOT NULL," if partitioned else ""
+        )
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                {partition}
+                id VARCHAR PRIMARY KEY,
+                text VARCHAR,
+                tags VARCHAR[],
+                embedding FLOAT[{dim}],
+                created_at TIMESTAMP DEFAULT current_localtimestamp(),
+                last_hit_at TIMESTAMP
+            )
+        """)
+
+    @staticmethod
+    def _create_edges_table(conn: duckdb.DuckDBPyConnection, edges: str) -> None:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {edges} (
+                source VARCHAR NOT NULL,
+                target VARCHAR NOT NULL,
+                type VARCHAR NOT NULL,
+                PRIMARY KEY (source, target, type)
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {edges}_target ON {edges} (target)")
+
+    def _delete_edges(self, conn: duckdb.DuckDBPyConnection) -> None:
+        """Delete the edges leaving this collection's entries."""
+        if self._shared:
+            conn.execute(
+                f"DELETE FROM {self._edges_table} "
+                f"WHERE source IN (SELECT id FROM {self._rows})"
+            )
+        else:
+            conn.execute(f"DELETE FROM {self._edges_table}")
+
+    def collection_exists(self) -> bool:
+        """Whether the collection exists; in the shared layout, whether it has rows."""
+        exists = (
+            self.conn.execute(
+                "SELECT 1 FROM information_schema.tables WHERE table_name = ?",
+                [self._table],
+            ).fetchone()
+            is not None
+        )
+        if not exists or not self._shared:
+            return exists
+        return (
+            self.conn.execute(f"SELECT 1 FROM {self._rows} LIMIT 1").fetchone()
+            is not None
+        )
+
+    @property
+    def _edges_table(self) -> str:
+        return f"{self._table}_edges"
+
+    def _column_type(self, conn: duckdb.DuckDBPyConnection, column: str) -> str | None:
+        col_info = conn.execute(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = ? AND column_name = ?",
+            [self._table, column],
+        ).fetchone()
+        return str(col_info[0]) if col_info else None
+
+    def _embedding_dim(self, conn: duckdb.DuckDBPyConnection) -> int | None:
+        """Dimension of the stored ``embedding`` column; None without a table."""
+        match = re.fullmatch(
+            r"FLOAT\[(\d+)\]", self._column_type(conn, "embedding") or ""
+        )
+        return int(match.group(1)) if match else None
+
+    def _stored_model_id(self, conn: duckdb.DuckDBPyConnection) -> str | None:
+        """Model id recorded for the collection, if it has one."""
+        if (
+            conn.execute(
+                "SELECT 1 FROM duckdb_tables() "
+                "WHERE database_name = current_database() AND table_name = ?",
+                [COLLECTION_MODELS_TABLE],
+            ).fetchone()
+            is None
+        ):
+            return None
+        row = conn.execute(
+            f"SELECT model_id FROM {COLLECTION_MODELS_TABLE} WHERE collection = ?",
+            [self.collection_name],
+        ).fetchone()
+        return row[0] if row else None
+
+    def _record_model_id(
+        self, conn: duckdb.DuckDBPyConnection, model_id: str, replace: bool = False
+    ) -> None:
+        """Record the collection's model; an existing record wins unless ``replace``."""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {COLLECTION_MODELS_TABLE} (
+                collection VARCHAR PRIMARY KEY,
+                model_id VARCHAR NOT NULL
+            )
+        """)
+        conn.execute(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} "
+            f"INTO {COLLECTION_MODELS_TABLE} VALUES (?, ?)",
+            [self.collection_name, model_id],
+        )
+
+    def _alter_collection(
+        self, conn: duckdb.DuckDBPyConnection, statement: str
+    ) -> None:
+        """Run an ``ALTER TABLE`` on the collection.
+
+        DuckDB refuses to alter a table that has an HNSW index, so an existing
+        index is dropped for the change and rebuilt afterwards.
+        """
+        had_index = self._has_hnsw_index(conn)
+        if had_index:
+            self._load_extension("vss")
+            conn.execute(f"DROP INDEX {self._hnsw_index_name}")
+            self._hnsw_ready = False
+        conn.execute(statement)
+        if had_index:
+            self._build_hnsw_index(conn)
+
+    def _migrate_tags_column(self, conn: duckdb.DuckDBPyConnection) -> None:
+        """Convert a legacy JSON ``tags`` column to a native ``VARCHAR[]``."""
+        if self._column_type(conn, "tags") != "JSON":
+            return
+        self._alter_collection(
+            conn,
+            f"ALTER TABLE {self._table} "
+            "ALTER COLUMN tags SET DATA TYPE VARCHAR[] "
+            "USING coalesce(from_json(tags, '[\"VARCHAR\"]'), [])",
+        )
+        logging.info(f"Migrated tags of '{self._table}' from JSON to VARCHAR[]")
+
+    def _migrate_relations_column(self, conn: duckdb.DuckDBPyConnection) -> None:
+        """Move a legacy JSON ``relations`` column into the edge table."""
+        table = self._table
+        if self._column_type(conn, "relations") is None:
+            return
+        conn.execute(f"""
+            INSERT INTO {self._edges_table} (source, target, type)
+            SELECT DISTINCT id, rel.id, coalesce(rel.type, 'related')
+            FROM (
+                SELECT id, unnest(
+                    from_json(relations, '[{{"id": "VARCHAR", "type": "VARCHAR"}}]')
+                ) AS rel
+                FROM {table}
+            )
+            WHERE rel.id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """)
+        self._alter_collection(conn, f"ALTER TABLE {table} DROP COLUMN relations")
+        logging.info(f"Migrated relations of '{table}' to '{self._edges_table}'")
+
+    def _ensure_sign_bits(self, conn: duckdb.DuckDBPyConnection) -> None:
+        """Add and backfill the binary-quantized ``embedding_bits`` column.
+
+        With ``quantization = "binary"`` each row also stores the sign bit of
+        every dimension (``dim / 8`` bytes instead of ``4 * dim``). Searches
+        rank candidates by Hamming distance over that column and re-rank only
+        the survivors with the float vectors. Once the column exists, stores
+        opened on the table keep it filled whatever their own setting.
+        """
+        table = self._table
+        if self.quantization == "binary":
+            conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS embedding_bits BIT"
+            )
+            conn.execute(
+                f"UPDATE {table} SET embedding_bits = {_sign_bits_sql('embedding')} "
+                f"WHERE embedding_bits IS NULL AND embedding IS NOT NULL"
+            )
+        elif self.quantization:
+            logging.warning(
+                f"Unknown vector quantization '{self.quantization}' for '{table}'; "
+                f"using full-precision search"
+            )
+        self._has_sign_bits = (
+            conn.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = ? AND column_name = 'embedding_bits'",
+                [table],
+            ).fetchone()
+            is not None
+        )
+
+    @property
+    def _fts_schema(self) -> str:
+        return f"fts_main_{self._table}"
+
+    def _mark_text_changed(self) -> None:
+        """Flag the full-text index as stale; DuckDB does not update it on write."""
+        _STALE_FTS_INDEXES.add((self._db_key, self._table))
+
+    def _ensure_fts_index(self) -> bool:
+        """Make sure a BM25 index over ``text`` exists for hybrid search.
+
+        Only the first build runs on the search path. A stale index keeps
+        serving, without the rows written since, while one rebuild per
+        ``FTS_REBUILD_DELAY_SECONDS`` runs on a timer thread.
+        """
+        key = (self._db_key, self._table)
+        if key not in _STALE_FTS_INDEXES:
+            return True
+        if not self._load_extension("fts"):
+            return False
+        with _FTS_LOCK:
+            if key not in _STALE_FTS_INDEXES:
+                return True
+            if self._has_fts_index():
+                if key not in _FTS_REBUILDS:
+                    timer = threading.Timer(
+                        FTS_REBUILD_DELAY_SECONDS, self._rebuild_fts_later, [key]
+                    )
+                    timer.daemon = True
+                    _FTS_REBUILDS[key] = timer
+                    timer.start()
+                return True
+            return self._rebuild_fts_index(key)
+
+    def _has_fts_index(self) -> bool:
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM duckdb_schemas() WHERE schema_name = ?",
+                [self._fts_schema],
+            ).fetchone()
+            is not None
+        )
+
+    def _rebuild_fts_later(self, key: tuple[str, str]) -> None:
+        try:
+            if not self._db.closed:
+                self._rebuild_fts_index(key)
+        finally:
+            with _FTS_LOCK:
+                _FTS_REBUILDS.pop(key, None)
+
+    def _rebuild_fts_index(self, key: tuple[str, str]) -> bool:
+        # Cleared first so that writes landing during the build mark it again.
+        _STALE_FTS_INDEXES.discard(key)
+        try:
+            with self._db.write() as conn:
+                conn.execute(
+                    f"PRAGMA create_fts_index('{self._table}', 'id', 'text', "
+                    f"overwrite = 1, ignore = '{_FTS_IGNORE_PATTERN}')"
+                )
+        except duckdb.Error as e:
+            _STALE_FTS_INDEXES.add(key)
+            logging.warning(f"Could not build full-text index for '{self._table}': {e}")
+            return False
+        return True
+
+    def _load_extension(self, name: str) -> bool:
+        loaded = self._db.extensions
+        if name not in loaded:
+            try:
+                self.conn.execute(f"LOAD {name}")
+                loaded[name] = True
+            except duckdb.Error:
+                try:
+                    self.conn.execute(f"INSTALL {name}")
+                    self.conn.execute(f"LOAD {name}")
+                    loaded[name] = True
+                except duckdb.Error as e:
+                    logging.warning(f"DuckDB extension '{name}' unavailable: {e}")
+                    loaded[name] = False
+        return loaded[name]
+
+    @property
+    def _hnsw_index_name(self) -> str:
+        return f"{self._table}_hnsw"
+
+    def _has_hnsw_index(self, conn: duckdb.DuckDBPyConnection) -> bool:
+        return (
+            conn.execute(
+                "SELECT 1 FROM duckdb_indexes() "
+                "WHERE table_name = ? AND index_name = ?",
+                [self._table, self._hnsw_index_name],
+            ).fetchone()
+            is not None
+        )
+
+    def _build_hnsw_index(self, conn: duckdb.DuckDBPyConnection) -> None:
+        table = self._table
+        if not self._load_extension("vss"):
+            return
+        try:
+            if self._db_key != ":memory:":
+                conn.execute("SET hnsw_enable_experimental_persistence = true")
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._hnsw_index_name} "
+                f"ON {table} USING HNSW (embedding) WITH (metric = 'cosine')"
+            )
+            self._hnsw_ready = True
+            logging.info(f"Built HNSW index for '{table}'")
+        except duckdb.Error as e:
+            logging.warning(f"Could not build HNSW index for '{table}': {e}")
+
+    def _maybe_build_hnsw_index(self, conn: duckdb.DuckDBPyConnection) -> None:
+        """Attach or build the HNSW index once the collection is large enough.
+
+        An index that was persisted by an earlier process is always picked up,
+        even when ``use_hnsw`` is off, so that the table stays writable. The
+        shared layout never builds one: the index returns its top-k across
+        all agents before the partition filter applies.
+        """
+        if self._hnsw_ready:
+            return
+        if self._has_hnsw_index(conn):
+            self._hnsw_ready = self._load_extension("vss")
+            return
+        if not self.use_hnsw or self._shared or not self._load_extension("vss"):
+            return
+        count = conn.execute(f"SELECT count(*) FROM {self._rows}").fetchone()
+        if count is None or count[0] < self.hnsw_min_rows:
+            return
+        self._build_hnsw_index(conn)
+
+    async def _embed_query(self, text: str) -> list[float]:
+        if self._executor is None or self.model_id is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+        cache = self.embedding_cache
+        if cache is not None:
+            cached = cache.get(self.model_id, text)
+            if cached is not None:
+                return cached
+        # The cache table holds document vectors; they only serve as query
+        # vectors for models that embed both the same way.
+        stored = (
+            await asyncio.to_thread(self._lookup_embeddings, [text])
+            if self.embedding_cache_table and self._executor.symmetric
+            else {}
+        )
+        vector = stored.get(text) or await self._executor.aembed_query(text)
+        if cache is not None:
+            cache.put(self.model_id, text, vector)
+        return vector
+
+    async def _embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries, sending all cache misses in one model call.
+
+        Misses go through ``embed_documents`` (and the cache table) only when
+        the model embeds queries like documents; otherwise each keeps its
+        ``embed_query`` vector.
+        """
+        if self._executor is None or self.model_id is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+        cache = self.embedding_cache
+        vectors: dict[str, list[float]] = {}
+        if cache is not None:
+            for text in texts:
+                cached = cache.get(self.model_id, text)
+                if cached is not None:
+                    vectors[text] = cached
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            embedded = (
+                await self._embed_documents(missing)
+                if self._executor.symmetric
+                else await self._executor.aembed_queries(missing)
+            )
+            for text, vector in zip(missing, embedded):
+                vectors[text] = vector
+                if cache is not None:
+                    cache.put(self.model_id, text, vector)
+        return [vectors[text] for text in texts]
+
+    async def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts``, taking vectors already in the embedding cache table.
+
+        Stored vectors are looked up in one query; only the misses reach the
+        model, in one ``embed_documents`` call. New vectors are written back
+        by the inserts that store them (see ``_cache_embeddings``).
+        """
+        if self._executor is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+        if not texts:
+            return []
+        vectors = (
+            await asyncio.to_thread(self._lookup_embeddings, texts)
+            if self.embedding_cache_table
+            else {}
+        )
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            vectors.update(zip(missing, await self._executor.aembed_documents(missing)))
+        return [vectors[text] for text in texts]
+
+    def _lookup_embeddings(self, texts: list[str]) -> dict[str, list[float]]:
+        by_hash: dict[str, list[str]] = {}
+        for text in texts:
+            by_hash.setdefault(content_hash(text), []).append(text)
+        try:
+            rows = self.conn.execute(
+                f"SELECT content_hash, vector FROM {EMBEDDING_CACHE_TABLE} "
+                f"WHERE model_id = ? AND content_hash IN (SELECT unnest(?::VARCHAR[]))",
+                [self.model_id, list(by_hash)],
+            ).fetchall()
+        except duckdb.Error as e:
+            logging.warning(f"Embedding cache lookup failed: {e}")
+            return {}
+        return {text: vector for key, vector in rows for text in by_hash[key]}
+
+    def _cache_embeddings(
+        self, conn: duckdb.DuckDBPyConnection, ids: list[str]
+    ) -> None:
+        """Store the embeddings of just-inserted rows under their text hash."""
+        if not self.embedding_cache_table or not self.model_id:
+            return
+        conn.execute(
+            f"INSERT INTO {EMBEDDING_CACHE_TABLE} "
+            f"(model_id, content_hash, vector) "
+            f"SELECT ?, sha256(text), embedding::FLOAT[] FROM {self._rows} "
+            f"WHERE id IN (SELECT unnest(?::VARCHAR[])) "
+            f"ON CONFLICT DO NOTHING",
+            [self.model_id, ids],
+        )
+        self._prune_embedding_cache(conn)
+
+    def _prune_embedding_cache(self, conn: duckdb.DuckDBPyConnection) -> int:
+        """Drop the oldest cached vectors once the table exceeds its row cap.
+
+        It is cut to 90% of ``embedding_cache_max_rows`` so that the delete
+        runs once per many inserts rather than on every one.
+        """
+        limit = self.embedding_cache_max_rows
+        if not limit:
+            return 0
+        count = _one(conn.execute(f"SELECT count(*) FROM {EMBEDDING_CACHE_TABLE}"))[0]
+        if count <= limit:
+            return 0
+        return _one(
+            conn.execute(
+                f"DELETE FROM {EMBEDDING_CACHE_TABLE} WHERE rowid IN ("
+                f"SELECT rowid FROM {EMBEDDING_CACHE_TABLE} "
+                f"ORDER BY cached_at DESC OFFSET ?)",
+                [limit * 9 // 10],
+            )
+        )[0]
+
+    def _uncache_rows(self, conn: duckdb.DuckDBPyConnection, ids: list[str]) -> None:
+        """Drop cached vectors of rows about to be evicted.
+
+        Texts that another row of the collection still holds keep theirs.
+        """
+        if not self.embedding_cache_table or not self.model_id or not ids:
+            return
+        conn.execute(
+            f"""
+            DELETE FROM {EMBEDDING_CACHE_TABLE}
+            WHERE model_id = ? AND content_hash IN (
+                SELECT sha256(text) FROM {self._rows}
+                WHERE id IN (SELECT unnest(?::VARCHAR[]))
+                EXCEPT
+                SELECT sha256(text) FROM {self._rows}
+                WHERE id NOT IN (SELECT unnest(?::VARCHAR[]))
+            )
+            """,
+            [self.model_id, ids, ids],
+        )
+
     def _parse_json(self, val: Any) -> Any:
         if isinstance(val, str):
             return json.loads(val)
         return val if val is not None else []
 
+    def _insert_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        ids: list[str],
+        texts: list[str],
+        tags_list: list[list[str]],
+        vectors: list[list[float]],
+    ) -> None:
+        """Insert a batch of rows with one columnar statement.
+
+        Ids, texts and tags travel as a single JSON document and the vectors
+        as one flat float32 NumPy buffer; binding them as Python lists would
+        convert every element individually.
+        """
+        dim = self.embed_dim or 0
+        flat = np.asarray(vectors, dtype=np.float32).reshape(-1)
+        if flat.size != len(ids) * dim:
+            raise ValueError(f"Expected {len(ids)} vectors of dim {dim}")
+        payload = json.dumps(
+            [{"id": i, "text": t, "tags": g} for i, t, g in zip(ids, texts, tags_list)]
+        )
+        bits_column, bits_value = (
+            (", embedding_bits", f", {_sign_bits_sql('v.embedding')}")
+            if self._has_sign_bits
+            else ("", "")
+        )
+        partition_columns, partition_values = self._partition_insert()
+        conn.register("_mao_batch_vectors", flat)
+        try:
+            conn.execute(
+                f"""
+                INSERT INTO {self._table}
+                    (id, text, tags, embedding{bits_column}{partition_columns})
+                SELECT r.row.id, r.row.text, r.row.tags,
+                       v.embedding{bits_value}{partition_values}
+                FROM (
+                    SELECT unnest(rows) AS row, generate_subscripts(rows, 1) - 1 AS pos
+                    FROM (
+                        SELECT from_json(
+                            ?, '[{{"id": "VARCHAR", "text": "VARCHAR", "tags": ["VARCHAR"]}}]'
+                        ) AS rows
+                    )
+                ) r
+                JOIN (
+                    SELECT g.range // {dim} AS pos,
+                           list(f.column0 ORDER BY g.range)::FLOAT[{dim}] AS embedding
+                    FROM _mao_batch_vectors f POSITIONAL JOIN range({flat.size}) g
+                    GROUP BY 1
+                ) v USING (pos)
+                """,
+                [payload],
+            )
+            self._mark_text_changed()
+            self._cache_embeddings(conn, ids)
+            self._index_rows(ids, flat)
+        finally:
+            conn.unregister("_mao_batch_vectors")
+
+    def _index_rows(self, ids: list[str], vectors: np.ndarray) -> None:
+        """Mirror inserted rows into the warm in-memory index, if any.
+
+        Called with the writer held, like every other index mutation, so a
+        concurrent build cannot miss them.
+        """
+        index = self._db.vector_indexes.get(self.collection_name)
+        if index is None:
+            return
+        if len(index) + len(ids) > self.memory_index_max_rows:
+            self._db.vector_indexes[self.collection_name] = None
+            logging.info(
+                f"'{self.collection_name}' outgrew its in-memory index; "
+                f"searching in DuckDB"
+            )
+            return
+        index.upsert(ids, vectors)
+        self._db.vector_indexes.charge(self.collection_name)
+
+    def _unindex_rows(self, ids: list[str] | None = None) -> None:
+        """Drop deleted rows from the in-memory index; ``None`` drops the index.
+
+        A collection marked too large is re-evaluated on the next search
+        since deletions may have brought it under the limit.
+        """
+        index = self._db.vector_indexes.get(self.collection_name)
+        if ids is None or index is None:
+            self._db.vector_indexes.pop(self.collection_name, None)
+        elif ids:
+            index.remove(ids)
+
+    def _warm_memory_index(self) -> MemoryVectorIndex | None:
+        """Return the collection's in-memory index, building it if it is cold.
+
+        The build loads every embedding under the writer so no insert or
+        delete slips in between; if the writer is busy the search simply
+        runs in DuckDB this time. A ready HNSW index or binary quantization
+        takes precedence, since they were enabled for this collection.
+        """
+        table = self.collection_name
+        indexes = self._db.vector_indexes
+        if self._hnsw_ready or (self.quantization == "binary" and self._has_sign_bits):
+            indexes.pop(table, None)
+            return None
+        if not self.memory_index or not self.embed_dim:
+            return None
+        if table in indexes:
+            return indexes[table]
+        with self._db.try_write() as conn:
+            if conn is None:
+                return None
+            if table in indexes:
+                return indexes[table]
+            count = _one(conn.execute(f"SELECT count(*) FROM {self._rows}"))[0]
+            if count > self.memory_index_max_rows:
+                indexes[table] = None
+                return None
+            started = time.perf_counter()
+            index = MemoryVectorIndex(self.embed_dim, capacity=max(1024, count))
+            if count:
+                rows = conn.execute(
+                    f"SELECT id, embedding FROM {self._rows}"
+                ).fetchnumpy()
+                index.upsert(list(rows["id"]), np.stack(list(rows["embedding"])))
+            indexes[table] = index
+            logging.info(
+                f"Loaded {count} vectors of '{table}' into memory "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+            return index
+
+    def _memory_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        index: MemoryVectorIndex,
+        vectors: list[list[float]],
+        k: int,
+    ) -> list[list[tuple[Any, ...]]]:
+        """Top-k per query from the in-memory index; text and tags in one query."""
+        hits = index.search_many(vectors, k)
+        hit_ids = list({row_id for query_hits in hits for row_id, _ in query_hits})
+        if not hit_ids:
+            return [[] for _ in hits]
+        rows = {
+            row[0]: row
+            for row in conn.execute(
+                f"SELECT id, text, tags FROM {self._rows} "
+                f"WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+                [hit_ids],
+            ).fetchall()
+        }
+        return [
+            [
+                (row_id, rows[row_id][1], rows[row_id][2], score)
+                for row_id, score in query_hits
+                if row_id in rows
+            ]
+            for query_hits in hits
+        ]
+
     async def add_entry_async(self, text: str, tags: list[str] | None = None) -> str:
         if self.embed is None or self.embed_dim is None:
             raise RuntimeError("Embeddings not initialized. Call async_init() first.")
         point_id = str(uuid.uuid4())
-        vector = self.embed.embed_query(text)
-        try:
-            self.conn.execute(
-                f"INSERT INTO {self.collection_name} VALUES (?, ?, ?, ?, ?)",
-                [point_id, text, json.dumps(tags or []), json.dumps([]), vector],
+        vector = await self._embed_query(text)
+        bits_column, bits_value = (
+            (", embedding_bits", ", ?::BIT") if self._has_sign_bits else ("", "")
+        )
+        partition_columns, partition_values = self._partition_insert()
+        params = [point_id, text, list(tags or []), _vector_param(vector)]
+        if self._has_sign_bits:
+            params.append(_sign_bits_param(vector))
+
+        def insert(conn: duckdb.DuckDBPyConnection) -> None:
+            conn.execute(
+                f"INSERT INTO {self._table} "
+                f"(id, text, tags, embedding{bits_column}{partition_columns}) "
+                f"VALUES (?, ?, ?, ?::FLOAT[{self.embed_dim}]"
+                f"{bits_value}{partition_values})",
+                params,
             )
+            self._mark_text_changed()
+            self._cache_embeddings(conn, [point_id])
+            self._index_rows([point_id], np.asarray(vector, dtype=np.float32))
+            # The insert crossing hnsw_min_rows builds the whole index.
+            self._maybe_build_hnsw_index(conn)
+
+        try:
+            async with self._db.write_async() as conn:
+                await asyncio.to_thread(insert, conn)
+            self._schedule_retention()
             return point_id
         except Exception as e:
             raise VectorStoreError(f"Failed to add entry: {e}") from e
 
-    async def search_async(self, query: str, k: int = 3) -> list[SearchResult]:
+    @staticmethod
+    def _tag_filter(
+        tags_any: list[str] | None = None, tags_all: list[str] | None = None
+    ) -> tuple[str, list[Any]]:
+        """Build a ``WHERE`` clause restricting rows by their tags."""
+        clauses: list[str] = []
+        params: list[Any] = []
+        if tags_any:
+            clauses.append("list_has_any(tags, ?::VARCHAR[])")
+            params.append(list(tags_any))
+        if tags_all:
+            clauses.append("list_has_all(tags, ?::VARCHAR[])")
+            params.append(list(tags_all))
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _search_rows(
+        self,
+        vector: list[float],
+        k: int,
+        use_index: bool | None = None,
+        tags_any: list[str] | None = None,
+        tags_all: list[str] | None = None,
+        conn: duckdb.DuckDBPyConnection | None = None,
+        query_text: str | None = None,
+        hybrid: bool | None = None,
+        mmr: bool | None = None,
+    ) -> list[tuple[Any, ...]]:
+        """Return ``(id, text, tags, relations, score)`` rows for the top-k matches.
+
+        Unfiltered searches that leave ``use_index`` unset are answered from
+        the collection's in-memory matrix while it fits in
+        ``memory_index_max_rows`` and the process-wide memory index budget,
+        unless an HNSW index is ready or binary quantization is on; see
+        ``_warm_memory_index``. Otherwise:
+
+        The HNSW path orders by ``array_cosine_distance`` so DuckDB's VSS
+        optimizer can replace the scan with an index lookup. The binary path
+        shortlists ``k * rerank_factor`` rows by Hamming distance over
+        ``embedding_bits`` and re-ranks them exactly; the exact path scores
+        every row.
+
+        Tag filters are applied in SQL before ranking. The index returns its
+        top-k before any filter, so filtered searches skip it and only score
+        the matching rows. ``conn`` defaults to the calling thread's read
+        cursor, so searches on worker threads run in parallel.
+
+        In hybrid mode (``hybrid``, defaulting to ``hybrid_search``) with a
+        ``query_text``, BM25 and cosine rankings are fused instead; see
+        ``_hybrid_rows``.
+
+        In MMR mode (``mmr``, defaulting to ``self.mmr``) the chosen path
+        returns ``mmr_candidates`` rows from which a diverse top-k is
+        picked; see ``_mmr_rows``.
+        """
+        conn = conn or self.conn
+        if hybrid is None:
+            hybrid = self.hybrid_search
+        if mmr is None:
+            mmr = self.mmr
+        fetch_k = max(k, self.mmr_candidates) if mmr else k
+        rows: list[tuple[Any, ...]] | None = None
+        if hybrid and query_text and self._ensure_fts_index():
+            try:
+                rows = self._hybrid_rows(
+                    conn, query_text, vector, fetch_k, tags_any, tags_all
+                )
+            except duckdb.Error as e:
+                logging.warning(
+                    f"Hybrid search failed in '{self.collection_name}', "
+                    f"falling back to vector search: {e}"
+                )
+        if rows is None:
+            rows = self._ranked_rows(
+                conn, vector, fetch_k, use_index, tags_any, tags_all
+            )
+        if mmr and len(rows) > k:
+            rows = self._mmr_rows(conn, vector, rows, k)
+        relations = self._relations_for([row[0] for row in rows], conn)
+        self._record_hits([row[0] for row in rows])
+        return [
+            (row_id, text, tags, relations.get(row_id, []), score)
+            for row_id, text, tags, score in rows
+        ]
+
+    def _ranked_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        vector: list[float],
+        k: int,
+        use_index: bool | None,
+        tags_any: list[str] | None,
+        tags_all: list[str] | None,
+    ) -> list[tuple[Any, ...]]:
+        where, filter_params = self._tag_filter(tags_any, tags_all)
+        if use_index is None and not where:
+            index = self._warm_memory_index()
+            if index is not None:
+                return self._memory_rows(conn, index, [vector], k)[0]
+        if use_index is None:
+            use_index = self._hnsw_ready
+        if use_index and not where:
+            try:
+                return conn.execute(
+                    f"""
+                    SELECT id, text, tags, 1 - distance AS score
+                    FROM (
+                        SELECT id, text, tags,
+                               array_cosine_distance(embedding, ?::FLOAT[{self.embed_dim}]) AS distance
+                        FROM {self._rows}
+                        ORDER BY distance
+                        LIMIT ?
+                    )
+                    """,
+                    [_vector_param(vector), k],
+                ).fetchall()
+            except duckdb.Error as e:
+                logging.warning(
+                    f"HNSW search failed in '{self.collection_name}', "
+                    f"falling back to exact scan: {e}"
+                )
+                self._hnsw_ready = False
+        if self.quantization == "binary" and self._has_sign_bits:
+            try:
+                return conn.execute(
+                    f"""
+                    WITH candidates AS (
+                        SELECT id, text, tags, embedding
+                        FROM {self._rows}
+                        {where}
+                        ORDER BY bit_count(xor(embedding_bits, ?::BIT))
+                        LIMIT ?
+                    )
+                    SELECT id, text, tags,
+                           array_cosine_similarity(embedding, ?::FLOAT[{self.embed_dim}]) AS score
+                    FROM candidates
+                    ORDER BY score DESC
+                    LIMIT ?
+                    """,
+                    [
+                        *filter_params,
+                        _sign_bits_param(vector),
+                        k * max(1, self.rerank_factor),
+                        _vector_param(vector),
+                        k,
+                    ],
+                ).fetchall()
+            except duckdb.Error as e:
+                logging.warning(
+                    f"Quantized search failed in '{self.collection_name}', "
+                    f"falling back to exact scan: {e}"
+                )
+        return conn.execute(
+            f"""
+            SELECT id, text, tags,
+                   array_cosine_similarity(embedding, ?::FLOAT[{self.embed_dim}]) as score
+            FROM {self._rows}
+            {where}
+            ORDER BY score DESC
+            LIMIT ?
+            """,
+            [_vector_param(vector), *filter_params, k],
+        ).fetchall()
+
+    def _mmr_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        vector: list[float],
+        rows: list[tuple[Any, ...]],
+        k: int,
+    ) -> list[tuple[Any, ...]]:
+        """Re-pick ``k`` of the candidate ``rows`` by maximal marginal relevance.
+
+        Candidate embeddings are loaded in one query; rows keep their
+        original score and come back in pick order.
+        """
+        data = conn.execute(
+            f"SELECT id, embedding FROM {self._rows} "
+            f"WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+            [[row[0] for row in rows]],
+        ).fetchnumpy()
+        embeddings = dict(zip(data["id"], data["embedding"]))
+        rows = [row for row in rows if row[0] in embeddings]
+        if not rows:
+            return []
+        picked = mmr_select(
+            vector,
+            np.stack([embeddings[row[0]] for row in rows]),
+            k,
+            self.mmr_lambda,
+        )
+        return [rows[i] for i in picked]
+
+    def _hybrid_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        query_text: str,
+        vector: list[float],
+        k: int,
+        tags_any: list[str] | None,
+        tags_all: list[str] | None,
+    ) -> list[tuple[Any, ...]]:
+        """Fuse BM25 and cosine rankings with reciprocal rank fusion in one query.
+
+        Each ranking contributes its top ``hybrid_candidates`` rows and a row
+        scores ``sum(1 / (rrf_k + rank))`` over the rankings it appears in, so
+        exact identifiers found by BM25 surface even when the embedding
+        misses them. The returned score is the fused RRF score.
+        """
+        where, filter_params = self._tag_filter(tags_any, tags_all)
+        candidates = max(k, self.hybrid_candidates)
+        return conn.execute(
+            f"""
+            WITH dense AS (
+                SELECT id, row_number() OVER (
+                    ORDER BY array_cosine_similarity(embedding, ?::FLOAT[{self.embed_dim}]) DESC
+                ) AS rnk
+                FROM {self._rows}
+                {where}
+                ORDER BY rnk
+                LIMIT ?
+            ),
+            sparse AS (
+                SELECT id, row_number() OVER (ORDER BY bm25 DESC) AS rnk
+                FROM (
+                    SELECT id, {self._fts_schema}.match_bm25(id, ?) AS bm25
+                    FROM {self._rows}
+                    {where}
+                )
+                WHERE bm25 IS NOT NULL
+                ORDER BY rnk
+                LIMIT ?
+            ),
+            fused AS (
+                SELECT id,
+                       coalesce(1.0 / (? + dense.rnk), 0)
+                       + coalesce(1.0 / (? + sparse.rnk), 0) AS score
+                FROM dense FULL OUTER JOIN sparse USING (id)
+            )
+            SELECT t.id, t.text, t.tags, fused.score
+            FROM fused JOIN {self._rows} t USING (id)
+            ORDER BY fused.score DESC, t.id
+            LIMIT ?
+            """,
+            [
+                _vector_param(vector),
+                *filter_params,
+                candidates,
+                query_text,
+                *filter_params,
+                candidates,
+                self.rrf_k,
+                self.rrf_k,
+                k,
+            ],
+        ).fetchall()
+
+    async def search_async(
+        self,
+        query: str,
+        k: int = 3,
+        tags_any: list[str] | None = None,
+        tags_all: list[str] | None = None,
+        hybrid: bool | None = None,
+        mmr: bool | None = None,
+    ) -> list[SearchResult]:
+        """Return the ``k`` entries most similar to ``query``.
+
+        ``tags_any`` keeps entries carrying at least one of the given tags and
+        ``tags_all`` those carrying every one of them. ``hybrid`` and ``mmr``
+        override the store's ``hybrid_search`` and ``mmr`` settings for this
+        call.
+        """
         if self.embed is None:
             raise RuntimeError("Embeddings not initialized. Call async_init() first.")
         try:
-            vector = self.embed.embed_query(query)
-            rows = self.conn.execute(
+            vector = await self._embed_query(query)
+            rows = await asyncio.to_thread(
+                self._search_rows,
+                vector,
+                k,
+                tags_any=tags_any,
+                tags_all=tags_all,
+                query_text=query,
+                hybrid=hybrid,
+                mmr=mmr,
+            )
+
+            return [
+                SearchResult(
+                    id=row[0],
+                    score=row[4] if row[4] is not None else 0.0,
+                    page_content=row[1] or "",
+                    tags=self._parse_json(row[2]),
+                    relations=self._parse_json(row[3]),
+                )
+                for row in rows
+            ]
+        except Exception as e:
+            logging.error(f"Search failed in '{self.collection_name}': {e}")
+            return []
+
+    def _search_many_rows(
+        self,
+        vectors: list[list[float]],
+        k: int,
+        tags_any: list[str] | None = None,
+        tags_all: list[str] | None = None,
+    ) -> list[list[tuple[Any, ...]]]:
+        """``_search_rows`` for many query vectors at once.
+
+        Scores every query with one matrix product on the in-memory index
+        when it is warm and no tag filter applies, otherwise with a single
+        statement joining the collection against a table of query vectors.
+        """
+        conn = self.conn
+        where, filter_params = self._tag_filter(tags_any, tags_all)
+        index = None if where else self._warm_memory_index()
+        if index is not None:
+            per_query = self._memory_rows(conn, index, vectors, k)
+        else:
+            per_query = [[] for _ in vectors]
+            rows = conn.execute(
                 f"""
-                SELECT id, text, tags, relations,
-                       array_cosine_similarity(embedding, ?::FLOAT[{self.embed_dim}]) as score
-                FROM {self.collection_name}
-                ORDER BY score DESC
-                LIMIT ?
+                SELECT qi, id, text, tags, score
+                FROM (
+                    SELECT q.qi, c.id, c.text, c.tags,
+                           array_cosine_similarity(c.embedding, q.v) AS score
+                    FROM {self._rows} c,
+                         (
+                             SELECT unnest(vs) AS v, generate_subscripts(vs, 1) - 1 AS qi
+                             FROM (SELECT ?::FLOAT[{self.embed_dim}][] AS vs)
+                         ) q
+                    {where}
+                )
+                QUALIFY row_number() OVER (PARTITION BY qi ORDER BY score DESC, id) <= ?
+                ORDER BY qi, score DESC, id
                 """,
-                [vector, k],
+                [
+                    "[" + ",".join(_vector_param(v) for v in vectors) + "]",
+                    *filter_params,
+                    k,
+                ],
             ).fetchall()
+            for qi, *row in rows:
+                per_query[qi].append(tuple(row))
+        hit_ids = list({row[0] for rows in per_query for row in rows})
+        relations = self._relations_for(hit_ids, conn)
+        self._record_hits(hit_ids)
+        return [
+            [
+                (row_id, text, tags, relations.get(row_id, []), score)
+                for row_id, text, tags, score in rows
+            ]
+            for rows in per_query
+        ]
 
+    async def search_many_async(
+        self,
+        queries: Sequence[str],
+        k: int = 3,
+        tags_any: list[str] | None = None,
+        tags_all: list[str] | None = None,
+    ) -> list[list[SearchResult]]:
+        """Return the top ``k`` entries for each of ``queries``, in order.
+
+        All queries are embedded with one model call and scored together;
+        see ``_search_many_rows``. Tag filters apply to every query.
+        """
+        if self.embed is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+        if not queries:
+            return []
+        try:
+            vectors = await self._embed_queries(list(queries))
+            per_query = await asyncio.to_thread(
+                self._search_many_rows, vectors, k, tags_any, tags_all
+            )
+            return [
+                [
+                    SearchResult(
+                        id=row[0],
+                        score=row[4] if row[4] is not None else 0.0,
+                        page_content=row[1] or "",
+                        tags=self._parse_json(row[2]),
+                        relations=self._parse_json(row[3]),
+                    )
+                    for row in rows
+                ]
+                for rows in per_query
+            ]
+        except Exception as e:
+            logging.error(f"Batch search failed in '{self.collection_name}': {e}")
+            return [[] for _ in queries]
+
+    def _neighbor_rows(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        hit_ids: list[str],
+        rel_types: list[str] | None,
+        hops: int,
+    ) -> dict[str, list[NeighborResult]]:
+        """Entries within ``hops`` outgoing edges of each hit, from one recursive query.
+
+        Every neighbor is listed once per hit, with the length of its
+        shortest path as ``depth`` and the type of the edge reaching it on
+        that path, ordered by depth.
+        """
+        if not hit_ids or hops <= 0:
+            return {}
+        rows = conn.execute(
+            f"""
+            WITH RECURSIVE walk(hit, id, type, depth) AS (
+                SELECT source, target, type, 1
+                FROM {self._edges_table}
+                WHERE source IN (SELECT unnest(?::VARCHAR[]))
+                  AND (?::VARCHAR[] IS NULL OR list_contains(?::VARCHAR[], type))
+                UNION
+                SELECT w.hit, e.target, e.type, w.depth + 1
+                FROM walk w
+                JOIN {self._edges_table} e ON e.source = w.id
+                WHERE w.depth < ?
+                  AND (?::VARCHAR[] IS NULL OR list_contains(?::VARCHAR[], e.type))
+            )
+            SELECT w.hit, t.id, t.text, t.tags,
+                   arg_min(w.type, w.depth) AS type, min(w.depth) AS depth
+            FROM walk w
+            JOIN {self._rows} t ON t.id = w.id
+            WHERE w.id <> w.hit
+            GROUP BY w.hit, t.id, t.text, t.tags
+            ORDER BY w.hit, depth, t.id
+            """,
+            [list(hit_ids), rel_types, rel_types, hops, rel_types, rel_types],
+        ).fetchall()
+        neighbors: dict[str, list[NeighborResult]] = {}
+        for hit, row_id, text, tags, rel_type, depth in rows:
+            neighbors.setdefault(hit, []).append(
+                NeighborResult(
+                    id=row_id,
+                    page_content=text or "",
+                    tags=self._parse_json(tags),
+                    type=rel_type,
+                    depth=depth,
+                )
+            )
+        return neighbors
+
+    async def search_with_neighbors_async(
+        self,
+        query: str,
+        k: int = 3,
+        rel_types: list[str] | None = None,
+        hops: int = 1,
+        tags_any: list[str] | None = None,
+        tags_all: list[str] | None = None,
+    ) -> list[SearchResult]:
+        """``search_async`` with each hit's related entries as ``neighbors``.
+
+        After ranking, the entries reachable within ``hops`` edges of any
+        hit, optionally only along ``rel_types``, are fetched for all hits
+        at once by a single recursive statement joining the edge table with
+        the collection, on the same worker thread as the search.
+        """
+        if self.embed is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+
+        def run(vector: list[float]) -> tuple[list[tuple[Any, ...]], dict[str, Any]]:
+            conn = self.conn
+            rows = self._search_rows(
+                vector,
+                k,
+                tags_any=tags_any,
+                tags_all=tags_all,
+                conn=conn,
+                query_text=query,
+            )
+            return rows, self._neighbor_rows(
+                conn, [row[0] for row in rows], rel_types, hops
+            )
+
+        try:
+            vector = await self._embed_query(query)
+            rows, neighbors = await asyncio.to_thread(run, vector)
             return [
                 SearchResult(
                     id=row[0],
@@ -197,18 +1636,30 @@ class VectorStoreBase:
                     page_content=row[1] or "",
                     tags=self._parse_json(row[2]),
                     relations=self._parse_json(row[3]),
+                    neighbors=neighbors.get(row[0], []),
                 )
                 for row in rows
             ]
         except Exception as e:
-            logging.error(f"Search failed in '{self.collection_name}': {e}")
+            logging.error(f"Neighbor search failed in '{self.collection_name}': {e}")
             return []
 
     async def delete_entry_async(self, point_id: str) -> bool:
         try:
-            self.conn.execute(
-                f"DELETE FROM {self.collection_name} WHERE id = ?", [point_id]
-            )
+            # In the shared layout the edge table also holds other agents' edges.
+            owned = f" AND ? IN (SELECT id FROM {self._rows})" if self._shared else ""
+            async with self._db.write_async() as conn:
+                conn.execute(
+                    f"DELETE FROM {self._edges_table} "
+                    f"WHERE (source = ? OR target = ?){owned}",
+                    [point_id, point_id] + ([point_id] if self._shared else []),
+                )
+                conn.execute(
+                    f"DELETE FROM {self._table} WHERE {self._scope} AND id = ?",
+                    [point_id],
+                )
+                self._unindex_rows([point_id])
+            self._mark_text_changed()
             return True
         except Exception as e:
             logging.error(f"Failed to delete entry {point_id}: {e}")
@@ -217,7 +1668,7 @@ class VectorStoreBase:
     async def get_entry_async(self, point_id: str) -> dict[str, Any] | None:
         try:
             row = self.conn.execute(
-                f"SELECT id, text, tags, relations FROM {self.collection_name} WHERE id = ?",
+                f"SELECT id, text, tags FROM {self._rows} WHERE id = ?",
                 [point_id],
             ).fetchone()
             if not row:
@@ -227,92 +1678,221 @@ class VectorStoreBase:
                 "page_content": row[1] or "",
                 "text": row[1] or "",
                 "tags": self._parse_json(row[2]),
-                "relations": self._parse_json(row[3]),
+                "relations": self._relations_for([row[0]]).get(row[0], []),
             }
         except Exception as e:
             logging.error(f"Error retrieving entry {point_id}: {e}")
             return None
 
     async def clear_all_points_async(self) -> None:
-        self.conn.execute(f"DELETE FROM {self.collection_name}")
+        async with self._db.write_async() as conn:
+            self._delete_edges(conn)
+            conn.execute(f"DELETE FROM {self._table} WHERE {self._scope}")
+            self._unindex_rows()
+        self._mark_text_changed()
 
-    async def add_tag_async(self, point_id: str, tag: str) -> bool:
-        entry = await self.get_entry_async(point_id)
-        if not entry:
-            return False
-        tags = set(entry.get("tags", []))
-        tags.add(tag)
+    async def add_tag_async(self, point_id: str, tag: str) -> bool:
+        """Append ``tag`` unless present, in one statement; ``False`` if no entry."""
         try:
-            self.conn.execute(
-                f"UPDATE {self.collection_name} SET tags = ? WHERE id = ?",
-                [json.dumps(list(tags)), point_id],
-            )
-            return True
+            async with self._db.write_async() as conn:
+                updated = _one(
+                    conn.execute(
+                        f"UPDATE {self._table} SET tags = CASE "
+                        f"WHEN list_contains(tags, ?) THEN tags "
+                        f"ELSE list_append(coalesce(tags, []::VARCHAR[]), ?) END "
+                        f"WHERE {self._scope} AND id = ?",
+                        [tag, tag, point_id],
+                    )
+                )[0]
+            return updated > 0
         except Exception as e:
             logging.error(f"Failed to add tag to {point_id}: {e}")
             return False
 
+    async def add_tags_bulk_async(self, pairs: Sequence[tuple[str, str]]) -> int:
+        """Add many ``(entry id, tag)`` pairs with one ``UPDATE``.
+
+        Each entry's new tags are appended once, in the order given, after
+        the tags it already has. Ids not in the collection are skipped.
+        Returns the number of entries updated.
+        """
+        if not pairs:
+            return 0
+        ids = [point_id for point_id, _ in pairs]
+        table = self._table
+        try:
+            async with self._db.write_async() as conn:
+                return _one(
+                    conn.execute(
+                        f"""
+                    UPDATE {table}
+                    SET tags = list_concat(
+                        coalesce({table}.tags, []::VARCHAR[]),
+                        list_filter(
+                            added.tags,
+                            tag -> NOT list_contains(coalesce({table}.tags, []), tag)
+                        )
+                    )
+                    FROM (
+                        SELECT id, list(tag ORDER BY pos) AS tags
+                        FROM (
+                            SELECT id, tag, min(pos) AS pos
+                            FROM (
+                                SELECT unnest(?::VARCHAR[]) AS id,
+                                       unnest(?::VARCHAR[]) AS tag,
+                                       unnest(range(?)) AS pos
+                            )
+                            GROUP BY id, tag
+                        )
+                        GROUP BY id
+                    ) added
+                    WHERE {self._scope} AND {table}.id = added.id
+                    """,
+                        [ids, [tag for _, tag in pairs], len(pairs)],
+                    )
+                )[0]
+        except Exception as e:
+            raise VectorStoreError(f"Failed to add {len(pairs)} tags: {e}") from e
+
     async def get_tags_async(self, point_id: str) -> list[str]:
         entry = await self.get_entry_async(point_id)
         return entry.get("tags", []) if entry else []
 
+    def _relations_for(
+        self, ids: list[str], conn: duckdb.DuckDBPyConnection | None = None
+    ) -> dict[str, list[dict[str, Any]]]:
+        """Fetch the outgoing edges of several entries with one query."""
+        if not ids:
+            return {}
+        rows = (
+            (conn or self.conn)
+            .execute(
+                f"SELECT source, target, type FROM {self._edges_table} "
+                f"WHERE source IN (SELECT unnest(?::VARCHAR[])) ORDER BY rowid",
+                [list(ids)],
+            )
+            .fetchall()
+        )
+        relations: dict[str, list[dict[str, Any]]] = {}
+        for source, target, rel_type in rows:
+            relations.setdefault(source, []).append({"id": target, "type": rel_type})
+        return relations
+
     async def add_relation_async(
         self, from_id: str, to_id: str, rel_type: str = "related"
     ) -> bool:
-        entry = await self.get_entry_async(from_id)
-        if not entry:
-            return False
-        rels = entry.get("relations", [])
-        if not any(r.get("id") == to_id and r.get("type") == rel_type for r in rels):
-            rels.append({"id": to_id, "type": rel_type})
-            try:
-                self.conn.execute(
-                    f"UPDATE {self.collection_name} SET relations = ? WHERE id = ?",
-                    [json.dumps(rels), from_id],
-                )
+        """Add an edge in one statement; ``False`` if ``from_id`` is not stored here.
+
+        The existence check is part of the ``INSERT``, so an entry deleted
+        concurrently cannot be left with a dangling edge. Adding an edge that
+        already exists returns ``True`` and keeps its position.
+        """
+        try:
+            async with self._db.write_async() as conn:
+                added = _one(
+                    conn.execute(
+                        f"INSERT INTO {self._edges_table} (source, target, type) "
+                        f"SELECT id, ?, ? FROM {self._rows} WHERE id = ? "
+                        f"ON CONFLICT DO NOTHING",
+                        [to_id, rel_type, from_id],
+                    )
+                )[0]
+            if added:
                 return True
-            except Exception as e:
-                logging.error(f"Failed to add relation {from_id} -> {to_id}: {e}")
-                return False
-        return True
+            return (
+                self.conn.execute(
+                    f"SELECT 1 FROM {self._edges_table} "
+                    f"WHERE source = ? AND target = ? AND type = ?",
+                    [from_id, to_id, rel_type],
+                ).fetchone()
+                is not None
+            )
+        except Exception as e:
+            logging.error(f"Failed to add relation {from_id} -> {to_id}: {e}")
+            return False
 
     async def get_relations_async(
         self, point_id: str, rel_type: str | None = None
     ) -> list[dict[str, Any]]:
-        entry = await self.get_entry_async(point_id)
-        if not entry:
-            return []
-        rels = entry.get("relations", [])
-        if rel_type:
-            return [r for r in rels if r.get("type") == rel_type]
-        return rels
+        rows = self.conn.execute(
+            f"SELECT target, type FROM {self._edges_table} "
+            f"WHERE source = ? AND (?::VARCHAR IS NULL OR type = ?) ORDER BY rowid",
+            [point_id, rel_type, rel_type],
+        ).fetchall()
+        return [{"id": target, "type": t} for target, t in rows]
+
+    async def get_incoming_relations_async(
+        self, point_id: str, rel_type: str | None = None
+    ) -> list[dict[str, Any]]:
+        """Return the edges pointing at ``point_id`` as ``{"id", "type"}`` dicts."""
+        rows = self.conn.execute(
+            f"SELECT source, type FROM {self._edges_table} "
+            f"WHERE target = ? AND (?::VARCHAR IS NULL OR type = ?) ORDER BY rowid",
+            [point_id, rel_type, rel_type],
+        ).fetchall()
+        return [{"id": source, "type": t} for source, t in rows]
 
     async def remove_relation_async(
         self, from_id: str, to_id: str, rel_type: str | None = None
     ) -> bool:
-        entry = await self.get_entry_async(from_id)
-        if not entry:
+        """Delete the edges ``from_id -> to_id``, of ``rel_type`` if given, at once.
+
+        Returns whether an edge of an entry in this collection was removed.
+        """
+        try:
+            async with self._db.write_async() as conn:
+                removed = _one(
+                    conn.execute(
+                        f"DELETE FROM {self._edges_table} "
+                        f"WHERE source = ? AND target = ? "
+                        f"AND (?::VARCHAR IS NULL OR type = ?) "
+                        f"AND source IN (SELECT id FROM {self._rows})",
+                        [from_id, to_id, rel_type, rel_type],
+                    )
+                )[0]
+            return removed > 0
+        except Exception as e:
+            logging.error(f"Failed to remove relation {from_id} -> {to_id}: {e}")
             return False
-        rels = entry.get("relations", [])
-        new_rels = [
-            r
-            for r in rels
-            if not (
-                r.get("id") == to_id
-                and (rel_type is None or r.get("type") == rel_type)
-            )
-        ]
-        if len(new_rels) < len(rels):
-            try:
-                self.conn.execute(
-                    f"UPDATE {self.collection_name} SET relations = ? WHERE id = ?",
-                    [json.dumps(new_rels), from_id],
-                )
-                return True
-            except Exception as e:
-                logging.error(f"Failed to remove relation {from_id} -> {to_id}: {e}")
-                return False
-        return True
+
+    async def add_relations_bulk_async(
+        self, relations: Sequence[tuple[str, str] | tuple[str, str, str]]
+    ) -> int:
+        """Add many ``(from_id, to_id[, rel_type])`` edges with one ``INSERT``.
+
+        ``rel_type`` defaults to ``"related"``. Edges whose source is not in
+        the collection and edges that already exist are skipped. Returns the
+        number of edges added.
+        """
+        if not relations:
+            return 0
+        sources, targets, types = [], [], []
+        for relation in relations:
+            sources.append(relation[0])
+            targets.append(relation[1])
+            types.append(relation[2] if len(relation) > 2 else "related")
+        try:
+            async with self._db.write_async() as conn:
+                return _one(
+                    conn.execute(
+                        f"""
+                    INSERT INTO {self._edges_table} (source, target, type)
+                    SELECT DISTINCT source, target, type
+                    FROM (
+                        SELECT unnest(?::VARCHAR[]) AS source,
+                               unnest(?::VARCHAR[]) AS target,
+                               unnest(?::VARCHAR[]) AS type
+                    )
+                    WHERE source IN (SELECT id FROM {self._rows})
+                    ON CONFLICT DO NOTHING
+                    """,
+                        [sources, targets, types],
+                    )
+                )[0]
+        except Exception as e:
+            raise VectorStoreError(
+                f"Failed to add {len(relations)} relations: {e}"
+            ) from e
 
     async def add_entries_batch_async(
         self, texts: list[str], tags_list: list[list[str]] | None = None
@@ -327,63 +1907,977 @@ class VectorStoreBase:
             raise RuntimeError("Embeddings not initialized. Call async_init() first.")
 
         point_ids = [str(uuid.uuid4()) for _ in range(len(texts))]
-        try:
-            vectors = list(self.embed.embed_documents(texts))
-            for i in range(0, len(texts), BATCH_SIZE):
-                for j in range(i, min(i + BATCH_SIZE, len(texts))):
-                    tags = tags_list[j] if tags_list else []
-                    self.conn.execute(
-                        f"INSERT INTO {self.collection_name} VALUES (?, ?, ?, ?, ?)",
-                        [point_ids[j], texts[j], json.dumps(tags), json.dumps([]), vectors[j]],
+        all_tags = tags_list or [[] for _ in texts]
+
+        def embed(start: int) -> "asyncio.Future[list[list[float]]] | None":
+            if start >= len(texts):
+                return None
+            return asyncio.ensure_future(
+                self._embed_documents(texts[start : start + BATCH_SIZE])
+            )
+
+        def insert(start: int, vectors: list[list[float]]) -> None:
+            end = start + BATCH_SIZE
+            with self._db.write() as conn:
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    self._insert_rows(
+                        conn,
+                        point_ids[start:end],
+                        texts[start:end],
+                        all_tags[start:end],
+                        vectors,
                     )
-            return point_ids
+                    conn.execute("COMMIT")
+                except BaseException:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except duckdb.Error:
+                        pass
+                    self._unindex_rows(point_ids[start:end])
+                    raise
+
+        def discard(ids: list[str]) -> None:
+            with self._db.write() as conn:
+                conn.execute(
+                    f"DELETE FROM {self._table} "
+                    f"WHERE {self._scope} AND id IN (SELECT unnest(?::VARCHAR[]))",
+                    [ids],
+                )
+                self._unindex_rows(ids)
+            self._mark_text_changed()
+
+        def finish() -> None:
+            with self._db.write() as conn:
+                self._maybe_build_hnsw_index(conn)
+
+        # Window N+1 is embedded while window N is inserted on a worker thread,
+        # so only one window of vectors is held and the writer, which other
+        # stores on the database share, is never held across an await. Each
+        # window commits on its own; a failure deletes the committed ones.
+        pending = embed(0)
+        inserted = 0
+        try:
+            while pending is not None:
+                vectors = await pending
+                pending = embed(inserted + BATCH_SIZE)
+                await asyncio.to_thread(insert, inserted, vectors)
+                inserted = min(inserted + BATCH_SIZE, len(texts))
+            await asyncio.to_thread(finish)
         except Exception as e:
+            if pending is not None:
+                pending.cancel()
+            if inserted:
+                try:
+                    await asyncio.to_thread(discard, point_ids[:inserted])
+                except duckdb.Error as cleanup:
+                    logging.error(
+                        f"Could not remove {inserted} rows of a failed batch "
+                        f"from '{self.collection_name}': {cleanup}"
+                    )
             raise VectorStoreError(f"Failed to add entries in batch: {e}") from e
+        self._schedule_retention()
+        return point_ids
+
+    def _record_hits(self, ids: list[str]) -> None:
+        """Buffer retrieved ids for ``last_hit_at``, written in batches."""
+        if not ids:
+            return
+        with self._hits_lock:
+            self._pending_hits.update(ids)
+            full = len(self._pending_hits) >= VECTOR_HIT_FLUSH_SIZE
+        if full:
+            self._flush_hits()
+
+    def _flush_hits(self, blocking: bool = False) -> None:
+        with self._hits_lock:
+            ids, self._pending_hits = list(self._pending_hits), set()
+        if not ids:
+            return
+        try:
+            writer = self._db.write() if blocking else self._db.try_write()
+            with writer as conn:
+                if conn is None:
+                    # The writer is busy; keep the hits for the next flush.
+                    with self._hits_lock:
+                        self._pending_hits.update(ids)
+                    return
+                conn.execute(
+                    f"UPDATE {self._table} SET last_hit_at = current_localtimestamp() "
+                    f"WHERE {self._scope} AND id IN (SELECT unnest(?::VARCHAR[]))",
+                    [ids],
+                )
+        except duckdb.Error as e:
+            logging.warning(
+                f"Could not record {len(ids)} hits in '{self.collection_name}': {e}"
+            )
+
+    def _retention_enabled(self) -> bool:
+        return bool(self.max_rows or self.max_age_seconds or self.max_bytes)
+
+    def _schedule_retention(self) -> None:
+        """Start a background retention pass unless one is already running."""
+        if not self._retention_enabled():
+            return
+        if self._retention_task is not None and not self._retention_task.done():
+            return
+        self._retention_task = asyncio.get_running_loop().create_task(
+            self.enforce_retention_async()
+        )
+        self._retention_task.add_done_callback(self._retention_done)
+
+    def _retention_done(self, task: "asyncio.Task[RetentionResult]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(
+                f"Retention failed in '{self.collection_name}': {task.exception()}"
+            )
+
+    def _excess_rows(self) -> int:
+        """Rows over ``max_rows`` or, by average row size, over ``max_bytes``.
+
+        Size is estimated from the vector width and text length rather than
+        DuckDB's block usage, which only shrinks after a checkpoint.
+        """
+        count, text_bytes = _one(
+            self.conn.execute(
+                f"SELECT count(*), coalesce(sum(strlen(text)), 0) FROM {self._rows}"
+            )
+        )
+        excess = count - self.max_rows if self.max_rows else 0
+        if self.max_bytes and count:
+            vector_bytes = 4 * (self.embed_dim or 0)
+            if self._has_sign_bits:
+                vector_bytes += ((self.embed_dim or 0) + 7) // 8
+            total = count * vector_bytes + text_bytes
+            if total > self.max_bytes:
+                row_bytes = total / count
+                excess = max(excess, -int(-(total - self.max_bytes) // row_bytes))
+        return max(0, excess)
+
+    def _evict_batch(
+        self, where: str, order_by: str, params: list[Any], limit: int
+    ) -> int:
+        with self._db.write() as conn:
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                ids = [
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT id FROM {self._rows} {where} "
+                        f"ORDER BY {order_by}, id LIMIT ?",
+                        [*params, limit],
+                    ).fetchall()
+                ]
+                if ids:
+                    self._uncache_rows(conn, ids)
+                    conn.execute(
+                        f"DELETE FROM {self._edges_table} "
+                        f"WHERE source IN (SELECT unnest(?::VARCHAR[])) "
+                        f"OR target IN (SELECT unnest(?::VARCHAR[]))",
+                        [ids, ids],
+                    )
+                    conn.execute(
+                        f"DELETE FROM {self._table} "
+                        f"WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+                        [ids],
+                    )
+                conn.execute("COMMIT")
+                self._unindex_rows(ids)
+                return len(ids)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def enforce_retention_async(self) -> RetentionResult:
+        """Evict rows beyond ``max_age_seconds``, ``max_rows`` and ``max_bytes``.
+
+        Expired rows go first. Remaining excess is evicted least recently
+        retrieved first (``eviction_policy = "lru"``, by ``last_hit_at``
+        falling back to ``created_at``) or oldest first (``"oldest"``). Each
+        batch of ``eviction_batch_size`` rows is its own short transaction on a
+        worker thread, so searches interleave with a long eviction.
+        """
+        table = self.collection_name
+        batch_size = max(1, self.eviction_batch_size)
+        order_by = (
+            "created_at"
+            if self.eviction_policy == "oldest"
+            else "coalesce(last_hit_at, created_at)"
+        )
+        result = RetentionResult(evicted=0, remaining=0)
+        try:
+            await asyncio.to_thread(self._flush_hits, True)
+            if self.max_age_seconds:
+                while True:
+                    evicted = await asyncio.to_thread(
+                        self._evict_batch,
+                        "WHERE created_at < current_localtimestamp() - to_seconds(?)",
+                        "created_at",
+                        [float(self.max_age_seconds)],
+                        batch_size,
+                    )
+                    result["evicted"] += evicted
+                    if evicted < batch_size:
+                        break
+            excess = await asyncio.to_thread(self._excess_rows)
+            while excess > 0:
+                evicted = await asyncio.to_thread(
+                    self._evict_batch, "", order_by, [], min(excess, batch_size)
+                )
+                if not evicted:
+                    break
+                result["evicted"] += evicted
+                excess -= evicted
+            remaining = await asyncio.to_thread(
+                lambda: self.conn.execute(
+                    f"SELECT count(*) FROM {self._rows}"
+                ).fetchone()
+            )
+            result["remaining"] = remaining[0] if remaining else 0
+        except Exception as e:
+            raise VectorStoreError(f"Retention in '{table}' failed: {e}") from e
+        if result["evicted"]:
+            self._mark_text_changed()
+            logging.info(
+                f"Evicted {result['evicted']} rows from '{table}', "
+                f"{result['remaining']} remain"
+            )
+        return result
 
     async def traverse_async(
         self, start_id: str, depth: int = 1, rel_types: list[str] | None = None
     ) -> list[dict[str, Any]]:
+        """Walk outgoing edges from ``start_id`` up to ``depth`` hops.
+
+        The walk is a single recursive query over the edge table. Each
+        reachable entry is returned once with the length of its shortest path
+        as ``depth``, ordered by depth.
+        """
         if depth <= 0:
             return []
-        visited_ids: set[str] = set()
-        queue: list[tuple[str, int]] = [(start_id, 0)]
-        result_nodes: list[dict[str, Any]] = []
-        processed_edges: set[tuple[str, str, str | None]] = set()
-        head = 0
-        while head < len(queue):
-            current_id, d = queue[head]
-            head += 1
-            if d > depth:
-                continue
-            if current_id not in visited_ids:
-                visited_ids.add(current_id)
-                current_entry = await self.get_entry_async(current_id)
-                if not current_entry:
-                    continue
-                current_entry["depth"] = d
-                result_nodes.append(current_entry)
-            if d < depth:
-                relations = await self.get_relations_async(current_id)
-                for rel in relations:
-                    target_id = rel.get("id")
-                    relation_type = rel.get("type")
-                    if not target_id:
-                        continue
-                    if rel_types is not None and relation_type not in rel_types:
-                        continue
-                    edge = (current_id, target_id, relation_type)
-                    if edge in processed_edges:
-                        continue
-                    processed_edges.add(edge)
-                    if target_id not in visited_ids:
-                        queue.append((target_id, d + 1))
-        return result_nodes
+        rows = self.conn.execute(
+            f"""
+            WITH RECURSIVE walk(id, depth) AS (
+                SELECT ?::VARCHAR, 0
+                UNION
+                SELECT e.target, w.depth + 1
+                FROM walk w
+                JOIN {self._edges_table} e ON e.source = w.id
+                WHERE w.depth < ?
+                  AND (?::VARCHAR[] IS NULL OR list_contains(?::VARCHAR[], e.type))
+            )
+            SELECT t.id, t.text, t.tags, min(w.depth) AS depth
+            FROM walk w
+            JOIN {self._rows} t ON t.id = w.id
+            GROUP BY t.id, t.text, t.tags
+            ORDER BY depth, t.id
+            """,
+            [start_id, depth, rel_types, rel_types],
+        ).fetchall()
+        relations = self._relations_for([row[0] for row in rows])
+        return [
+            {
+                "id": row_id,
+                "page_content": text or "",
+                "text": text or "",
+                "tags": self._parse_json(tags),
+                "relations": relations.get(row_id, []),
+                "depth": d,
+            }
+            for row_id, text, tags, d in rows
+        ]
+
+    async def export_collection_async(self, path: str) -> SnapshotResult:
+        """Write the collection to a Parquet snapshot with DuckDB's ``COPY``.
+
+        One row per entry carries id, text, tags, embedding, timestamps and
+        its outgoing relations as a list of ``{id, type}``. The embedding
+        model id and dimension are stored as Parquet key/value metadata so
+        ``import_collection_async`` can refuse mismatched vectors.
+        """
+        table = self.collection_name
+
+        def export() -> SnapshotResult:
+            conn = self.conn
+            dim = self._embedding_dim(conn) or self.embed_dim
+            metadata = {"collection": table, "dim": str(dim or "")}
+            model_id = self._stored_model_id(conn) or self.model_id
+            if model_id:
+                metadata["model_id"] = model_id
+            kv = ", ".join(
+                f"{key}: '{_sql_literal(value)}'" for key, value in metadata.items()
+            )
+            conn.execute(f"""
+                COPY (
+                    SELECT c.id, c.text, c.tags, c.embedding, c.created_at,
+                           c.last_hit_at, coalesce(r.relations, []) AS relations
+                    FROM {self._rows} c
+                    LEFT JOIN (
+                        SELECT source,
+                               list({{'id': target, 'type': type}} ORDER BY target, type)
+                                   AS relations
+                        FROM {self._edges_table}
+                        GROUP BY source
+                    ) r ON r.source = c.id
+                ) TO '{_sql_literal(path)}'
+                (FORMAT PARQUET, COMPRESSION ZSTD, KV_METADATA {{{kv}}})
+                """)
+            rows, relations = _one(
+                conn.execute(
+                    "SELECT count(*), coalesce(sum(len(relations)), 0) "
+                    "FROM read_parquet(?)",
+                    [path],
+                )
+            )
+            return SnapshotResult(path=path, rows=rows, relations=relations)
+
+        try:
+            result = await asyncio.to_thread(export)
+        except Exception as e:
+            raise VectorStoreError(f"Export of '{table}' to {path} failed: {e}") from e
+        logging.info(f"Exported {result['rows']} rows of '{table}' to {path}")
+        return result
+
+    async def import_collection_async(self, path: str) -> SnapshotResult:
+        """Replace the collection with a snapshot from ``export_collection_async``.
+
+        Rows are loaded by DuckDB straight from the Parquet file into a
+        staging table, without passing through Python or the embedding
+        model, and then swapped in together with the relations in one
+        transaction: readers see either the old collection or the new one.
+        In the shared layout the collection's partition is deleted and
+        reloaded in that transaction instead. Snapshots written with another
+        embedding model or dimension than the collection's stored vectors, or
+        than this store's model, raise ``EmbeddingMismatchError``.
+        """
+        table = self.collection_name
+        staging = f"{table}{_IMPORT_SUFFIX}"
+
+        def load() -> SnapshotResult:
+            with self._db.write() as conn:
+                metadata = dict(
+                    conn.execute(
+                        "SELECT key::VARCHAR, value::VARCHAR "
+                        "FROM parquet_kv_metadata(?)",
+                        [path],
+                    ).fetchall()
+                )
+                snapshot_model = metadata.get("model_id")
+                for model_id in (self._stored_model_id(conn), self.model_id):
+                    if model_id and snapshot_model not in (None, model_id):
+                        raise EmbeddingMismatchError(
+                            f"snapshot was embedded with {snapshot_model}, "
+                            f"not {model_id}"
+                        )
+                dim = (
+                    int(metadata.get("dim") or 0)
+                    or _one(
+                        conn.execute(
+                            "SELECT len(embedding) FROM read_parquet(?) LIMIT 1", [path]
+                        )
+                    )[0]
+                )
+                for expected in (self._embedding_dim(conn), self.embed_dim):
+                    if expected and dim != expected:
+                        raise EmbeddingMismatchError(
+                            f"snapshot has dim {dim}, collection expects {expected}"
+                        )
+                if self._shared and self._column_type(conn, "id") is None:
+                    self._create_table(conn, self._table, dim, partitioned=True)
+                self._create_edges_table(conn, self._edges_table)
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    if self._shared:
+                        target = self._table
+                        self._delete_edges(conn)
+                        conn.execute(f"DELETE FROM {target} WHERE {self._scope}")
+                    else:
+                        target = staging
+                        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+                        self._create_table(conn, staging, dim)
+                        self._delete_edges(conn)
+                    bits_column, bits_value = (
+                        (", embedding_bits", f", {_sign_bits_sql('embedding')}")
+                        if self._shared
+                        and self._column_type(conn, "embedding_bits") is not None
+                        else ("", "")
+                    )
+                    partition_columns, partition_values = self._partition_insert()
+                    conn.execute(
+                        f"""
+                        INSERT INTO {target}
+                            (id, text, tags, embedding, created_at, last_hit_at
+                             {bits_column}{partition_columns})
+                        SELECT id, text, tags, embedding::FLOAT[{dim}],
+                               coalesce(created_at, current_localtimestamp()),
+                               last_hit_at{bits_value}{partition_values}
+                        FROM read_parquet(?)
+                        """,
+                        [path],
+                    )
+                    conn.execute(
+                        f"""
+                        INSERT INTO {self._edges_table} (source, target, type)
+                        SELECT id, r.id, r.type
+                        FROM (SELECT id, unnest(relations) AS r FROM read_parquet(?))
+                        ON CONFLICT DO NOTHING
+                        """,
+                        [path],
+                    )
+                    if not self._shared:
+                        conn.execute(f"DROP TABLE IF EXISTS {table}")
+                        conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+                    rows = _one(conn.execute(f"SELECT count(*) FROM {self._rows}"))[0]
+                    relations = _one(
+                        conn.execute(
+                            f"SELECT count(*) FROM {self._edges_table} "
+                            f"WHERE source IN (SELECT id FROM {self._rows})"
+                        )
+                    )[0]
+                    if snapshot_model:
+                        self._record_model_id(conn, snapshot_model, replace=True)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.embed_dim = self.embed_dim or dim
+                if not self._shared:
+                    self._hnsw_ready = False
+                    self._has_sign_bits = False
+                self._unindex_rows()
+                self._ensure_sign_bits(conn)
+                self._maybe_build_hnsw_index(conn)
+            self._mark_text_changed()
+            return SnapshotResult(path=path, rows=rows, relations=relations)
+
+        try:
+            result = await asyncio.to_thread(load)
+        except EmbeddingMismatchError as e:
+            raise EmbeddingMismatchError(
+                f"Import of {path} into '{table}' refused: {e}"
+            ) from e
+        except Exception as e:
+            raise VectorStoreError(
+                f"Import of {path} into '{table}' failed: {e}"
+            ) from e
+        logging.info(f"Imported {result['rows']} rows from {path} into '{table}'")
+        return result
+
+    async def reembed_async(
+        self,
+        embedding_provider: Callable[[], Awaitable[tuple[Embeddings, int]]],
+        batch_size: int = BATCH_SIZE,
+        max_batches: int | None = None,
+        on_progress: Callable[[ReembedProgress], None] | None = None,
+    ) -> ReembedProgress:
+        """Re-embed the collection with another model online, then swap it in.
+
+        Rows are embedded in ``batch_size`` windows into the shadow table
+        ``<collection>__reembed``, one short write per window, while this
+        and other stores keep searching and writing the live table with the
+        old model. The shadow table is tagged with the new model id, so a
+        run that was interrupted or stopped by ``max_batches`` (status
+        ``"paused"``) resumes where it left off.
+
+        Once all rows are embedded, the writer is held while rows written in
+        the meantime are caught up, and the shadow table replaces the live
+        one in one transaction. The new model id is recorded for the
+        collection, and this and every other store open on it in this
+        process switch to the new model; stores elsewhere are refused on
+        reopen until they use it too. A search already embedded with the
+        old model when the swap lands fails once. In the shared layout the
+        new vectors are written into the partition instead, so the
+        dimension must match. Progress is reported to ``on_progress`` and
+        ``get_reembed_progress``.
+        """
+        table = self.collection_name
+        shadow = f"{table}{_REEMBED_SUFFIX}"
+        batch_size = max(1, batch_size)
+        embed, dim = await embedding_provider()
+        executor = EmbeddingExecutor.for_embeddings(embed)
+        model_id = embedding_model_id(embed)
+        progress = ReembedProgress(
+            model_id=model_id,
+            status="running",
+            total=0,
+            done=0,
+            batches=0,
+            elapsed_seconds=0.0,
+            docs_per_second=0.0,
+        )
+        _REEMBED_JOBS[(self._db_key, table)] = progress
+        started = time.perf_counter()
+        swapped = False
+
+        def prepare() -> tuple[int, int, str | None]:
+            with self._db.write() as conn:
+                embedding_type = self._column_type(conn, "embedding")
+                if self._shared and embedding_type != f"FLOAT[{dim}]":
+                    raise ValueError(
+                        f"the shared layout keeps one dimension; {model_id} has {dim}"
+                    )
+                comment = conn.execute(
+                    "SELECT comment FROM duckdb_tables() "
+                    "WHERE database_name = current_database() AND table_name = ?",
+                    [shadow],
+                ).fetchone()
+                if comment is not None and comment[0] != model_id:
+                    conn.execute(f"DROP TABLE {shadow}")
+                if comment is None or comment[0] != model_id:
+                    self._create_table(conn, shadow, dim)
+                    conn.execute(
+                        f"COMMENT ON TABLE {shadow} IS '{_sql_literal(model_id)}'"
+                    )
+                total = _one(conn.execute(f"SELECT count(*) FROM {self._rows}"))[0]
+                done, cursor = _one(
+                    conn.execute(f"SELECT count(*), max(id) FROM {shadow}")
+                )
+                return total, done, cursor
+
+        def write(
+            rows: list[tuple[str, str | None]], vectors: list[list[float]]
+        ) -> None:
+            with self._db.write() as conn:
+                self._write_shadow(conn, shadow, dim, rows, vectors)
+
+        embedded = 0
+
+        def read_batch(after: str | None) -> list[tuple[Any, ...]]:
+            return self.conn.execute(
+                f"SELECT id, text FROM {self._rows} "
+                f"WHERE ?::VARCHAR IS NULL OR id > ? ORDER BY id LIMIT ?",
+                [after, after, batch_size],
+            ).fetchall()
+
+        def report(done: int) -> None:
+            elapsed = time.perf_counter() - started
+            progress["done"] = done
+            progress["elapsed_seconds"] = elapsed
+            progress["docs_per_second"] = embedded / elapsed if elapsed else 0.0
+            if on_progress is not None:
+                on_progress(ReembedProgress(**progress))
+
+        try:
+            progress["total"], done, cursor = await asyncio.to_thread(prepare)
+            while max_batches is None or progress["batches"] < max_batches:
+                rows = await asyncio.to_thread(read_batch, cursor)
+                if not rows:
+                    break
+                vectors = await executor.aembed_documents(
+                    [text or "" for _, text in rows]
+                )
+                await asyncio.to_thread(write, rows, vectors)
+                cursor = rows[-1][0]
+                embedded += len(rows)
+                done += len(rows)
+                progress["batches"] += 1
+                report(done)
+            else:
+                progress["status"] = "paused"
+                return ReembedProgress(**progress)
+
+            async with self._db.write_async() as conn:
+                # Rows added or rewritten since their window was embedded are
+                # caught up with the writer held, so none slip in before the swap.
+                stale = await asyncio.to_thread(
+                    lambda: conn.execute(
+                        f"SELECT r.id, r.text FROM {self._rows} r "
+                        f"LEFT JOIN {shadow} s ON s.id = r.id "
+                        f"WHERE s.id IS NULL OR s.text IS DISTINCT FROM r.text"
+                    ).fetchall()
+                )
+                vectors = await executor.aembed_documents(
+                    [text or "" for _, text in stale]
+                )
+                others = [
+                    store
+                    for store in list(_OPEN_STORES)
+                    if store is not self
+                    and store.embed is not None
+                    and store._db_key == self._db_key
+                    and store.collection_name == table
+                ]
+                models = [await embedding_provider() for _ in others]
+
+                def swap() -> int:
+                    nonlocal swapped
+                    if stale:
+                        self._write_shadow(conn, shadow, dim, stale, vectors)
+                    self._swap_shadow(conn, shadow, model_id)
+                    self._unindex_rows()
+                    self._use_model(conn, embed, dim)
+                    swapped = True
+                    for store, (other_embed, other_dim) in zip(others, models):
+                        store._use_model(conn, other_embed, other_dim)
+                    return _one(conn.execute(f"SELECT count(*) FROM {self._rows}"))[0]
+
+                try:
+                    progress["total"] = await asyncio.to_thread(swap)
+                except BaseException:
+                    for store, (other_embed, _) in zip(others, models):
+                        if store.embed is not other_embed:
+                            EmbeddingProvider.release_embeddings(other_embed)
+                    raise
+                embedded += len(stale)
+            self._mark_text_changed()
+            progress["status"] = "completed"
+            report(progress["total"])
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            raise VectorStoreError(f"Re-embedding '{table}' failed: {e}") from e
+        finally:
+            if not swapped:
+                EmbeddingProvider.release_embeddings(embed)
+        logging.info(
+            f"Re-embedded {progress['done']} rows of '{table}' with {model_id} "
+            f"in {progress['elapsed_seconds']:.2f}s "
+            f"({progress['docs_per_second']:.0f} docs/s)"
+        )
+        return ReembedProgress(**progress)
+
+    @staticmethod
+    def _write_shadow(
+        conn: duckdb.DuckDBPyConnection,
+        shadow: str,
+        dim: int,
+        rows: list[tuple[str, str | None]],
+        vectors: list[list[float]],
+    ) -> None:
+        """Store new-model vectors with the text they were computed from."""
+        conn.execute(
+            f"INSERT OR REPLACE INTO {shadow} (id, text, embedding) "
+            f"SELECT unnest(?::VARCHAR[]), unnest(?::VARCHAR[]), "
+            f"unnest(?::FLOAT[{dim}][])",
+            [
+                [row_id for row_id, _ in rows],
+                [text for _, text in rows],
+                "[" + ",".join(_vector_param(v) for v in vectors) + "]",
+            ],
+        )
+
+    def _use_model(
+        self, conn: duckdb.DuckDBPyConnection, embed: Embeddings, dim: int
+    ) -> None:
+        """Embed with ``embed`` from now on, after the collection was re-embedded.
+
+        Called with the writer held; the reference held on the previous model
+        is released.
+        """
+        old_embed = self.embed
+        self.embed, self.embed_dim = embed, dim
+        self._executor = EmbeddingExecutor.for_embeddings(embed)
+        self.model_id = embedding_model_id(embed)
+        if not self._shared:
+            self._hnsw_ready = False
+        self._ensure_sign_bits(conn)
+        self._maybe_build_hnsw_index(conn)
+        if old_embed is not None:
+            EmbeddingProvider.release_embeddings(old_embed)
+
+    def _swap_shadow(
+        self, conn: duckdb.DuckDBPyConnection, shadow: str, model_id: str
+    ) -> None:
+        """Replace the live vectors with the shadow table's in one transaction."""
+        table = self._table
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if self._shared:
+                bits = (
+                    f", embedding_bits = {_sign_bits_sql('s.embedding')}"
+                    if self._column_type(conn, "embedding_bits") is not None
+                    else ""
+                )
+                conn.execute(
+                    f"UPDATE {table} SET embedding = s.embedding{bits} "
+                    f"FROM {shadow} s WHERE {self._scope} AND {table}.id = s.id"
+                )
+                conn.execute(f"DROP TABLE {shadow}")
+            else:
+                conn.execute(
+                    f"DELETE FROM {shadow} WHERE id NOT IN (SELECT id FROM {table})"
+                )
+                conn.execute(f"""
+                    UPDATE {shadow}
+                    SET text = l.text, tags = l.tags,
+                        created_at = l.created_at, last_hit_at = l.last_hit_at
+                    FROM {table} l
+                    WHERE {shadow}.id = l.id
+                    """)
+                if self._has_hnsw_index(conn):
+                    self._load_extension("vss")
+                conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+            previous = self._stored_model_id(conn)
+            self._record_model_id(conn, model_id, replace=True)
+            if self.embedding_cache_table and previous and previous != model_id:
+                # Vectors of a model no collection uses any more are dead weight.
+                conn.execute(
+                    f"DELETE FROM {EMBEDDING_CACHE_TABLE} WHERE model_id = ? "
+                    f"AND ? NOT IN (SELECT model_id FROM {COLLECTION_MODELS_TABLE})",
+                    [previous, previous],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
 
     async def summarize_entry_async(self, entry_id: str) -> str:
         entry = await self.get_entry_async(entry_id)
         return entry.get("text", "") if entry else ""
 
 
+async def search_collections_async(
+    stores: Sequence[VectorStoreBase], query: str, k: int = 3
+) -> list[CollectionSearchResult]:
+    """Search several collections for ``query`` at once.
+
+    The query is embedded once per distinct embedding model, each store's
+    top ``k`` is computed concurrently on a worker thread's read cursor, and the hits
+    are merged by score and labelled with their collection name. A store that
+    fails to search contributes no hits.
+    """
+    if not stores:
+        return []
+    vectors: dict[str | None, list[float]] = {}
+    for store in stores:
+        if store.model_id not in vectors:
+            vectors[store.model_id] = await store._embed_query(query)
+
+    def run(store: VectorStoreBase) -> list[tuple[Any, ...]]:
+        return store._search_rows(vectors[store.model_id], k, query_text=query)
+
+    outcomes = await asyncio.gather(
+        *(asyncio.to_thread(run, store) for store in stores), return_exceptions=True
+    )
+    merged: list[CollectionSearchResult] = []
+    for store, outcome in zip(stores, outcomes):
+        if isinstance(outcome, BaseException):
+            logging.error(f"Search failed in '{store.collection_name}': {outcome}")
+            continue
+        merged.extend(
+            CollectionSearchResult(
+                id=row[0],
+                score=row[4] if row[4] is not None else 0.0,
+                page_content=row[1] or "",
+                tags=store._parse_json(row[2]),
+                relations=row[3],
+                collection=store.collection_name,
+            )
+            for row in outcome
+        )
+    merged.sort(key=lambda hit: hit["score"], reverse=True)
+    return merged
+
+
+def _cluster_shared_table(conn: duckdb.DuckDBPyConnection) -> None:
+    """Rewrite the shared table ordered by ``(agent, kind)``.
+
+    DuckDB keeps min/max zone maps per row group, so once each partition's
+    rows are contiguous a scan filtered on one agent only reads that agent's
+    row groups. Call inside a transaction.
+    """
+    conn.execute(
+        f"CREATE TEMP TABLE _mao_clustered AS SELECT * FROM {SHARED_VECTOR_TABLE} "
+        f"ORDER BY agent, kind, created_at, id"
+    )
+    try:
+        conn.execute(f"DELETE FROM {SHARED_VECTOR_TABLE}")
+        conn.execute(f"INSERT INTO {SHARED_VECTOR_TABLE} SELECT * FROM _mao_clustered")
+    finally:
+        conn.execute("DROP TABLE _mao_clustered")
+
+
+async def cluster_shared_layout_async(db_path: str | None = None) -> int:
+    """Recluster the shared vector table and return its row count.
+
+    Rows written after a clustering land in new row groups mixed across
+    agents, so run this periodically on databases with many agents.
+    """
+    pool = get_duckdb_pool()
+    database = pool.acquire(db_path or get_vector_db_path())
+
+    def run() -> int:
+        with database.write() as conn:
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                _cluster_shared_table(conn)
+                rows = _one(
+                    conn.execute(f"SELECT count(*) FROM {SHARED_VECTOR_TABLE}")
+                )[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        _STALE_FTS_INDEXES.add((database.path, SHARED_VECTOR_TABLE))
+        return rows
+
+    try:
+        rows = await asyncio.to_thread(run)
+    except Exception as e:
+        raise VectorStoreError(f"Clustering '{SHARED_VECTOR_TABLE}' failed: {e}") from e
+    finally:
+        pool.release(database)
+    logging.info(f"Clustered {rows} rows of '{SHARED_VECTOR_TABLE}' by agent")
+    return rows
+
+
+async def migrate_to_shared_layout_async(
+    db_path: str | None = None, drop_tables: bool = True
+) -> LayoutMigrationResult:
+    """Move every per-collection table of a database into the shared layout.
+
+    Each collection table is copied into ``SHARED_VECTOR_TABLE`` under its
+    ``partition_key``, together with its edges, and the shared table is
+    clustered, all in one transaction. With ``drop_tables`` the source
+    tables, their edge tables and full-text indexes are dropped in it too.
+    Run it while no store has the database open; tables still carrying the
+    legacy JSON columns must be opened by a store once first to upgrade them.
+    """
+    pool = get_duckdb_pool()
+    database = pool.acquire(db_path or get_vector_db_path())
+
+    def column_types(conn: duckdb.DuckDBPyConnection, table: str) -> dict[str, str]:
+        return dict(
+            conn.execute(
+                "SELECT column_name, data_type FROM duckdb_columns() "
+                "WHERE database_name = current_database() AND schema_name = 'main' "
+                "AND table_name = ?",
+                [table],
+            ).fetchall()
+        )
+
+    def run() -> LayoutMigrationResult:
+        result = LayoutMigrationResult(collections=0, rows=0, relations=0)
+        with database.write() as conn:
+            tables = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT table_name FROM duckdb_columns() "
+                    "WHERE database_name = current_database() AND schema_name = 'main' "
+                    "AND column_name = 'embedding' AND table_name <> ? "
+                    "ORDER BY table_name",
+                    [SHARED_VECTOR_TABLE],
+                ).fetchall()
+            ]
+            shadows = [t for t in tables if t.endswith(_REEMBED_SUFFIX)]
+            if shadows:
+                logging.warning(
+                    f"Leaving re-embedding shadow tables {shadows} in place; "
+                    f"paused re-embeddings resume from them in the shared layout"
+                )
+            tables = [
+                t
+                for t in tables
+                if not t.endswith((_IMPORT_SUFFIX, _REEMBED_SUFFIX))
+            ]
+            sources: list[tuple[str, str, str, dict[str, str]]] = []
+            for table in tables:
+                columns = column_types(conn, table)
+                if "id" not in columns:
+                    continue
+                if "relations" in columns or columns.get("tags") == "JSON":
+                    raise ValueError(
+                        f"'{table}' still has legacy JSON columns; open it once "
+                        f"with a vector store to upgrade it"
+                    )
+                sources.append((*partition_key(table), table, columns))
+            if not sources:
+                return result
+            dims = {columns["embedding"] for *_, columns in sources}
+            shared = column_types(conn, SHARED_VECTOR_TABLE)
+            if shared:
+                dims.add(shared["embedding"])
+            if len(dims) > 1:
+                raise ValueError(f"collections mix embedding types {sorted(dims)}")
+            if drop_tables:
+                try:
+                    # Dropping a table that has an HNSW index needs the extension.
+                    conn.execute("LOAD vss")
+                except duckdb.Error:
+                    pass
+            if not shared:
+                dim = re.search(r"\[(\d+)\]", dims.pop())
+                VectorStoreBase._create_table(
+                    conn,
+                    SHARED_VECTOR_TABLE,
+                    int(dim.group(1)) if dim else None,
+                    partitioned=True,
+                )
+            with_bits = "embedding_bits" in shared or any(
+                "embedding_bits" in columns for *_, columns in sources
+            )
+            edges = f"{SHARED_VECTOR_TABLE}_edges"
+            VectorStoreBase._create_edges_table(conn, edges)
+            if with_bits:
+                conn.execute(
+                    f"ALTER TABLE {SHARED_VECTOR_TABLE} "
+                    f"ADD COLUMN IF NOT EXISTS embedding_bits BIT"
+                )
+            existing = _one(
+                conn.execute(f"SELECT count(*) FROM {SHARED_VECTOR_TABLE}")
+            )[0]
+            bits_column, bits_value = (
+                (", embedding_bits", f", {_sign_bits_sql('embedding')}")
+                if with_bits
+                else ("", "")
+            )
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                for agent, kind, table, columns in sorted(sources):
+                    rows = _one(
+                        conn.execute(
+                            f"""
+                        INSERT INTO {SHARED_VECTOR_TABLE}
+                            (agent, kind, id, text, tags, embedding,
+                             created_at, last_hit_at{bits_column})
+                        SELECT ?, ?, id, text, tags, embedding,
+                               created_at, last_hit_at{bits_value}
+                        FROM {table}
+                        ORDER BY created_at, id
+                        """,
+                            [agent, kind],
+                        )
+                    )[0]
+                    relations = 0
+                    if column_types(conn, f"{table}_edges"):
+                        relations = _one(
+                            conn.execute(
+                                f"INSERT INTO {edges} (source, target, type) "
+                                f"SELECT source, target, type FROM {table}_edges "
+                                f"ON CONFLICT DO NOTHING"
+                            )
+                        )[0]
+                    if drop_tables:
+                        conn.execute(f"DROP TABLE IF EXISTS {table}_edges")
+                        conn.execute(f"DROP TABLE {table}")
+                        conn.execute(f"DROP SCHEMA IF EXISTS fts_main_{table} CASCADE")
+                    database.vector_indexes.pop(table, None)
+                    result["collections"] += 1
+                    result["rows"] += rows
+                    result["relations"] += relations
+                if existing:
+                    _cluster_shared_table(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        _STALE_FTS_INDEXES.add((database.path, SHARED_VECTOR_TABLE))
+        return result
+
+    try:
+        result = await asyncio.to_thread(run)
+    except Exception as e:
+        raise VectorStoreError(f"Migration to the shared layout failed: {e}") from e
+    finally:
+        pool.release(database)
+    logging.info(
+        f"Moved {result['collections']} collections with {result['rows']} rows "
+        f"and {result['relations']} relations into '{SHARED_VECTOR_TABLE}'"
+    )
+    return result
+
+
 class KnowledgeTree(VectorStoreBase):
     def __init__(
         self,
@@ -414,6 +2908,117 @@ class KnowledgeTree(VectorStoreBase):
         await instance.async_init()
         return instance
 
+    async def ingest_stream_async(
+        self,
+        documents: AsyncIterable[str | tuple[str, list[str]]],
+        tags: list[str] | None = None,
+        window_size: int = BATCH_SIZE,
+        max_pending_windows: int = 2,
+        on_progress: Callable[[IngestProgress], None] | None = None,
+    ) -> IngestProgress:
+        """Ingest an async stream of documents in fixed-size windows.
+
+        Items are either texts or ``(text, tags)`` pairs; ``tags`` is added to
+        every item. At most ``max_pending_windows`` windows are buffered ahead
+        of the writer, so memory stays bounded however large the corpus is.
+        Each window is committed on its own and reported to ``on_progress``.
+        """
+        if self.embed is None:
+            raise RuntimeError("Embeddings not initialized. Call async_init() first.")
+        window_size = max(1, window_size)
+        shared_tags = list(tags or [])
+        queue: asyncio.Queue[list[tuple[str, list[str]]] | None] = asyncio.Queue(
+            maxsize=max(1, max_pending_windows)
+        )
+
+        async def produce() -> None:
+            cancelled = False
+            try:
+                window: list[tuple[str, list[str]]] = []
+                async for item in documents:
+                    text, item_tags = (item, []) if isinstance(item, str) else item
+                    window.append((text, shared_tags + list(item_tags)))
+                    if len(window) >= window_size:
+                        await queue.put(window)
+                        window = []
+                if window:
+                    await queue.put(window)
+            except asyncio.CancelledError:
+                # The consumer is gone and the queue may be full; nobody
+                # waits for the end marker.
+                cancelled = True
+                raise
+            finally:
+                if not cancelled:
+                    await queue.put(None)
+
+        progress = IngestProgress(
+            documents=0, windows=0, elapsed_seconds=0.0, docs_per_second=0.0
+        )
+        started = time.perf_counter()
+        producer = asyncio.create_task(produce())
+
+        def write_window(ids, texts, window_tags, vectors) -> None:
+            with self._db.write() as conn:
+                self._insert_rows(conn, ids, texts, window_tags, vectors)
+
+        def finish() -> None:
+            with self._db.write() as conn:
+                self._maybe_build_hnsw_index(conn)
+
+        pending: asyncio.Future[list[list[float]]] | None = None
+        try:
+            window = await queue.get()
+            if window is not None:
+                pending = asyncio.ensure_future(
+                    self._embed_documents([text for text, _ in window])
+                )
+            while window is not None and pending is not None:
+                vectors = await pending
+                pending = None
+                next_window = await queue.get()
+                if next_window is not None:
+                    pending = asyncio.ensure_future(
+                        self._embed_documents([text for text, _ in next_window])
+                    )
+                await asyncio.to_thread(
+                    write_window,
+                    [str(uuid.uuid4()) for _ in window],
+                    [text for text, _ in window],
+                    [window_tags for _, window_tags in window],
+                    vectors,
+                )
+                progress["documents"] += len(window)
+                progress["windows"] += 1
+                progress["elapsed_seconds"] = time.perf_counter() - started
+                progress["docs_per_second"] = (
+                    progress["documents"] / progress["elapsed_seconds"]
+                    if progress["elapsed_seconds"]
+                    else 0.0
+                )
+                if on_progress is not None:
+                    on_progress(IngestProgress(**progress))
+                window = next_window
+            await producer
+        except Exception as e:
+            raise VectorStoreError(
+                f"Stream ingestion into '{self.collection_name}' failed after "
+                f"{progress['documents']} documents: {e}"
+            ) from e
+        finally:
+            if pending is not None:
+                pending.cancel()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        await asyncio.to_thread(finish)
+        self._schedule_retention()
+        logging.info(
+            f"Ingested {progress['documents']} documents into '{self.collection_name}' "
+            f"in {progress['elapsed_seconds']:.2f}s "
+            f"({progress['docs_per_second']:.0f} docs/s)"
+        )
+        return progress
+
     async def learn_from_experience_async(
         self,
         text: str,
@@ -477,3 +3082,174 @@ class ExperienceTree(KnowledgeTree):
         )
         await instance.async_init()
         return instance
+
+    async def compact_async(
+        self,
+        similarity_threshold: float = COMPACTION_SIMILARITY,
+        batch_size: int = COMPACTION_BATCH_SIZE,
+        max_batches: int | None = None,
+    ) -> CompactionResult:
+        """Merge near-duplicate experiences into one representative each.
+
+        Rows not yet compacted are processed in ``batch_size`` windows, each
+        in its own transaction on a worker thread. A row whose embedding has
+        cosine similarity of at least ``similarity_threshold`` with an
+        already compacted row, or an earlier row of its window, is folded into
+        that row: tags are merged, its edges are re-pointed at the
+        representative and the row is deleted. Runs are incremental, so
+        ``max_batches`` bounds the work done per call.
+        """
+        table = self.collection_name
+        result = CompactionResult(scanned=0, merged=0, remaining=0, batches=0)
+
+        def run_batch() -> tuple[int, int]:
+            with self._db.write() as conn:
+                return self._compact_batch(
+                    conn, similarity_threshold, max(1, batch_size)
+                )
+
+        try:
+            async with self._db.write_async() as conn:
+                conn.execute(
+                    f"ALTER TABLE {self._table} ADD COLUMN IF NOT EXISTS "
+                    f"compacted BOOLEAN DEFAULT false"
+                )
+            while max_batches is None or result["batches"] < max_batches:
+                scanned, merged = await asyncio.to_thread(run_batch)
+                if not scanned:
+                    break
+                result["scanned"] += scanned
+                result["merged"] += merged
+                result["batches"] += 1
+            remaining = await asyncio.to_thread(
+                lambda: self.conn.execute(
+                    f"SELECT count(*) FROM {self._rows} WHERE NOT compacted"
+                ).fetchone()
+            )
+            result["remaining"] = remaining[0] if remaining else 0
+        except Exception as e:
+            raise VectorStoreError(f"Compaction of '{table}' failed: {e}") from e
+        if result["merged"]:
+            self._mark_text_changed()
+        logging.info(
+            f"Compacted '{table}': merged {result['merged']} of "
+            f"{result['scanned']} rows, {result['remaining']} left"
+        )
+        return result
+
+    def _compact_batch(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        similarity_threshold: float,
+        batch_size: int,
+    ) -> tuple[int, int]:
+        table = self._table
+        edges = self._edges_table
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            batch = [
+                row[0]
+                for row in conn.execute(
+                    f"SELECT id FROM {self._rows} WHERE NOT compacted "
+                    f"ORDER BY rowid LIMIT ?",
+                    [batch_size],
+                ).fetchall()
+            ]
+            matches = conn.execute(
+                f"""
+                WITH batch AS (
+                    SELECT rowid AS rid, id, embedding
+                    FROM {self._rows}
+                    WHERE id IN (SELECT unnest(?::VARCHAR[]))
+                ),
+                pool AS (
+                    SELECT rowid AS rid, id, embedding, compacted
+                    FROM {self._rows}
+                    WHERE compacted OR id IN (SELECT id FROM batch)
+                )
+                SELECT b.id, arg_max(p.id, array_cosine_similarity(b.embedding, p.embedding))
+                FROM batch b
+                JOIN pool p ON p.compacted OR p.rid < b.rid
+                WHERE array_cosine_similarity(b.embedding, p.embedding) >= ?
+                GROUP BY b.id
+                """,
+                [batch, similarity_threshold],
+            ).fetchall()
+            parent = dict(matches)
+            representative: dict[str, str] = {}
+            for dup in batch:
+                if dup not in parent:
+                    continue
+                rep = parent[dup]
+                while rep in parent:
+                    rep = parent[rep]
+                representative[dup] = rep
+
+            if representative:
+                dups = list(representative)
+                reps = [representative[d] for d in dups]
+                tags = dict(
+                    conn.execute(
+                        f"SELECT id, tags FROM {self._rows} "
+                        f"WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+                        [dups + reps],
+                    ).fetchall()
+                )
+                merged_tags: dict[str, list[str]] = {}
+                for dup, rep in representative.items():
+                    current = merged_tags.setdefault(rep, list(tags.get(rep) or []))
+                    current.extend(t for t in tags.get(dup) or [] if t not in current)
+                conn.execute(
+                    f"""
+                    UPDATE {table} SET tags = merged.tags
+                    FROM (
+                        SELECT unnest(?::VARCHAR[]) AS id,
+                               unnest(?::VARCHAR[][]) AS tags
+                    ) merged
+                    WHERE {table}.id = merged.id
+                    """,
+                    [list(merged_tags), list(merged_tags.values())],
+                )
+                conn.execute(
+                    f"""
+                    INSERT INTO {edges} (source, target, type)
+                    WITH merge_map AS (
+                        SELECT unnest(?::VARCHAR[]) AS dup,
+                               unnest(?::VARCHAR[]) AS rep
+                    )
+                    SELECT DISTINCT source, target, type
+                    FROM (
+                        SELECT coalesce(ms.rep, e.source) AS source,
+                               coalesce(mt.rep, e.target) AS target,
+                               e.type
+                        FROM {edges} e
+                        LEFT JOIN merge_map ms ON e.source = ms.dup
+                        LEFT JOIN merge_map mt ON e.target = mt.dup
+                        WHERE ms.dup IS NOT NULL OR mt.dup IS NOT NULL
+                    )
+                    WHERE source <> target
+                    ON CONFLICT DO NOTHING
+                    """,
+                    [dups, reps],
+                )
+                conn.execute(
+                    f"DELETE FROM {edges} "
+                    f"WHERE source IN (SELECT unnest(?::VARCHAR[])) "
+                    f"OR target IN (SELECT unnest(?::VARCHAR[]))",
+                    [dups, dups],
+                )
+                conn.execute(
+                    f"DELETE FROM {table} WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+                    [dups],
+                )
+            conn.execute(
+                f"UPDATE {table} SET compacted = true "
+                f"WHERE id IN (SELECT unnest(?::VARCHAR[]))",
+                [[row_id for row_id in batch if row_id not in representative]],
+            )
+            conn.execute("COMMIT")
+            self._unindex_rows(list(representative))
+            return len(batch), len(representative)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
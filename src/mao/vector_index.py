@@ -0,0 +1,230 @@
+"""
+In-memory top-k index mirroring a vector collection.
+
+Holds the collection's embeddings as a row-normalized ``float32`` matrix so
+that a search is one matrix-vector product plus ``argpartition`` instead of
+a SQL scan computing cosine per row.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Bytes all warm indexes of the process may hold together; 0 disables the cap.
+MEMORY_INDEX_BUDGET_BYTES: int = int(
+    float(os.environ.get("VECTOR_MEMORY_INDEX_BUDGET_MB", "512")) * 1024 * 1024
+)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_select(
+    query: "list[float] | np.ndarray",
+    candidates: "list[list[float]] | np.ndarray",
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """Pick ``k`` candidate positions by maximal marginal relevance.
+
+    Each step takes the candidate maximizing ``lambda_mult * sim(query, c)
+    - (1 - lambda_mult) * max sim(c, picked)``. The candidate similarity
+    matrix is computed once; each step only updates the running maximum.
+    """
+    matrix = _normalize(np.asarray(candidates, dtype=np.float32))
+    if k <= 0 or len(matrix) == 0:
+        return []
+    relevance = matrix @ _normalize(np.asarray(query, dtype=np.float32))
+    pairwise = matrix @ matrix.T
+    picked = [int(np.argmax(relevance))]
+    redundancy = pairwise[picked[0]].copy()
+    for _ in range(1, min(k, len(matrix))):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+
+class MemoryVectorIndex:
+    """Normalized embedding matrix with id lookup, updated in place.
+
+    Rows are appended at the end and deletions move the last row into the
+    freed slot, so both stay O(1) per row and the matrix stays dense.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._matrix = np.empty((max(1, capacity), dim), dtype=np.float32)
+        self._ids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes
+
+    def upsert(self, ids: list[str], vectors: "list[list[float]] | np.ndarray") -> None:
+        if not ids:
+            return
+        rows = _normalize(
+            np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        )
+        with self._lock:
+            needed = len(self._ids) + len(ids)
+            if needed > len(self._matrix):
+                grown = np.empty(
+                    (max(needed, 2 * len(self._matrix)), self.dim), dtype=np.float32
+                )
+                grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+                self._matrix = grown
+            for row_id, row in zip(ids, rows):
+                position = self._positions.get(row_id)
+                if position is None:
+                    position = self._positions[row_id] = len(self._ids)
+                    self._ids.append(row_id)
+                self._matrix[position] = row
+
+    def remove(self, ids: list[str]) -> None:
+        with self._lock:
+            for row_id in ids:
+                position = self._positions.pop(row_id, None)
+                if position is None:
+                    continue
+                last = len(self._ids) - 1
+                if position != last:
+                    moved = self._ids[last]
+                    self._matrix[position] = self._matrix[last]
+                    self._ids[position] = moved
+                    self._positions[moved] = position
+                self._ids.pop()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._positions.clear()
+
+    def search(self, vector: list[float], k: int) -> list[tuple[str, float]]:
+        """Return ``(id, cosine similarity)`` for the ``k`` closest rows, best first."""
+        return self.search_many([vector], k)[0]
+
+    def search_many(
+        self, vectors: "list[list[float]] | np.ndarray", k: int
+    ) -> list[list[tuple[str, float]]]:
+        """Top-``k`` for several queries with one matrix-matrix product."""
+        queries = _normalize(
+            np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        )
+        with self._lock:
+            count = len(self._ids)
+            k = min(k, count)
+            if k <= 0:
+                return [[] for _ in range(len(queries))]
+            scores = queries @ self._matrix[:count].T
+            if k < count:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(count), (len(queries), count))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            return [
+                [(self._ids[i], float(score)) for i, score in zip(row, row_scores)]
+                for row, row_scores in zip(top, top_scores)
+            ]
+
+
+# Warm indexes of every cache, least recently used first, with the bytes charged.
+_CHARGED: "OrderedDict[tuple[int, str], tuple[VectorIndexCache, int]]" = OrderedDict()
+_CHARGED_LOCK = threading.RLock()
+
+
+class VectorIndexCache:
+    """Warm in-memory indexes of one database, by collection name.
+
+    A ``None`` entry marks a collection searched in DuckDB instead. Indexes
+    are charged by matrix size against ``MEMORY_INDEX_BUDGET_BYTES``, which
+    every cache in the process shares; going over it drops the least
+    recently used indexes of any database, to be rebuilt on a later search.
+    An index larger than the whole budget is replaced by ``None``.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: dict[str, MemoryVectorIndex | None] = {}
+
+    def __contains__(self, name: str) -> bool:
+        with _CHARGED_LOCK:
+            return name in self._indexes
+
+    def __len__(self) -> int:
+        with _CHARGED_LOCK:
+            return len(self._indexes)
+
+    def __getitem__(self, name: str) -> MemoryVectorIndex | None:
+        with _CHARGED_LOCK:
+            index = self._indexes[name]
+            if (id(self), name) in _CHARGED:
+                _CHARGED.move_to_end((id(self), name))
+            return index
+
+    def get(self, name: str) -> MemoryVectorIndex | None:
+        with _CHARGED_LOCK:
+            return self[name] if name in self._indexes else None
+
+    def __setitem__(self, name: str, index: MemoryVectorIndex | None) -> None:
+        with _CHARGED_LOCK:
+            self._indexes[name] = index
+            _CHARGED.pop((id(self), name), None)
+            if index is not None:
+                self.charge(name)
+
+    def pop(self, name: str, default: None = None) -> MemoryVectorIndex | None:
+        with _CHARGED_LOCK:
+            _CHARGED.pop((id(self), name), None)
+            return self._indexes.pop(name, default)
+
+    def clear(self) -> None:
+        with _CHARGED_LOCK:
+            for name in list(self._indexes):
+                self.pop(name)
+
+    def charge(self, name: str) -> None:
+        """Re-charge ``name`` at its current size and enforce the budget."""
+        with _CHARGED_LOCK:
+            index = self._indexes.get(name)
+            if index is None:
+                return
+            _CHARGED[(id(self), name)] = (self, index.nbytes)
+            _CHARGED.move_to_end((id(self), name))
+            budget = MEMORY_INDEX_BUDGET_BYTES
+            if not budget:
+                return
+            if index.nbytes > budget:
+                _CHARGED.pop((id(self), name))
+                self._indexes[name] = None
+                logging.info(
+                    f"In-memory index of '{name}' exceeds the memory index budget"
+                )
+                return
+            total = sum(nbytes for _, nbytes in _CHARGED.values())
+            while total > budget:
+                (_, evicted), (cache, nbytes) = _CHARGED.popitem(last=False)
+                cache._indexes.pop(evicted, None)
+                total -= nbytes
+                logging.info(f"Evicted in-memory index of '{evicted}' over budget")
+
+
+def memory_index_bytes() -> int:
+    """Bytes currently charged against ``MEMORY_INDEX_BUDGET_BYTES``."""
+    with _CHARGED_LOCK:
+        return sum(nbytes for _, nbytes in _CHARGED.values())
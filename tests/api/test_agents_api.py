@@ -2,6 +2,7 @@
 Tests for the Agents API endpoints.
 """
 
+import asyncio
 import os
 import uuid
 
@@ -262,6 +263,44 @@ def test_start_agent_runtime(api_test_client):
     assert running_response.json()["count"] >= 1
 
 
+def test_stopping_agent_releases_its_embedding_model(api_test_client, monkeypatch):
+    """Test that stop and delete close the agent's vector stores."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from mao import agents
+    from mao.duckdb_pool import get_duckdb_pool
+    from mao.embeddings import DEFAULT_EMBEDDING_MODEL, get_embedding_registry
+
+    client, _ = api_test_client
+    registry = get_embedding_registry()
+    monkeypatch.setattr(
+        registry, "loader", lambda name: DeterministicFakeEmbedding(size=16)
+    )
+    monkeypatch.setattr(
+        agents, "_create_model", lambda **kwargs: FakeListChatModel(responses=["ok"])
+    )
+    baseline = registry.refcount(DEFAULT_EMBEDDING_MODEL)
+
+    def start_with_trees() -> str:
+        agent = {"name": "Closing Agent", "provider": "ollama", "model_name": "fake"}
+        agent_id = client.post("/agents", json=agent).json()["id"]
+        assert client.post(f"/agents/{agent_id}/start").json()["status"] == "started"
+        asyncio.run(active_agents[agent_id]["instance"]._retrieve_context("warm up"))
+        assert registry.refcount(DEFAULT_EMBEDDING_MODEL) == baseline + 2
+        return agent_id
+
+    agent_id = start_with_trees()
+    assert client.post(f"/agents/{agent_id}/stop").status_code == 200
+    assert registry.refcount(DEFAULT_EMBEDDING_MODEL) == baseline
+    assert get_duckdb_pool().get(os.environ["VECTOR_DB_PATH"]).refcount == 0
+
+    agent_id = start_with_trees()
+    assert client.delete(f"/agents/{agent_id}").status_code == 204
+    assert registry.refcount(DEFAULT_EMBEDDING_MODEL) == baseline
+    assert agent_id not in active_agents
+
+
 def test_chat_with_agent_runtime(api_test_client):
     """Test chatting with a running agent through the real runtime path."""
     client, _ = api_test_client
@@ -0,0 +1,177 @@
+"""
+Tests for the vector storage API endpoints.
+"""
+
+import asyncio
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from mao.storage import ExperienceTree
+
+
+def test_embedding_cache_stats_endpoint(api_test_client):
+    """Test that cache counters are exposed."""
+    client, _ = api_test_client
+    response = client.get("/vectors/embedding-cache")
+    assert response.status_code == 200
+    data = response.json()
+    for key in ("hits", "misses", "size", "max_size", "hit_rate"):
+        assert key in data
+
+
+def test_compact_collection_endpoint(api_test_client):
+    """Test that duplicate experiences are merged through the API."""
+    client, _ = api_test_client
+
+    async def seed():
+        async def provider():
+            return DeterministicFakeEmbedding(size=16), 16
+
+        tree = await ExperienceTree.create(
+            collection_name="api_experience", embedding_provider=provider
+        )
+        await tree.add_entries_batch_async(["same turn", "same turn", "other turn"])
+
+    asyncio.run(seed())
+
+    response = client.post("/vectors/api_experience/compact", json={"batch_size": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "completed"
+    assert data["merged"] == 1
+    assert data["remaining"] == 0
+
+    response = client.post("/vectors/api_experience/compact", json={"background": True})
+    assert response.json()["status"] == "scheduled"
+    assert client.post("/vectors/missing_collection/compact").status_code == 404
+    assert client.post("/vectors/bad-name/compact").status_code == 400
+
+
+def test_export_and_import_collection_endpoints(api_test_client, tmp_path, monkeypatch):
+    """Test that a collection moves between names through a Parquet snapshot."""
+    client, _ = api_test_client
+    monkeypatch.setenv("VECTOR_SNAPSHOT_DIR", str(tmp_path))
+
+    async def seed():
+        async def provider():
+            return DeterministicFakeEmbedding(size=16), 16
+
+        tree = await ExperienceTree.create(
+            collection_name="api_snapshot_source", embedding_provider=provider
+        )
+        await tree.add_entries_batch_async(["first turn", "second turn"])
+        tree.close()
+
+    asyncio.run(seed())
+
+    response = client.post(
+        "/vectors/api_snapshot_source/export", json={"path": "s.parquet"}
+    )
+    assert response.status_code == 200
+    assert response.json()["rows"] == 2
+    assert (tmp_path / "s.parquet").exists()
+
+    response = client.post(
+        "/vectors/api_snapshot_copy/import", json={"path": "s.parquet"}
+    )
+    assert response.status_code == 200
+    assert response.json()["rows"] == 2
+
+    assert (
+        client.post(
+            "/vectors/api_snapshot_copy/import", json={"path": "../x.parquet"}
+        ).status_code
+        == 400
+    )
+    assert (
+        client.post(
+            "/vectors/api_snapshot_copy/import", json={"path": "none.parquet"}
+        ).status_code
+        == 404
+    )
+    assert client.post("/vectors/missing_collection/export").status_code == 404
+
+
+def test_import_rejects_snapshot_of_another_dimension(
+    api_test_client, tmp_path, monkeypatch
+):
+    """Test that a snapshot never replaces a live collection with other vectors."""
+    client, _ = api_test_client
+    monkeypatch.setenv("VECTOR_SNAPSHOT_DIR", str(tmp_path))
+
+    def provider(size):
+        async def create():
+            return DeterministicFakeEmbedding(size=size), size
+
+        return create
+
+    async def seed():
+        small = await ExperienceTree.create(
+            collection_name="api_snapshot_small", embedding_provider=provider(8)
+        )
+        await small.add_entries_batch_async(["small turn"])
+        small.close()
+        live = await ExperienceTree.create(
+            collection_name="api_snapshot_live", embedding_provider=provider(16)
+        )
+        await live.add_entries_batch_async(["live turn"])
+        live.close()
+
+    asyncio.run(seed())
+
+    snapshot = {"path": "small.parquet"}
+    response = client.post("/vectors/api_snapshot_small/export", json=snapshot)
+    assert response.status_code == 200
+    response = client.post("/vectors/api_snapshot_live/import", json=snapshot)
+    assert response.status_code == 409
+    assert "dim 8" in response.json()["detail"]
+
+    async def search_live():
+        live = await ExperienceTree.create(
+            collection_name="api_snapshot_live", embedding_provider=provider(16)
+        )
+        try:
+            await live.add_entry_async("another live turn")
+            return await live.search_async("live turn", k=5)
+        finally:
+            live.close()
+
+    assert len(asyncio.run(search_live())) == 2
+
+
+def test_reembed_collection_endpoints(api_test_client, monkeypatch):
+    """Test that a re-embedding job runs through the API and reports progress."""
+    client, _ = api_test_client
+    from mao.api import vectors
+
+    async def provider():
+        return DeterministicFakeEmbedding(size=16), 16
+
+    async def seed():
+        tree = await ExperienceTree.create(
+            collection_name="api_reembed", embedding_provider=provider
+        )
+        await tree.add_entries_batch_async(["first turn", "second turn", "third turn"])
+        tree.close()
+
+    asyncio.run(seed())
+    monkeypatch.setattr(vectors, "_model_provider", lambda model: provider)
+
+    assert client.get("/vectors/api_reembed/reembed").status_code == 404
+    response = client.post(
+        "/vectors/api_reembed/reembed",
+        json={"model": "fake", "batch_size": 2, "max_batches": 1, "background": False},
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == "paused"
+
+    response = client.post("/vectors/api_reembed/reembed", json={"model": "fake"})
+    assert response.json()["status"] == "scheduled"
+    data = client.get("/vectors/api_reembed/reembed").json()
+    assert (data["status"], data["done"], data["total"]) == ("completed", 3, 3)
+    assert (
+        client.post(
+            "/vectors/missing_collection/reembed", json={"model": "x"}
+        ).status_code
+        == 404
+    )
@@ -2,6 +2,8 @@
 Tests for Agent and Supervisor classes.
 """
 
+import asyncio
+
 import pytest
 import uuid
 import os
@@ -223,3 +225,45 @@ async def test_agent_with_mcp_tools(mcp_client):
     except Exception as e:
         logging.error(f"Error testing agent with MCP tools: {e}")
         raise
+
+
+@pytest.mark.asyncio
+async def test_agent_trees_are_created_lazily_and_can_be_disabled(monkeypatch):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from mao import agents
+
+    created: list[str] = []
+
+    class FakeTree:
+        def __init__(self, collection_name: str):
+            self.collection_name = collection_name
+
+        def close(self) -> None:
+            pass
+
+    async def fake_create(collection_name: str):
+        created.append(collection_name)
+        return FakeTree(collection_name)
+
+    monkeypatch.setattr(agents.KnowledgeTree, "create", fake_create)
+    monkeypatch.setattr(agents.ExperienceTree, "create", fake_create)
+
+    async def fake_search(stores, query, k=3):
+        return []
+
+    monkeypatch.setattr(agents, "search_collections_async", fake_search)
+    llm = FakeListChatModel(responses=["ok"])
+
+    opted_out = agents.Agent(
+        llm, "no-memory agent", use_knowledge=False, use_experience=False
+    )
+    await opted_out.init_agent()
+    assert await opted_out._retrieve_context("anything") == ""
+    assert opted_out.knowledge_tree is None and opted_out.experience_tree is None
+
+    lazy = agents.Agent(llm, "lazy-agent")
+    assert created == []
+    await asyncio.gather(lazy._retrieve_context("q"), lazy._retrieve_context("q"))
+    assert created == ["knowledge_lazy_agent", "experience_lazy_agent"]
+    lazy.close()
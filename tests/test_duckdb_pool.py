@@ -0,0 +1,120 @@
+"""
+Tests for the pooled DuckDB databases behind the vector stores.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mao.duckdb_pool import DuckDBPool
+
+
+def test_acquire_shares_one_database_per_path(tmp_path):
+    pool = DuckDBPool(max_databases=4)
+    first = pool.acquire(str(tmp_path / "a.duckdb"))
+    second = pool.acquire(str(tmp_path / "." / "a.duckdb"))
+
+    assert first is second
+    assert first.refcount == 2
+    assert len(pool) == 1
+    pool.close_all()
+
+
+def test_idle_databases_are_evicted_least_recently_used_first(tmp_path):
+    pool = DuckDBPool(max_databases=2)
+    memory = pool.acquire(":memory:")
+    pool.release(memory)
+    a = pool.acquire(str(tmp_path / "a.duckdb"))
+    pool.release(a)
+    held = pool.acquire(str(tmp_path / "b.duckdb"))
+    c = pool.acquire(str(tmp_path / "c.duckdb"))
+
+    assert a.closed
+    assert not memory.closed and not held.closed and not c.closed
+    assert pool.get(str(tmp_path / "a.duckdb")) is None
+    pool.close_all()
+    assert held.closed
+
+
+def test_readers_get_a_cursor_per_thread(tmp_path):
+    pool = DuckDBPool()
+    db = pool.acquire(str(tmp_path / "readers.duckdb"))
+    cursors: list[object] = []
+
+    def read() -> None:
+        cursor = db.cursor()
+        assert cursor is db.cursor()
+        cursors.append(cursor)
+        cursor.execute("SELECT 42").fetchone()
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(c) for c in cursors}) == 4
+    pool.close_all()
+
+
+def test_writer_is_serialized(tmp_path):
+    pool = DuckDBPool()
+    db = pool.acquire(str(tmp_path / "writer.duckdb"))
+    with db.write() as conn:
+        conn.execute("CREATE TABLE t (i INTEGER)")
+    active = 0
+    overlap = False
+
+    def write(i: int) -> None:
+        nonlocal active, overlap
+        with db.write() as conn:
+            active += 1
+            overlap = overlap or active > 1
+            time.sleep(0.01)
+            conn.execute("INSERT INTO t VALUES (?)", [i])
+            active -= 1
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not overlap
+    assert db.cursor().execute("SELECT count(*) FROM t").fetchone() == (8,)
+    with db.write(), db.try_write() as conn:
+        assert conn is None
+    pool.close_all()
+
+
+@pytest.mark.asyncio
+async def test_async_writer_waits_without_blocking_the_loop(tmp_path):
+    pool = DuckDBPool()
+    db = pool.acquire(str(tmp_path / "async.duckdb"))
+    released = threading.Event()
+
+    def hold() -> None:
+        with db.write():
+            released.wait(1)
+
+    holder = asyncio.create_task(asyncio.to_thread(hold))
+    await asyncio.sleep(0.01)
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while not released.is_set():
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    ticker = asyncio.create_task(tick())
+    asyncio.get_running_loop().call_later(0.05, released.set)
+    async with db.write_async() as conn:
+        conn.execute("SELECT 1")
+    await holder
+    await ticker
+
+    assert ticks > 1
+    pool.close_all()
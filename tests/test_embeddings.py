@@ -0,0 +1,234 @@
+"""
+Tests for the embedding execution helpers.
+"""
+
+import asyncio
+import threading
+import time
+from typing import ClassVar
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from mao.embeddings import EmbeddingCache, EmbeddingExecutor, EmbeddingModelRegistry
+
+
+class CountingEmbeddings(Embeddings):
+    symmetric_queries = True
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: list[list[str]] = []
+        self.threads: set[str] = set()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(list(texts))
+        self.threads.add(threading.current_thread().name)
+        if self.delay:
+            time.sleep(self.delay)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_are_coalesced_into_one_batch():
+    embed = CountingEmbeddings()
+    executor = EmbeddingExecutor(embed, window_ms=20)
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    vectors = await asyncio.gather(*(executor.aembed_query(t) for t in texts))
+
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0], [4.0, 1.0]]
+    assert embed.calls == [texts]
+    assert threading.current_thread().name not in embed.threads
+
+
+@pytest.mark.asyncio
+async def test_coalesced_queries_keep_asymmetric_query_embedding():
+    class InstructedEmbeddings(CountingEmbeddings):
+        symmetric_queries = None
+        query_encode_kwargs: ClassVar[dict[str, str]] = {"prompt": "query: "}
+
+        def embed_query(self, text: str) -> list[float]:
+            return self.embed_documents(["query: " + text])[0]
+
+    embed = InstructedEmbeddings()
+    executor = EmbeddingExecutor(embed, window_ms=20)
+
+    vectors = await asyncio.gather(*(executor.aembed_query(t) for t in ["a", "bb"]))
+
+    assert vectors == [[8.0, 1.0], [9.0, 1.0]]
+    assert embed.calls == [["query: a"], ["query: bb"]]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_window():
+    embed = CountingEmbeddings()
+    executor = EmbeddingExecutor(embed, window_ms=10_000, max_batch=2)
+
+    vectors = await asyncio.wait_for(
+        asyncio.gather(executor.aembed_query("x"), executor.aembed_query("yy")),
+        timeout=2,
+    )
+
+    assert vectors == [[1.0, 1.0], [2.0, 1.0]]
+
+
+@pytest.mark.asyncio
+async def test_encoding_does_not_block_event_loop():
+    embed = CountingEmbeddings(delay=0.3)
+    executor = EmbeddingExecutor(embed, window_ms=0)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await executor.aembed_documents(["some document"])
+    task.cancel()
+
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_every_waiter():
+    class FailingEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            raise ValueError("model unavailable")
+
+    executor = EmbeddingExecutor(FailingEmbeddings(), window_ms=5)
+    results = await asyncio.gather(
+        executor.aembed_query("a"), executor.aembed_query("b"), return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_embedding_cache_lru_and_ttl():
+    cache = EmbeddingCache(max_size=2, ttl_seconds=60)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]
+    cache.put("m", "c", [3.0])
+
+    assert cache.get("m", "b") is None
+    assert cache.get("other-model", "a") is None
+    assert cache.get("m", "c") == [3.0]
+
+    expired = EmbeddingCache(max_size=2, ttl_seconds=-1)
+    expired.put("m", "a", [1.0])
+    assert expired.get("m", "a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_registry_loads_model_once_and_unloads_on_last_release():
+    loads: list[str] = []
+
+    def loader(model_name: str) -> Embeddings:
+        loads.append(model_name)
+        return CountingEmbeddings()
+
+    registry = EmbeddingModelRegistry(loader=loader)
+    first, second = await asyncio.gather(
+        registry.acquire("bge"), registry.acquire("bge")
+    )
+
+    assert loads == ["bge"]
+    assert first[0] is second[0]
+    assert first[1] == 2
+    assert registry.refcount("bge") == 2
+
+    assert registry.release_instance(first[0])
+    assert registry.is_loaded("bge")
+    registry.release("bge")
+    assert not registry.is_loaded("bge")
+    assert not registry.release_instance(first[0])
+
+    await registry.acquire("bge")
+    assert loads == ["bge", "bge"]
+
+
+def test_load_embeddings_dispatches_on_configured_backend(monkeypatch):
+    from mao import embeddings
+
+    loaded: list[tuple[str, str]] = []
+    monkeypatch.setitem(
+        embeddings.EMBEDDING_BACKENDS,
+        "onnx",
+        lambda name: loaded.append(("onnx", name)) or CountingEmbeddings(),
+    )
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "onnx")
+    assert isinstance(embeddings.load_embeddings("bge"), CountingEmbeddings)
+    assert loaded == [("onnx", "bge")]
+
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "tensorflow")
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        embeddings.load_embeddings("bge")
+
+
+def test_onnx_backend_registers_int8_export_once(monkeypatch):
+    import sys
+    import types
+
+    import numpy as np
+
+    from mao import embeddings
+
+    added: list[dict] = []
+
+    class FakeTextEmbedding:
+        def __init__(self, model_name: str, threads: int | None = None):
+            self.model_name = model_name
+            self.threads = threads
+
+        @staticmethod
+        def list_supported_models() -> list[dict]:
+            # Like some fastembed releases, custom models are not listed.
+            return [{"model": "BAAI/bge-small-en-v1.5"}]
+
+        @staticmethod
+        def add_custom_model(**description) -> None:
+            if any(d["model"] == description["model"] for d in added):
+                raise ValueError(f"{description['model']} is already registered")
+            added.append(description)
+
+        def embed(self, texts: list[str], batch_size: int):
+            for text in texts:
+                yield np.array([float(len(text)), float(batch_size)], dtype=np.float32)
+
+    fastembed = types.ModuleType("fastembed")
+    fastembed.TextEmbedding = FakeTextEmbedding
+    description = types.ModuleType("fastembed.common.model_description")
+    description.ModelSource = lambda hf: {"hf": hf}
+    description.PoolingType = types.SimpleNamespace(CLS="cls")
+    monkeypatch.setitem(sys.modules, "fastembed", fastembed)
+    monkeypatch.setitem(sys.modules, "fastembed.common", types.ModuleType("x"))
+    monkeypatch.setitem(sys.modules, "fastembed.common.model_description", description)
+    monkeypatch.setattr(embeddings, "_REGISTERED_ONNX_MODELS", set())
+
+    first = embeddings.OnnxEmbeddings(
+        "BAAI/bge-small-en-v1.5", quantized=True, threads=2, batch_size=8
+    )
+    second = embeddings.OnnxEmbeddings("BAAI/bge-small-en-v1.5", quantized=True)
+    assert first.model_name == second.model_name == "BAAI/bge-small-en-v1.5-int8"
+    assert [d["model"] for d in added] == ["BAAI/bge-small-en-v1.5-int8"]
+    assert added[0]["sources"] == {"hf": "Xenova/bge-small-en-v1.5"}
+    assert added[0]["model_file"] == "onnx/model_quantized.onnx"
+    assert first._model.threads == 2
+    assert first.embedding_size == 2
+    assert first.embed_documents(["ab", "abcd"]) == [[2.0, 8.0], [4.0, 8.0]]
+    assert first.embed_query("abc") == [3.0, 8.0]
+
+    fp32 = embeddings.OnnxEmbeddings("unknown/model", quantized=True)
+    assert fp32.model_name == "unknown/model"
+    assert len(added) == 1
@@ -2,9 +2,23 @@
 Tests for the storage module (DuckDB-based vector stores).
 """
 
-import pytest
+import asyncio
+import hashlib
+import math
+import threading
 
-from mao.storage import KnowledgeTree, ExperienceTree
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from mao.duckdb_pool import get_duckdb_pool
+from mao.embeddings import EmbeddingCache
+from mao import storage
+from mao.storage import (
+    ExperienceTree,
+    KnowledgeTree,
+    VectorStoreError,
+    search_collections_async,
+)
 
 try:
     from pytest_asyncio import fixture as asyncio_fixture
@@ -12,6 +26,44 @@ except ImportError:
     asyncio_fixture = pytest.fixture  # type: ignore
 
 
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings so store logic can be tested offline."""
+
+    dim = 64
+    symmetric_queries = True
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        for token in text.lower().split():
+            bucket = int(hashlib.md5(token.encode()).hexdigest(), 16) % self.dim
+            vector[bucket] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+async def hash_embedding_provider():
+    return HashEmbeddings(), HashEmbeddings.dim
+
+
+@asyncio_fixture(scope="function")
+async def hashed_tree():
+    tree = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_hashed_collection",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=hash_embedding_provider,
+    )
+    await tree.clear_all_points_async()
+    yield tree
+    await tree.clear_all_points_async()
+
+
 @asyncio_fixture(scope="function")
 async def knowledge_tree():
     tree = await KnowledgeTree.create(
@@ -256,3 +308,975 @@ async def test_knowledge_tree_clear_all_points(knowledge_tree):
 
     results = await knowledge_tree.search_async("Test content")
     assert len(results) == 0
+
+
+@pytest.mark.asyncio
+async def test_hnsw_index_search_matches_exact_scan(hashed_tree, monkeypatch):
+    hashed_tree.use_hnsw = True
+    hashed_tree.hnsw_min_rows = 4
+    texts = [f"ticket {i} about topic{i % 3}" for i in range(8)]
+    await hashed_tree.add_entries_batch_async(texts[:3])
+    build_threads = []
+    build = hashed_tree._maybe_build_hnsw_index
+
+    def record_thread(conn):
+        build_threads.append(threading.current_thread())
+        build(conn)
+
+    monkeypatch.setattr(hashed_tree, "_maybe_build_hnsw_index", record_thread)
+    await hashed_tree.add_entry_async(texts[3])
+    assert build_threads and threading.main_thread() not in build_threads
+    await hashed_tree.add_entries_batch_async(texts[4:])
+    if not hashed_tree._hnsw_ready:
+        pytest.skip("DuckDB vss extension not available")
+
+    vector = HashEmbeddings().embed_query("topic1")
+    indexed = hashed_tree._search_rows(vector, 3, use_index=True)
+    exact = hashed_tree._search_rows(vector, 3, use_index=False)
+    assert [r[0] for r in indexed] == [r[0] for r in exact]
+    assert indexed[0][4] == pytest.approx(exact[0][4], abs=1e-5)
+    # Default searches use the built index, not the in-memory matrix.
+    assert hashed_tree._search_rows(vector, 3) == indexed
+    assert hashed_tree.collection_name not in hashed_tree._db.vector_indexes
+
+    hashed_tree.conn.execute(f"DROP INDEX {hashed_tree._hnsw_index_name}")
+    hashed_tree._hnsw_ready = False
+    hashed_tree.use_hnsw = False
+    results = await hashed_tree.search_async("topic1", k=3)
+    assert len(results) == 3
+
+
+@pytest.mark.asyncio
+async def test_repeated_queries_hit_embedding_cache(hashed_tree):
+    hashed_tree.embedding_cache = EmbeddingCache()
+    await hashed_tree.add_entry_async("cached retrieval text")
+
+    await hashed_tree.search_async("what about retrieval")
+    await hashed_tree.search_async("what about retrieval")
+    await hashed_tree.search_async("cached retrieval text")
+
+    stats = hashed_tree.embedding_cache.stats()
+    assert stats["misses"] == 2
+    assert stats["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_ingest_inserts_windows_and_removes_them_on_failure(
+    hashed_tree, monkeypatch
+):
+    monkeypatch.setattr(storage, "BATCH_SIZE", 2)
+    texts = [f'doc {i} with "quotes"\nand newline' for i in range(5)]
+    tags_list = [[f"index:{i}", "bulk"] for i in range(5)]
+
+    point_ids = await hashed_tree.add_entries_batch_async(texts, tags_list)
+
+    assert len(point_ids) == 5
+    entry = await hashed_tree.get_entry_async(point_ids[3])
+    assert entry["text"] == texts[3]
+    assert entry["tags"] == ["index:3", "bulk"]
+    for point_id, text in zip(point_ids, texts):
+        stored = hashed_tree.conn.execute(
+            f"SELECT embedding FROM {hashed_tree.collection_name} WHERE id = ?",
+            [point_id],
+        ).fetchone()[0]
+        assert list(stored) == pytest.approx(HashEmbeddings().embed_query(text))
+
+    calls = 0
+    original = hashed_tree._embed_documents
+
+    async def failing_third_window(batch):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise RuntimeError("embedding failed")
+        return await original(batch)
+
+    monkeypatch.setattr(hashed_tree, "_embed_documents", failing_third_window)
+    with pytest.raises(VectorStoreError):
+        await hashed_tree.add_entries_batch_async([f"other {i}" for i in range(6)])
+    # The first two windows were committed before the failure and removed again.
+    count = hashed_tree.conn.execute(
+        f"SELECT count(*) FROM {hashed_tree.collection_name}"
+    ).fetchone()[0]
+    assert count == 5
+    assert len(await hashed_tree.search_async("other", k=10)) == 5
+
+
+@pytest.mark.asyncio
+async def test_batch_ingest_embeds_next_window_while_inserting(
+    hashed_tree, monkeypatch
+):
+    monkeypatch.setattr(storage, "BATCH_SIZE", 2)
+    next_window_embedding = threading.Event()
+    embedded: list[list[str]] = []
+    original_embed = hashed_tree._embed_documents
+
+    async def embed(batch):
+        embedded.append(list(batch))
+        if len(embedded) == 2:
+            next_window_embedding.set()
+        return await original_embed(batch)
+
+    overlapped: list[bool] = []
+    original_insert = hashed_tree._insert_rows
+
+    def insert(conn, ids, *rows):
+        # The first insert only proceeds once the second window is embedding.
+        if not overlapped:
+            overlapped.append(next_window_embedding.wait(timeout=5))
+        return original_insert(conn, ids, *rows)
+
+    monkeypatch.setattr(hashed_tree, "_embed_documents", embed)
+    monkeypatch.setattr(hashed_tree, "_insert_rows", insert)
+    point_ids = await hashed_tree.add_entries_batch_async(
+        [f"doc {i}" for i in range(5)]
+    )
+
+    assert overlapped == [True]
+    assert embedded == [["doc 0", "doc 1"], ["doc 2", "doc 3"], ["doc 4"]]
+    count = hashed_tree.conn.execute(
+        f"SELECT count(*) FROM {hashed_tree.collection_name}"
+    ).fetchone()[0]
+    assert count == len(point_ids) == 5
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_windows_with_backpressure(hashed_tree):
+    pulled = 0
+
+    async def documents():
+        nonlocal pulled
+        for i in range(20):
+            pulled += 1
+            yield (
+                (f"streamed doc {i}", [f"index:{i}"]) if i % 2 else f"streamed doc {i}"
+            )
+
+    reports = []
+
+    def on_progress(progress):
+        reports.append((progress["documents"], pulled))
+
+    result = await hashed_tree.ingest_stream_async(
+        documents(),
+        tags=["stream"],
+        window_size=3,
+        max_pending_windows=1,
+        on_progress=on_progress,
+    )
+
+    assert result["documents"] == 20
+    assert result["windows"] == 7
+    assert [r[0] for r in reports] == [3, 6, 9, 12, 15, 18, 20]
+    # Written window + one embedding + one queued + one being filled.
+    assert all(seen - written <= 3 * 3 for written, seen in reports)
+    hits = await hashed_tree.search_async("streamed doc 1", k=20)
+    assert len(hits) == 20
+    by_text = {h["page_content"]: h["tags"] for h in hits}
+    assert by_text["streamed doc 1"] == ["stream", "index:1"]
+    assert by_text["streamed doc 2"] == ["stream"]
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_failure_stops_producer_on_full_queue(
+    hashed_tree, monkeypatch
+):
+    async def documents():
+        for i in range(50):
+            yield f"streamed doc {i}"
+
+    async def failing_embed(batch):
+        # Let the producer fill the queue and block on it first.
+        await asyncio.sleep(0.01)
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(hashed_tree, "_embed_documents", failing_embed)
+    with pytest.raises(VectorStoreError, match="after 0 documents"):
+        await hashed_tree.ingest_stream_async(
+            documents(), window_size=1, max_pending_windows=1
+        )
+
+    producers = [
+        task
+        for task in asyncio.all_tasks()
+        if getattr(task.get_coro(), "__name__", "") == "produce"
+    ]
+    assert producers == []
+
+
+@pytest.mark.asyncio
+async def test_memory_index_mirrors_inserts_and_deletes(hashed_tree):
+    ids = await hashed_tree.add_entries_batch_async(
+        [f"topic{i % 5} note {i}" for i in range(20)]
+    )
+    vector = HashEmbeddings().embed_query("topic3 note")
+
+    warm = hashed_tree._search_rows(vector, 4)
+    index = hashed_tree._db.vector_indexes[hashed_tree.collection_name]
+    assert len(index) == 20
+    exact = hashed_tree._search_rows(vector, 4, use_index=False)
+    assert [r[0] for r in warm] == [r[0] for r in exact]
+    assert [r[4] for r in warm] == pytest.approx([r[4] for r in exact], abs=1e-5)
+
+    await hashed_tree.delete_entry_async(warm[0][0])
+    new_id = await hashed_tree.add_entry_async("topic3 note")
+    hits = await hashed_tree.search_async("topic3 note", k=4)
+    assert len(index) == 20
+    assert hits[0]["id"] == new_id
+    assert warm[0][0] not in {h["id"] for h in hits}
+    assert new_id not in ids
+
+
+@pytest.mark.asyncio
+async def test_search_many_matches_single_searches(hashed_tree, monkeypatch):
+    await hashed_tree.add_entries_batch_async(
+        [f"topic{i % 5} note {i}" for i in range(20)],
+        tags_list=[["even"] if i % 2 == 0 else [] for i in range(20)],
+    )
+    queries = ["topic1 note", "topic4", "note 7"]
+    single = [await hashed_tree.search_async(q, k=3) for q in queries]
+
+    calls: list[list[str]] = []
+    encode = hashed_tree._executor._encode
+    monkeypatch.setattr(
+        hashed_tree._executor,
+        "_encode",
+        lambda texts: calls.append(list(texts)) or encode(texts),
+    )
+    hashed_tree.embedding_cache = None
+    warm = await hashed_tree.search_many_async(queries, k=3)
+    assert calls == [queries]
+    hashed_tree.memory_index = False
+    hashed_tree._unindex_rows()
+    scanned = await hashed_tree.search_many_async(queries, k=3)
+
+    # Hash embeddings tie often, so compare ranked scores rather than ids.
+    for got in (warm, scanned):
+        for hits, expected in zip(got, single):
+            assert [h["score"] for h in hits] == pytest.approx(
+                [h["score"] for h in expected], abs=1e-5
+            )
+    assert warm[2][0]["page_content"] == "topic2 note 7"
+    filtered = await hashed_tree.search_many_async(queries, k=3, tags_all=["even"])
+    assert all(h["tags"] == ["even"] for hits in filtered for h in hits)
+    assert [len(hits) for hits in filtered] == [3, 3, 3]
+
+
+@pytest.mark.asyncio
+async def test_search_many_keeps_asymmetric_query_embedding(hashed_tree, monkeypatch):
+    await hashed_tree.add_entries_batch_async(["alpha note", "beta note"])
+    executor = hashed_tree._executor
+    monkeypatch.setattr(executor, "symmetric", False)
+    queried: list[str] = []
+    embed_query = executor.embed.embed_query
+    monkeypatch.setattr(
+        executor.embed,
+        "embed_query",
+        lambda text: queried.append(text) or embed_query(text),
+    )
+    hashed_tree.embedding_cache = None
+
+    # "alpha note" has a stored document vector, which must not stand in
+    # for its query vector.
+    hits = await hashed_tree.search_many_async(["alpha note", "beta"], k=1)
+    assert queried == ["alpha note", "beta"]
+    assert [h[0]["page_content"] for h in hits] == ["alpha note", "beta note"]
+    await hashed_tree.search_async("alpha note", k=1)
+    assert queried[-1] == "alpha note"
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_table_skips_reembedding(hashed_tree, monkeypatch):
+    texts = [f"cached doc {i} about cache{i % 3}" for i in range(10)]
+    await hashed_tree.add_entries_batch_async(texts)
+
+    calls: list[list[str]] = []
+    embed_documents = HashEmbeddings.embed_documents
+    monkeypatch.setattr(
+        HashEmbeddings,
+        "embed_documents",
+        lambda self, batch: calls.append(list(batch)) or embed_documents(self, batch),
+    )
+    other = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_embedding_cache_reingest",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=hash_embedding_provider,
+    )
+    other.embedding_cache = None
+    await other.clear_all_points_async()
+    await other.add_entries_batch_async(texts + ["cached doc new"])
+    await other.add_entry_async(texts[0])
+    hits = await other.search_async(texts[4], k=1)
+
+    assert calls == [["cached doc new"]]
+    assert hits[0]["page_content"] == texts[4]
+    stored = other.conn.execute(
+        "SELECT count(*) FROM embedding_cache WHERE model_id = 'HashEmbeddings' "
+        "AND content_hash = sha256('cached doc new')"
+    ).fetchone()
+    assert stored == (1,)
+    await other.clear_all_points_async()
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_table_is_capped_and_pruned(tmp_path):
+    class SmallHashEmbeddings(HashEmbeddings):
+        dim = 32
+        model_name = "small-hash"
+
+    async def small_provider():
+        return SmallHashEmbeddings(), SmallHashEmbeddings.dim
+
+    tree = await KnowledgeTree.create(
+        db_path=str(tmp_path / "cache.duckdb"),
+        collection_name="test_embedding_cache_pruning",
+        embedding_provider=hash_embedding_provider,
+    )
+    tree.embedding_cache_max_rows = 10
+
+    def cached(model_id="HashEmbeddings"):
+        return tree.conn.execute(
+            "SELECT count(*) FROM embedding_cache WHERE model_id = ?", [model_id]
+        ).fetchone()[0]
+
+    await tree.add_entries_batch_async([f"pruned doc {i}" for i in range(12)])
+    assert cached() == 9
+    await tree.add_entry_async("pruned doc 12")
+    assert cached() == 10
+
+    tree.max_rows = 4
+    result = await tree.enforce_retention_async()
+    assert result == {"evicted": 9, "remaining": 4}
+    orphans = tree.conn.execute(
+        "SELECT count(*) FROM embedding_cache WHERE content_hash NOT IN "
+        "(SELECT sha256(text) FROM test_embedding_cache_pruning)"
+    ).fetchone()[0]
+    assert orphans == 0
+    assert 0 < cached() <= 4
+
+    tree.max_rows = 0
+    await tree.reembed_async(small_provider)
+    assert cached() == 0
+    tree.close()
+
+
+@pytest.mark.asyncio
+async def test_parquet_snapshot_round_trip_swaps_atomically(hashed_tree, tmp_path):
+    first, second = await hashed_tree.add_entries_batch_async(
+        ["snapshot alpha", "snapshot beta"], tags_list=[["a"], []]
+    )
+    await hashed_tree.add_relation_async(first, second, "next")
+    path = str(tmp_path / "tree.parquet")
+
+    exported = await hashed_tree.export_collection_async(path)
+    assert (exported["rows"], exported["relations"]) == (2, 1)
+
+    await hashed_tree.add_entry_async("added after export")
+    imported = await hashed_tree.import_collection_async(path)
+    assert (imported["rows"], imported["relations"]) == (2, 1)
+    hits = await hashed_tree.search_async("snapshot alpha", k=5)
+    assert [h["page_content"] for h in hits][:1] == ["snapshot alpha"]
+    assert {h["page_content"] for h in hits} == {"snapshot alpha", "snapshot beta"}
+    assert hits[0]["tags"] == ["a"]
+    assert hits[0]["relations"] == [{"id": second, "type": "next"}]
+
+    hashed_tree.embed_dim = 32
+    with pytest.raises(VectorStoreError, match="dim"):
+        await hashed_tree.import_collection_async(path)
+    hashed_tree.embed_dim = HashEmbeddings.dim
+    with hashed_tree._db.write() as conn:
+        conn.execute(
+            "UPDATE vector_collection_models SET model_id = 'other-model' "
+            "WHERE collection = 'test_hashed_collection'"
+        )
+    with pytest.raises(storage.EmbeddingMismatchError, match="other-model"):
+        await hashed_tree.import_collection_async(path)
+    with hashed_tree._db.write() as conn:
+        conn.execute(
+            "UPDATE vector_collection_models SET model_id = ? "
+            "WHERE collection = 'test_hashed_collection'",
+            [hashed_tree.model_id],
+        )
+    assert len(await hashed_tree.search_async("snapshot", k=5)) == 2
+
+
+@pytest.mark.asyncio
+async def test_mmr_search_skips_near_duplicates(hashed_tree):
+    await hashed_tree.add_entries_batch_async(
+        ["deploy failed on staging"] * 3
+        + ["deploy failed on staging again", "rollback after deploy failed"]
+        + [f"unrelated note {i}" for i in range(5)]
+    )
+
+    plain = await hashed_tree.search_async("deploy failed", k=3)
+    diverse = await hashed_tree.search_async("deploy failed", k=3, mmr=True)
+
+    assert [h["page_content"] for h in plain] == ["deploy failed on staging"] * 3
+    texts = [h["page_content"] for h in diverse]
+    assert texts[0] == "deploy failed on staging"
+    assert len(set(texts)) == 3
+    assert "rollback after deploy failed" in texts
+
+
+@pytest.mark.asyncio
+async def test_search_with_neighbors_expands_hits_along_edges(hashed_tree):
+    runbook, step, substep, note = await hashed_tree.add_entries_batch_async(
+        ["deploy runbook", "drain the node", "cordon first", "owner is ops"],
+        tags_list=[[], ["step"], [], []],
+    )
+    await hashed_tree.add_relation_async(runbook, step, "next")
+    await hashed_tree.add_relation_async(step, substep, "next")
+    await hashed_tree.add_relation_async(substep, runbook, "next")
+    await hashed_tree.add_relation_async(runbook, note, "owner")
+
+    hits = await hashed_tree.search_with_neighbors_async("deploy runbook", k=1)
+    assert [h["id"] for h in hits] == [runbook]
+    neighbors = sorted(hits[0]["neighbors"], key=lambda n: n["type"])
+    assert neighbors == [
+        {
+            "id": step,
+            "page_content": "drain the node",
+            "tags": ["step"],
+            "type": "next",
+            "depth": 1,
+        },
+        {
+            "id": note,
+            "page_content": "owner is ops",
+            "tags": [],
+            "type": "owner",
+            "depth": 1,
+        },
+    ]
+
+    hits = await hashed_tree.search_with_neighbors_async(
+        "deploy runbook", k=1, rel_types=["next"], hops=3
+    )
+    assert [(n["id"], n["depth"]) for n in hits[0]["neighbors"]] == [
+        (step, 1),
+        (substep, 2),
+    ]
+    hits = await hashed_tree.search_with_neighbors_async("deploy runbook", k=1, hops=0)
+    assert hits[0]["neighbors"] == []
+
+
+@pytest.mark.asyncio
+async def test_shared_layout_keeps_agents_apart_in_one_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "VECTOR_LAYOUT", "shared")
+    db_path = str(tmp_path / "shared.duckdb")
+    alice, bob, alice_experience = [
+        await cls.create(
+            db_path=db_path,
+            collection_name=name,
+            embedding_provider=hash_embedding_provider,
+        )
+        for cls, name in [
+            (KnowledgeTree, "knowledge_alice"),
+            (KnowledgeTree, "knowledge_bob"),
+            (ExperienceTree, "experience_alice"),
+        ]
+    ]
+    first, second = await alice.add_entries_batch_async(
+        ["deploy runbook", "rollback runbook"]
+    )
+    await alice.add_relation_async(first, second, "next")
+    theirs = await bob.add_entry_async("deploy runbook")
+    await bob.add_relation_async(theirs, first, "copied_from")
+    await alice_experience.add_entry_async("deploy went fine")
+
+    tables = {
+        row[0]
+        for row in alice.conn.execute(
+            "SELECT table_name FROM information_schema.tables"
+        ).fetchall()
+    }
+    assert tables == {
+        "agent_vectors",
+        "agent_vectors_edges",
+        "embedding_cache",
+        "vector_collection_models",
+    }
+    assert alice.conn.execute(
+        "SELECT agent, kind, count(*) FROM agent_vectors GROUP BY ALL ORDER BY ALL"
+    ).fetchall() == [
+        ("alice", "experience", 1),
+        ("alice", "knowledge", 2),
+        ("bob", "knowledge", 1),
+    ]
+
+    hits = await alice.search_async("deploy runbook", k=5)
+    assert [h["id"] for h in hits] == [first, second]
+    assert hits[0]["relations"] == [{"id": second, "type": "next"}]
+    assert await alice.get_entry_async(theirs) is None
+
+    await alice.delete_entry_async(theirs)
+    assert await bob.get_relations_async(theirs) == [
+        {"id": first, "type": "copied_from"}
+    ]
+    await alice.clear_all_points_async()
+    assert await alice.search_async("deploy runbook", k=5) == []
+    assert not alice.collection_exists() and alice_experience.collection_exists()
+    assert [h["id"] for h in await bob.search_async("deploy runbook", k=5)] == [theirs]
+    assert await bob.get_relations_async(theirs) == [
+        {"id": first, "type": "copied_from"}
+    ]
+    for store in (alice, bob, alice_experience):
+        store.close()
+
+
+@pytest.mark.asyncio
+async def test_migration_moves_tables_into_clustered_shared_layout(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(storage, "VECTOR_LAYOUT", "table")
+    db_path = str(tmp_path / "layout.duckdb")
+    stores = {
+        name: await cls.create(
+            db_path=db_path,
+            collection_name=name,
+            embedding_provider=hash_embedding_provider,
+        )
+        for cls, name in [
+            (KnowledgeTree, "knowledge_zed"),
+            (ExperienceTree, "experience_amy"),
+            (KnowledgeTree, "knowledge_amy"),
+        ]
+    }
+    first, second = await stores["knowledge_amy"].add_entries_batch_async(
+        ["amy knows deploys", "amy knows rollbacks"]
+    )
+    await stores["knowledge_amy"].add_relation_async(first, second, "next")
+    await stores["knowledge_zed"].add_entry_async("zed knows deploys")
+    await stores["experience_amy"].add_entry_async("amy deployed twice")
+    for store in stores.values():
+        store.close()
+
+    result = await storage.migrate_to_shared_layout_async(db_path)
+    assert result == {"collections": 3, "rows": 4, "relations": 1}
+
+    monkeypatch.setattr(storage, "VECTOR_LAYOUT", "shared")
+    amy = await KnowledgeTree.create(
+        db_path=db_path,
+        collection_name="knowledge_amy",
+        embedding_provider=hash_embedding_provider,
+    )
+    tables = {
+        row[0]
+        for row in amy.conn.execute(
+            "SELECT table_name FROM information_schema.tables"
+        ).fetchall()
+    }
+    assert tables == {
+        "agent_vectors",
+        "agent_vectors_edges",
+        "embedding_cache",
+        "vector_collection_models",
+    }
+    hits = await amy.search_async("amy knows deploys", k=5)
+    assert [h["id"] for h in hits] == [first, second]
+    assert hits[0]["relations"] == [{"id": second, "type": "next"}]
+
+    def partitions() -> list[tuple[str, str]]:
+        return amy.conn.execute(
+            "SELECT agent, kind FROM agent_vectors ORDER BY rowid"
+        ).fetchall()
+
+    await amy.add_entry_async("amy knows more")
+    assert partitions()[-1] == ("amy", "knowledge")
+    assert await storage.cluster_shared_layout_async(db_path) == 5
+    assert partitions() == [("amy", "experience")] + [("amy", "knowledge")] * 3 + [
+        ("zed", "knowledge")
+    ]
+    amy.close()
+
+
+@pytest.mark.asyncio
+async def test_migration_leaves_reembed_shadow_tables_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "VECTOR_LAYOUT", "table")
+    db_path = str(tmp_path / "shadow.duckdb")
+    tree = await KnowledgeTree.create(
+        db_path=db_path,
+        collection_name="knowledge_amy",
+        embedding_provider=hash_embedding_provider,
+    )
+    await tree.add_entry_async("amy knows deploys")
+    # A paused re-embedding to a model of another dimension.
+    with tree._db.write() as conn:
+        storage.VectorStoreBase._create_table(conn, "knowledge_amy__reembed", 8)
+    tree.close()
+
+    result = await storage.migrate_to_shared_layout_async(db_path)
+    assert result == {"collections": 1, "rows": 1, "relations": 0}
+
+    monkeypatch.setattr(storage, "VECTOR_LAYOUT", "shared")
+    amy = await KnowledgeTree.create(
+        db_path=db_path,
+        collection_name="knowledge_amy",
+        embedding_provider=hash_embedding_provider,
+    )
+    assert amy.conn.execute(
+        "SELECT DISTINCT agent, kind FROM agent_vectors"
+    ).fetchall() == [("amy", "knowledge")]
+    assert amy.conn.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?",
+        ["knowledge_amy__reembed"],
+    ).fetchone() == (1,)
+    amy.close()
+
+
+@pytest.mark.asyncio
+async def test_reembed_resumes_then_swaps_to_new_model(hashed_tree):
+    class SmallHashEmbeddings(HashEmbeddings):
+        dim = 32
+        model_name = "small-hash"
+
+    async def small_provider():
+        return SmallHashEmbeddings(), SmallHashEmbeddings.dim
+
+    ids = await hashed_tree.add_entries_batch_async(
+        [f"reembed doc {i}" for i in range(5)], tags_list=[["t"]] * 5
+    )
+    await hashed_tree.add_relation_async(ids[0], ids[1], "next")
+    reports = []
+
+    paused = await hashed_tree.reembed_async(
+        small_provider, batch_size=2, max_batches=1, on_progress=reports.append
+    )
+    assert (paused["status"], paused["done"], paused["total"]) == ("paused", 2, 5)
+    assert hashed_tree.embed_dim == HashEmbeddings.dim
+    assert len(await hashed_tree.search_async("reembed doc", k=10)) == 5
+    late = await hashed_tree.add_entry_async("added while paused")
+    agent_tree = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_hashed_collection",
+        embedding_provider=hash_embedding_provider,
+    )
+
+    done = await hashed_tree.reembed_async(
+        small_provider, batch_size=2, on_progress=reports.append
+    )
+    assert (done["status"], done["done"], done["total"]) == ("completed", 6, 6)
+    assert done["model_id"] == "small-hash"
+    assert [r["done"] for r in reports] == sorted(r["done"] for r in reports)
+    assert reports[-1] == done
+    assert storage.get_reembed_progress("test_hashed_collection", ":memory:") == done
+    assert hashed_tree.embed_dim == SmallHashEmbeddings.dim
+    assert hashed_tree.conn.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name LIKE '%__reembed'"
+    ).fetchone() == (0,)
+
+    hits = await hashed_tree.search_async("added while paused", k=1)
+    assert hits[0]["id"] == late
+    hits = await hashed_tree.search_async("reembed doc 0", k=1)
+    assert hits[0]["tags"] == ["t"]
+    assert hits[0]["relations"] == [{"id": ids[1], "type": "next"}]
+
+    # Stores already open switch over; stores opened later must use the new model.
+    assert (agent_tree.model_id, agent_tree.embed_dim) == ("small-hash", 32)
+    hits = await agent_tree.search_async("added while paused", k=1)
+    assert hits[0]["id"] == late
+    agent_tree.close()
+    with pytest.raises(storage.EmbeddingMismatchError, match="small-hash"):
+        await KnowledgeTree.create(
+            db_path=":memory:",
+            collection_name="test_hashed_collection",
+            embedding_provider=hash_embedding_provider,
+        )
+    reopened = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_hashed_collection",
+        embedding_provider=small_provider,
+    )
+    assert len(await reopened.search_async("reembed doc", k=10)) == 6
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_binary_quantized_search_reranks_exactly(monkeypatch):
+    monkeypatch.setattr(storage, "MEMORY_INDEX_ENABLED", False)
+    plain = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_quantized_collection",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=hash_embedding_provider,
+    )
+    await plain.clear_all_points_async()
+    await plain.add_entries_batch_async(
+        [f"note {i} on subject{i % 4}" for i in range(12)]
+    )
+
+    monkeypatch.setattr(storage, "VECTOR_QUANTIZATION", "binary")
+    tree = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_quantized_collection",
+        embedding_provider=hash_embedding_provider,
+    )
+    await tree.add_entry_async("note 99 on subject2")
+    missing = tree.conn.execute(
+        "SELECT count(*) FROM test_quantized_collection WHERE embedding_bits IS NULL"
+    ).fetchone()
+    assert missing[0] == 0
+
+    vector = HashEmbeddings().embed_query("subject2")
+    quantized = tree._search_rows(vector, 3)
+    exact = plain._search_rows(vector, 3)
+    assert [r[0] for r in quantized] == [r[0] for r in exact]
+    assert quantized[0][4] == pytest.approx(exact[0][4], abs=1e-5)
+    await tree.clear_all_points_async()
+
+
+@pytest.mark.asyncio
+async def test_search_filters_by_tags_before_ranking(hashed_tree):
+    await hashed_tree.add_entries_batch_async(
+        ["invoice for acme", "invoice for globex", "invoice for acme rush", "memo"],
+        [
+            ["customer:acme", "billing"],
+            ["customer:globex", "billing"],
+            ["customer:acme"],
+            [],
+        ],
+    )
+
+    scoped = await hashed_tree.search_async("invoice", k=5, tags_any=["customer:acme"])
+    assert sorted(h["page_content"] for h in scoped) == [
+        "invoice for acme",
+        "invoice for acme rush",
+    ]
+    both = await hashed_tree.search_async(
+        "invoice", k=5, tags_all=["customer:acme", "billing"]
+    )
+    assert [h["page_content"] for h in both] == ["invoice for acme"]
+    assert both[0]["tags"] == ["customer:acme", "billing"]
+    either = await hashed_tree.search_async(
+        "invoice", k=5, tags_any=["customer:globex", "missing"], tags_all=["billing"]
+    )
+    assert [h["page_content"] for h in either] == ["invoice for globex"]
+
+
+@pytest.mark.asyncio
+async def test_legacy_json_tags_and_relations_are_migrated():
+    conn = get_duckdb_pool().acquire(":memory:").cursor()
+    conn.execute("DROP TABLE IF EXISTS test_legacy_tags")
+    conn.execute(
+        "CREATE TABLE test_legacy_tags (id VARCHAR PRIMARY KEY, text VARCHAR, "
+        "tags JSON, relations JSON, embedding FLOAT[64])"
+    )
+    vector = storage._vector_param(HashEmbeddings().embed_query("legacy row"))
+    conn.execute(
+        "INSERT INTO test_legacy_tags VALUES "
+        "('a', 'legacy row', '[\"old\", \"kept\"]', "
+        '\'[{"id": "b", "type": "see_also"}]\', ?::FLOAT[64]), '
+        "('b', 'untagged row', NULL, '[]', ?::FLOAT[64])",
+        [vector, vector],
+    )
+
+    tree = await KnowledgeTree.create(
+        db_path=":memory:",
+        collection_name="test_legacy_tags",
+        embedding_provider=hash_embedding_provider,
+    )
+    assert await tree.get_tags_async("a") == ["old", "kept"]
+    assert await tree.get_tags_async("b") == []
+    hits = await tree.search_async("legacy row", k=2, tags_any=["kept"])
+    assert [h["id"] for h in hits] == ["a"]
+    assert hits[0]["relations"] == [{"id": "b", "type": "see_also"}]
+    assert await tree.get_incoming_relations_async("b") == [
+        {"id": "a", "type": "see_also"}
+    ]
+    conn.execute("DROP TABLE test_legacy_tags")
+    conn.execute("DROP TABLE test_legacy_tags_edges")
+
+
+@pytest.mark.asyncio
+async def test_traverse_walks_edge_table_with_depth(hashed_tree):
+    a, b, c, d = [await hashed_tree.add_entry_async(f"node {name}") for name in "abcd"]
+    await hashed_tree.add_relation_async(a, b, "child")
+    await hashed_tree.add_relation_async(b, c, "child")
+    await hashed_tree.add_relation_async(c, a, "child")
+    await hashed_tree.add_relation_async(a, d, "see_also")
+    assert await hashed_tree.add_relation_async("missing", a) is False
+
+    nodes = await hashed_tree.traverse_async(a, depth=3)
+    assert {n["id"]: n["depth"] for n in nodes} == {a: 0, b: 1, d: 1, c: 2}
+    assert nodes[0]["relations"] == [
+        {"id": b, "type": "child"},
+        {"id": d, "type": "see_also"},
+    ]
+
+    children = await hashed_tree.traverse_async(a, depth=1, rel_types=["child"])
+    assert [n["id"] for n in children] == [a, b]
+    assert await hashed_tree.get_incoming_relations_async(a) == [
+        {"id": c, "type": "child"}
+    ]
+
+    assert await hashed_tree.remove_relation_async(a, d)
+    assert await hashed_tree.get_relations_async(a) == [{"id": b, "type": "child"}]
+    await hashed_tree.delete_entry_async(c)
+    assert await hashed_tree.get_incoming_relations_async(a) == []
+
+
+@pytest.mark.asyncio
+async def test_tag_and_relation_writes_are_atomic_and_bulk(hashed_tree):
+    a, b, c = await hashed_tree.add_entries_batch_async(
+        ["tag a", "tag b", "tag c"], tags_list=[["x"], [], []]
+    )
+    assert await hashed_tree.add_tag_async(a, "y")
+    assert await hashed_tree.add_tag_async(a, "x")
+    assert await hashed_tree.add_tag_async("missing", "x") is False
+    assert await hashed_tree.get_tags_async(a) == ["x", "y"]
+
+    pairs = [(b, f"t{i % 3}") for i in range(3000)]
+    pairs += [(a, "z"), (a, "x"), ("missing", "q")]
+    assert await hashed_tree.add_tags_bulk_async(pairs) == 2
+    assert await hashed_tree.get_tags_async(b) == ["t0", "t1", "t2"]
+    assert await hashed_tree.get_tags_async(a) == ["x", "y", "z"]
+
+    assert await hashed_tree.add_relation_async(a, b, "next")
+    assert await hashed_tree.add_relation_async(a, c)
+    assert await hashed_tree.add_relation_async(a, b, "next")
+    relations = [(b, c, "next"), (b, c, "next"), (c, a), ("missing", a), (a, b, "next")]
+    assert await hashed_tree.add_relations_bulk_async(relations) == 2
+    assert await hashed_tree.get_relations_async(a) == [
+        {"id": b, "type": "next"},
+        {"id": c, "type": "related"},
+    ]
+    assert await hashed_tree.get_relations_async(c) == [{"id": a, "type": "related"}]
+    assert await hashed_tree.remove_relation_async(b, c)
+    assert not await hashed_tree.remove_relation_async(b, c)
+    assert await hashed_tree.get_relations_async(b) == []
+
+
+@pytest.mark.asyncio
+async def test_search_collections_merges_labelled_hits(hashed_tree):
+    experience = await ExperienceTree.create(
+        db_path=":memory:",
+        collection_name="test_hashed_experience",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=hash_embedding_provider,
+    )
+    await experience.clear_all_points_async()
+    cache = EmbeddingCache()
+    hashed_tree.embedding_cache = experience.embedding_cache = cache
+    await hashed_tree.add_entries_batch_async(["deploy the service", "unrelated fact"])
+    await experience.add_entries_batch_async(["deploy the service failed once"])
+
+    hits = await search_collections_async(
+        [hashed_tree, experience], "deploy the service", k=2
+    )
+
+    assert cache.stats()["misses"] == 1
+    assert [(h["collection"], h["page_content"]) for h in hits[:2]] == [
+        ("test_hashed_collection", "deploy the service"),
+        ("test_hashed_experience", "deploy the service failed once"),
+    ]
+    assert len(hits) == 3
+    assert [h["score"] for h in hits] == sorted(
+        (h["score"] for h in hits), reverse=True
+    )
+    await experience.clear_all_points_async()
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_bm25_with_vectors(hashed_tree, monkeypatch):
+    await hashed_tree.add_entries_batch_async(
+        [
+            "deployment failed with error E1234 on node seven",
+            "deployment failed with a timeout on the gateway",
+            "the gateway timeout was fixed by raising limits",
+        ]
+    )
+
+    hits = await hashed_tree.search_async("E1234", k=2, hybrid=True)
+    assert hits[0]["page_content"].startswith("deployment failed with error E1234")
+    assert hits[0]["score"] == pytest.approx(2 / 61)
+
+    monkeypatch.setattr(storage, "FTS_REBUILD_DELAY_SECONDS", 0.5)
+    await hashed_tree.add_entry_async("runbook for E5678 restarts")
+    key = (hashed_tree._db_key, hashed_tree._table)
+    hits = await hashed_tree.search_async("E5678", k=1, hybrid=True)
+    # The stale index keeps serving: only the vector ranking has the new row.
+    assert hits[0]["page_content"] == "runbook for E5678 restarts"
+    assert hits[0]["score"] == pytest.approx(1 / 61)
+    rebuild = storage._FTS_REBUILDS[key]
+    await hashed_tree.search_async("E5678", k=1, hybrid=True)
+    assert storage._FTS_REBUILDS[key] is rebuild
+    await asyncio.to_thread(rebuild.join, 5)
+    assert key not in storage._STALE_FTS_INDEXES
+    hits = await hashed_tree.search_async("E5678", k=1, hybrid=True)
+    assert hits[0]["score"] == pytest.approx(2 / 61)
+
+    scoped = await hashed_tree.search_async(
+        "E1234", k=3, hybrid=True, tags_any=["missing"]
+    )
+    assert scoped == []
+
+
+@pytest.mark.asyncio
+async def test_experience_compaction_merges_near_duplicates():
+    tree = await ExperienceTree.create(
+        db_path=":memory:",
+        collection_name="test_compacted_experience",
+        recreate_on_dim_mismatch=True,
+        embedding_provider=hash_embedding_provider,
+    )
+    await tree.clear_all_points_async()
+    first = await tree.add_entry_async("deploy failed on node", ["a"])
+    duplicate = await tree.add_entry_async("deploy failed on node", ["b", "a"])
+    other = await tree.add_entry_async("unrelated note about lunch")
+    await tree.add_relation_async(other, duplicate, "caused_by")
+    await tree.add_relation_async(duplicate, other, "see_also")
+
+    result = await tree.compact_async(batch_size=2)
+
+    assert result == {"scanned": 3, "merged": 1, "remaining": 0, "batches": 2}
+    assert await tree.get_entry_async(duplicate) is None
+    assert await tree.get_tags_async(first) == ["a", "b"]
+    assert await tree.get_relations_async(first) == [{"id": other, "type": "see_also"}]
+    assert await tree.get_incoming_relations_async(first) == [
+        {"id": other, "type": "caused_by"}
+    ]
+
+    again = await tree.add_entry_async("deploy failed on node", ["c"])
+    result = await tree.compact_async()
+    assert result["scanned"] == 1 and result["merged"] == 1
+    assert await tree.get_entry_async(again) is None
+    assert await tree.get_tags_async(first) == ["a", "b", "c"]
+    await tree.clear_all_points_async()
+
+
+@pytest.mark.asyncio
+async def test_retention_evicts_expired_then_least_recently_hit(hashed_tree):
+    ids = [await hashed_tree.add_entry_async(f"entry number {i}") for i in range(5)]
+    table = hashed_tree.collection_name
+    for i, point_id in enumerate(ids):
+        hashed_tree.conn.execute(
+            f"UPDATE {table} SET created_at = TIMESTAMP '2026-01-01' + to_minutes(?) "
+            f"WHERE id = ?",
+            [i, point_id],
+        )
+    hashed_tree.conn.execute(
+        f"UPDATE {table} SET created_at = TIMESTAMP '2000-01-01' WHERE id = ?", [ids[4]]
+    )
+    await hashed_tree.add_relation_async(ids[1], ids[0])
+    await hashed_tree.search_async("entry number 0", k=1)
+
+    hashed_tree.max_age_seconds = 3600 * 24 * 365 * 20
+    hashed_tree.max_rows = 2
+    hashed_tree.eviction_batch_size = 1
+    result = await hashed_tree.enforce_retention_async()
+
+    assert result == {"evicted": 3, "remaining": 2}
+    kept = {
+        row[0] for row in hashed_tree.conn.execute(f"SELECT id FROM {table}").fetchall()
+    }
+    assert kept == {ids[0], ids[3]}
+    assert await hashed_tree.get_incoming_relations_async(ids[0]) == []
+
+    hashed_tree.max_age_seconds = 0
+    hashed_tree.max_rows = 0
+    hashed_tree.eviction_policy = "oldest"
+    hashed_tree.max_bytes = 4 * HashEmbeddings.dim + 20
+    result = await hashed_tree.enforce_retention_async()
+    assert result == {"evicted": 1, "remaining": 1}
+    assert await hashed_tree.get_entry_async(ids[3]) is not None
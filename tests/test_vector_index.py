@@ -0,0 +1,78 @@
+"""
+Tests for the in-memory top-k vector index.
+"""
+
+import numpy as np
+import pytest
+
+from mao import vector_index
+from mao.vector_index import (
+    MemoryVectorIndex,
+    VectorIndexCache,
+    memory_index_bytes,
+    mmr_select,
+)
+
+
+def test_search_matches_brute_force_cosine():
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    index = MemoryVectorIndex(16, capacity=8)
+    index.upsert([f"id{i}" for i in range(200)], vectors)
+    query = rng.normal(size=16)
+
+    hits = index.search(list(query), 5)
+
+    expected = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ (
+        query / np.linalg.norm(query)
+    )
+    top = np.argsort(-expected)[:5]
+    assert [row_id for row_id, _ in hits] == [f"id{i}" for i in top]
+    assert [score for _, score in hits] == pytest.approx(
+        expected[top].tolist(), abs=1e-5
+    )
+
+
+def test_upsert_and_remove_keep_rows_consistent():
+    index = MemoryVectorIndex(2)
+    index.upsert(["a", "b", "c"], [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+    index.remove(["a", "missing"])
+    index.upsert(["b"], [[1.0, 0.0]])
+
+    assert len(index) == 2
+    assert [row_id for row_id, _ in index.search([1.0, 0.0], 5)] == ["b", "c"]
+    index.clear()
+    assert index.search([1.0, 0.0], 5) == []
+
+
+def test_index_cache_evicts_least_recently_used_over_budget(monkeypatch):
+    index_bytes = MemoryVectorIndex(4, capacity=10).nbytes
+    monkeypatch.setattr(vector_index, "MEMORY_INDEX_BUDGET_BYTES", 2 * index_bytes)
+    first, second = VectorIndexCache(), VectorIndexCache()
+
+    first["a"] = MemoryVectorIndex(4, capacity=10)
+    second["b"] = MemoryVectorIndex(4, capacity=10)
+    assert first["a"] is not None
+    second["c"] = MemoryVectorIndex(4, capacity=10)
+    assert "a" in first and "b" not in second and "c" in second
+    assert memory_index_bytes() == 2 * index_bytes
+
+    # Growing an index re-charges it and evicts across caches.
+    first["a"].upsert([f"id{i}" for i in range(15)], np.ones((15, 4)))
+    first.charge("a")
+    assert "c" not in second and "a" in first
+    assert memory_index_bytes() == first["a"].nbytes
+
+    first["big"] = MemoryVectorIndex(4, capacity=100)
+    assert first["big"] is None
+    first.clear()
+    second.clear()
+    assert memory_index_bytes() == 0
+
+def test_mmr_select_prefers_diverse_candidates():
+    candidates = [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+
+    assert mmr_select([1.0, 0.0], candidates, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select([1.0, 0.0], candidates, 2, lambda_mult=0.3) == [0, 2]
+    assert mmr_select([1.0, 0.0], candidates, 5, lambda_mult=0.3) == [0, 2, 1]
+    assert mmr_select([1.0, 0.0], [], 3) == []